@@ -1,5 +1,7 @@
+import os
 from airflow import DAG
 from airflow.operators.bash import BashOperator
+from airflow.utils.trigger_rule import TriggerRule
 from datetime import datetime
 
 default_args = {
@@ -8,6 +10,24 @@ default_args = {
     'retries': 1,
 }
 
+SCRIPTS = '/opt/airflow/scripts'
+ENV = '--env /opt/airflow/.env'
+# check_new_data.py exits with this code when there is nothing to process
+NO_NEW_DATA = 99
+# PIPELINE_PROFILE=cpu|mem profiles every stage; reports land next to the task logs
+PROFILE = os.getenv('PIPELINE_PROFILE', '')
+PROFILE_ARGS = f' --profile {PROFILE} --profile-dir /opt/airflow/logs/profiles' if PROFILE else ''
+
+
+def check_task(check, **kwargs):
+    return BashOperator(
+        task_id=f'check_{check}',
+        bash_command=f'python {SCRIPTS}/check_new_data.py --check {check} {ENV}',
+        skip_on_exit_code=NO_NEW_DATA,
+        **kwargs
+    )
+
+
 with DAG(
     dag_id='product_analytics_pipeline',
     default_args=default_args,
@@ -17,22 +37,54 @@ with DAG(
 
     simulate_data = BashOperator(
         task_id='simulate_data',
-        bash_command='python /opt/airflow/scripts/simulate_events.py'
+        bash_command=f'python {SCRIPTS}/simulate_events.py{PROFILE_ARGS}'
     )
 
     ingest_data = BashOperator(
         task_id='ingest_to_snowflake',
-        bash_command='python /opt/airflow/scripts/ingestion_to_snowflake.py /opt/airflow/.env'
+        bash_command=f'python {SCRIPTS}/ingestion_to_snowflake.py /opt/airflow/.env{PROFILE_ARGS}'
+    )
+
+    # Dimension keys are assigned by this one task, so the parallel Silver tasks below only look them up
+    register_dimensions = BashOperator(
+        task_id='bronze_to_silver_dimensions',
+        bash_command=f'python {SCRIPTS}/bronze_to_silver/bronze_to_silver.py --step dimensions {ENV}{PROFILE_ARGS}'
+    )
+
+    # Bronze -> Silver, one task per source so events and sessions run in parallel
+    check_bronze_events = check_task('bronze_events')
+    check_bronze_sessions = check_task('bronze_sessions')
+
+    silver_events = BashOperator(
+        task_id='bronze_to_silver_events',
+        bash_command=f'python {SCRIPTS}/bronze_to_silver/bronze_to_silver.py --step events {ENV}{PROFILE_ARGS}'
     )
 
-    bronze_to_silver = BashOperator(
-        task_id='bronze_to_silver',
-        bash_command='python /opt/airflow/scripts/bronze_to_silver/bronze_to_silver.py --env /opt/airflow/.env'
+    silver_sessions = BashOperator(
+        task_id='bronze_to_silver_sessions',
+        bash_command=f'python {SCRIPTS}/bronze_to_silver/bronze_to_silver.py --step sessions {ENV}{PROFILE_ARGS}'
     )
 
-    silver_to_gold = BashOperator(
-        task_id='silver_to_gold',
-        bash_command='python /opt/airflow/scripts/gold_aggregation/gold_aggregation.py --env /opt/airflow/.env'
+    # Silver checks compare Silver against Gold directly, so they still run when the Bronze step
+    # was skipped (e.g. Gold is catching up after a failed run)
+    check_silver_events = check_task('silver_events', trigger_rule=TriggerRule.NONE_FAILED)
+    check_silver_sessions = check_task('silver_sessions', trigger_rule=TriggerRule.NONE_FAILED)
+
+    gold_tasks = {
+        step: BashOperator(
+            task_id=f'silver_to_gold_{step}',
+            bash_command=f'python {SCRIPTS}/gold_aggregation/gold_aggregation.py --step {step} {ENV}{PROFILE_ARGS}'
+        )
+        for step in ['users', 'sessions', 'products']
+    }
+
+    detect_anomalies = BashOperator(
+        task_id='detect_anomalies',
+        bash_command=f'python {SCRIPTS}/anomaly_detection/anomaly_detection.py {ENV}{PROFILE_ARGS}',
+        trigger_rule=TriggerRule.NONE_FAILED_MIN_ONE_SUCCESS
     )
 
-    simulate_data >> ingest_data >> bronze_to_silver >> silver_to_gold
\ No newline at end of file
+    simulate_data >> ingest_data >> register_dimensions >> [check_bronze_events, check_bronze_sessions]
+    check_bronze_events >> silver_events >> check_silver_events >> [gold_tasks['users'], gold_tasks['products']]
+    check_bronze_sessions >> silver_sessions >> check_silver_sessions >> gold_tasks['sessions']
+    [gold_tasks['users'], gold_tasks['products']] >> detect_anomalies
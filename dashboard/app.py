@@ -1,5 +1,6 @@
 import streamlit as st
-from utils.config import BRANDING
+from utils.config import BRANDING, DEFAULT_START_DATE, DEFAULT_END_DATE, PREFETCH_ENABLED
+from utils.queries import prefetch_page_data
 
 st.set_page_config(
     page_title= "Product Analytics Dashboard",
@@ -7,6 +8,15 @@ st.set_page_config(
     layout= "wide"
 )
 
+@st.cache_resource
+def start_prefetch() -> bool:
+    # Runs once per server process: every page's default date range starts loading in the background
+    prefetch_page_data(DEFAULT_START_DATE, DEFAULT_END_DATE)
+    return True
+
+if PREFETCH_ENABLED:
+    start_prefetch()
+
 st.markdown(
     f"<h1 style= 'color: {BRANDING['primary_colour']}'> 📊 Product Analytics Dashboard </h1>",
     unsafe_allow_html= True
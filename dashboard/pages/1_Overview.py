@@ -1,5 +1,5 @@
 import streamlit as st
-from utils.queries import get_kpis
+from utils.queries import get_kpis, get_data_service
 from utils.formatting import summarize_metrics
 from utils.config import DEFAULT_START_DATE, DEFAULT_END_DATE
 
@@ -21,7 +21,7 @@ else:
 
 
 
-df_kpis = get_kpis(start_date, end_date)
+df_kpis = get_data_service().get(get_kpis, start_date, end_date)
 
 
 if not df_kpis.empty:
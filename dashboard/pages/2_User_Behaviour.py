@@ -1,8 +1,8 @@
+import math
 import streamlit as st
-from utils.queries import get_user_behavior
-import plotly.express as px
-from utils.config import DEFAULT_START_DATE, DEFAULT_END_DATE
-import pandas as pd
+from utils.queries import get_user_behavior_histograms, get_user_behavior_count, get_user_behavior_page
+from utils.queries import iter_user_behavior_csv, get_data_service
+from utils.config import DEFAULT_START_DATE, DEFAULT_END_DATE, USER_PAGE_SIZE, EXPORT_MAX_ROWS
 
 st.title("📊 User Behavior")
 
@@ -28,28 +28,35 @@ if isinstance(dates, (list, tuple)):
 else:
     start_date = end_date = dates
 
-df = get_user_behavior(start_date, end_date)
+hist = get_data_service().get(get_user_behavior_histograms, start_date, end_date)
 
-if df.empty:
+if hist.empty:
     st.warning("No user data available for selected range.")
 else:
     st.subheader("User Events and Conversion")
 
-    # 🛠️ Fix column types
-    df["TOTAL_EVENTS"] = pd.to_numeric(df["TOTAL_EVENTS"], errors="coerce")
-    df["CONVERSION_RATE"] = pd.to_numeric(df["CONVERSION_RATE"], errors="coerce")
-    
-    
-
-    # 📊 Plot histograms
-    fig1 = px.histogram(df["TOTAL_EVENTS"],nbins=20, title="Distribution of Users by Their Total Number of Events")
-    fig2 = px.histogram(df["CONVERSION_RATE"], nbins=20, title="User Conversion Rate Distribution")
-    fig1.update_layout(xaxis_title="Total Events", yaxis_title="Number of Users")
-    fig2.update_layout(xaxis_title="Conversion Rate", yaxis_title="Number of Users")
+    # 📊 Plot pre-binned histograms
+    import plotly.express as px
+    events_hist = hist[hist["METRIC"] == "TOTAL_EVENTS"]
+    rate_hist = hist[hist["METRIC"] == "CONVERSION_RATE"]
+    fig1 = px.bar(events_hist, x="BIN_START", y="NUM_USERS", title="Distribution of Users by Their Total Number of Events")
+    fig2 = px.bar(rate_hist, x="BIN_START", y="NUM_USERS", title="User Conversion Rate Distribution")
+    fig1.update_layout(xaxis_title="Total Events", yaxis_title="Number of Users", bargap=0)
+    fig2.update_layout(xaxis_title="Conversion Rate", yaxis_title="Number of Users", bargap=0)
     st.plotly_chart(fig1, use_container_width=True)
     st.plotly_chart(fig2, use_container_width=True)
-    # 🧾 Show table and download
+
+    # 🧾 Show one page of the table
+    num_users = get_data_service().get(get_user_behavior_count, start_date, end_date)
+    num_pages = max(1, math.ceil(num_users / USER_PAGE_SIZE))
+    page = st.number_input(f"Page (of {num_pages:,})", min_value=1, max_value=num_pages, value=1, step=1)
+    df = get_data_service().get(get_user_behavior_page, start_date, end_date, page - 1)
+    st.caption(f"Showing {len(df):,} of {num_users:,} users, most active first.")
     st.dataframe(df)
 
-    csv = df.to_csv(index=False).encode("utf-8")
-    st.download_button("📥 Download CSV", csv, "user_behavior.csv", "text/csv")
+    # 📥 The download button holds the file in memory, so the export is capped at EXPORT_MAX_ROWS users
+    if num_users > EXPORT_MAX_ROWS:
+        st.caption(f"The CSV export holds the {EXPORT_MAX_ROWS:,} most active of {num_users:,} users.")
+    if st.button("📄 Prepare CSV download"):
+        csv_data = b"".join(iter_user_behavior_csv(start_date, end_date, EXPORT_MAX_ROWS))
+        st.download_button("📥 Download CSV", csv_data, "user_behavior.csv", "text/csv")
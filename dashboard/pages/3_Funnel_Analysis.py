@@ -1,6 +1,5 @@
 import streamlit as st
-from utils.queries import get_funnel_metrics
-import plotly.graph_objects as go
+from utils.queries import get_funnel_metrics, get_data_service
 from utils.config import DEFAULT_START_DATE, DEFAULT_END_DATE
 
 st.title("🛍 Funnel Analysis")
@@ -19,9 +18,10 @@ else:
     start_date = end_date = dates
 
 
-funnel = get_funnel_metrics(start_date, end_date)
+funnel = get_data_service().get(get_funnel_metrics, start_date, end_date)
 
 st.subheader("Conversion Funnel")
+import plotly.graph_objects as go
 fig = go.Figure(go.Funnel(
     y=["Product Views", "Add to Cart", "Purchases"],
     x=[funnel["VIEWS"], funnel["ADD_TO_CART"], funnel["PURCHASES"]]
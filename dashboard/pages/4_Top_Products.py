@@ -1,6 +1,5 @@
 import streamlit as st
-from utils.queries import get_top_products
-import plotly.express as px
+from utils.queries import get_top_products, get_data_service
 from utils.config import DEFAULT_START_DATE, DEFAULT_END_DATE
 
 st.title("🏆 Top Products")
@@ -19,11 +18,12 @@ if isinstance(dates, (list, tuple)):
 else:
     start_date = end_date = dates
 
-df = get_top_products(start_date, end_date)
+df = get_data_service().get(get_top_products, start_date, end_date)
 
 if df.empty:
     st.warning("No product data for selected range.")
 else:
+    import plotly.express as px
     fig = px.bar(df, x="PRODUCT_ID", y="NUM_PURCHASES", title="Top Products by Purchases", color="NUM_PURCHASES")
     st.plotly_chart(fig)
 
@@ -11,6 +11,7 @@ This dashboard uses aggregated gold-level metrics optimized for product analytic
 ### 🔄 Pipeline Stages
 - 🧪 Raw event & session data ingested from CSV and JSON files
 - ⬇️ Transformation & aggregation into gold tables (product_metrics, user_metrics, session_metrics)
+- 🚨 EWMA anomaly detection over hourly product event counts (anomalies) and sliding-window bot scoring per user (user_anomaly_scores)
 - 🐳 Dockerized deployment & infrastructure managed with Terraform
 - 📊 Interactive Streamlit dashboard with multi-page navigation
 
@@ -0,0 +1,50 @@
+import streamlit as st
+from utils.queries import get_anomalies, get_data_service
+from utils.config import DEFAULT_START_DATE, DEFAULT_END_DATE, BRANDING
+
+st.title("🚨 Anomalies")
+
+st.markdown("""
+Unusual spikes or drops in hourly product views, add-to-cart and purchase counts.
+
+- Each point is an hour where a product's count moved more than the z-score threshold away from its EWMA baseline.
+- Spikes sit above zero, drops below.
+""")
+
+dates = st.date_input("Select Date Range", [DEFAULT_START_DATE, DEFAULT_END_DATE])
+
+# Normalize to a tuple of two dates
+if isinstance(dates, (list, tuple)):
+    if len(dates) == 2:
+        start_date, end_date = dates
+    elif len(dates) == 1:
+        start_date = end_date = dates[0]
+    else:
+        st.warning("Please select at least one date.")
+        st.stop()
+else:
+    start_date = end_date = dates
+
+df = get_data_service().get(get_anomalies, start_date, end_date)
+
+if df.empty:
+    st.success("No anomalies detected for selected range.")
+else:
+    col1, col2, col3 = st.columns(3)
+    col1.metric("🚨 Anomalies", f"{len(df):,}")
+    col2.metric("📈 Spikes", f"{(df['DIRECTION'] == 'spike').sum():,}")
+    col3.metric("📉 Drops", f"{(df['DIRECTION'] == 'drop').sum():,}")
+
+    import plotly.express as px
+    fig = px.scatter(
+        df, x="BUCKET_START", y="Z_SCORE", color="EVENT_TYPE", hover_data=["PRODUCT_ID", "OBSERVED", "EXPECTED"],
+        title="Anomalies by Hour",
+        color_discrete_sequence=[BRANDING["primary_colour"], BRANDING["secondary_colour"], "#F0A202"]
+    )
+    fig.update_layout(xaxis_title="Hour", yaxis_title="Z-Score")
+    st.plotly_chart(fig, use_container_width=True)
+
+    st.dataframe(df)
+
+    csv = df.to_csv(index=False).encode("utf-8")
+    st.download_button("📥 Download CSV", csv, "anomalies.csv", "text/csv")
@@ -0,0 +1,55 @@
+import streamlit as st
+from utils.telemetry import get_telemetry
+from utils.config import BRANDING
+
+st.title("⏱️ Dashboard Performance")
+
+st.markdown("""
+Latency and cache behaviour of every dashboard query in this server process.
+
+- A **cache hit** is a call answered without a warehouse round trip (Streamlit cache or local Gold cache).
+- Rows and bytes count what was fetched from the warehouse; hits fetch nothing.
+""")
+
+window_minutes = st.slider("Rolling window (minutes)", min_value=5, max_value=24 * 60, value=60, step=5)
+df = get_telemetry().frame(window_seconds=window_minutes * 60)
+
+if df.empty:
+    st.info("No queries recorded in this window yet. Open some dashboard pages first.")
+    st.stop()
+
+p50, p90, p99 = df["wall_ms"].quantile([0.5, 0.9, 0.99])
+col1, col2, col3, col4, col5 = st.columns(5)
+col1.metric("🔢 Queries", f"{len(df):,}")
+col2.metric("p50", f"{p50:,.0f} ms")
+col3.metric("p90", f"{p90:,.0f} ms")
+col4.metric("p99", f"{p99:,.0f} ms")
+col5.metric("🎯 Cache Hit Ratio", f"{df['cache_hit'].mean():.0%}")
+
+st.subheader("Latency by Query")
+by_query = (
+    df.groupby("name")
+    .agg(
+        calls=("wall_ms", "size"),
+        p50_ms=("wall_ms", lambda s: s.quantile(0.5)),
+        p90_ms=("wall_ms", lambda s: s.quantile(0.9)),
+        p99_ms=("wall_ms", lambda s: s.quantile(0.99)),
+        hit_ratio=("cache_hit", "mean"),
+        rows=("rows", "sum"),
+        bytes=("bytes", "sum"),
+    )
+    .sort_values("p90_ms", ascending=False)
+)
+st.dataframe(by_query)
+
+import plotly.express as px
+fig = px.scatter(
+    df, x="started_at", y="wall_ms", color="cache_hit", hover_data=["name", "rows", "query_ids"],
+    title="Query Latency Over Time",
+    color_discrete_map={True: BRANDING["secondary_colour"], False: BRANDING["primary_colour"]}
+)
+fig.update_layout(xaxis_title="Time", yaxis_title="Wall Time (ms)")
+st.plotly_chart(fig, use_container_width=True)
+
+st.subheader("🐢 Slowest Queries")
+st.dataframe(df.nlargest(10, "wall_ms")[["started_at", "name", "wall_ms", "rows", "bytes", "cache_hit", "query_ids", "error"]])
@@ -0,0 +1,87 @@
+import sys
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from utils.data_service import DataService
+
+
+def test_get_runs_on_the_callers_thread():
+    service = DataService(max_workers=1)
+    assert service.get(lambda: threading.current_thread()) is threading.current_thread()
+
+
+def test_reads_are_not_bounded_by_the_warm_up_pool():
+    # Eight readers must all be inside their query at once, with a single warm-up worker
+    service = DataService(max_workers=1)
+    barrier = threading.Barrier(8, timeout=5)
+
+    def query(reader):
+        barrier.wait()
+        return reader
+
+    with ThreadPoolExecutor(8) as viewers:
+        assert sorted(viewers.map(lambda reader: service.get(query, reader), range(8))) == list(range(8))
+
+
+def test_concurrent_reads_of_one_key_share_a_query():
+    service = DataService()
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def query(day):
+        calls.append(day)
+        started.set()
+        release.wait(5)
+        return day * 2
+
+    with ThreadPoolExecutor(4) as viewers:
+        first = viewers.submit(service.get, query, 21)
+        started.wait(5)
+        others = [viewers.submit(service.get, query, 21) for _ in range(3)]
+        release.set()
+        assert [f.result() for f in [first, *others]] == [42] * 4
+    assert calls == [21]
+
+
+def test_failure_reaches_every_joined_reader_and_is_not_cached():
+    service = DataService()
+    started, release = threading.Event(), threading.Event()
+
+    def query():
+        started.set()
+        release.wait(5)
+        raise RuntimeError("warehouse down")
+
+    with ThreadPoolExecutor(2) as viewers:
+        first = viewers.submit(service.get, query)
+        started.wait(5)
+        joined = viewers.submit(service.get, query)
+        release.set()
+        for future in [first, joined]:
+            with pytest.raises(RuntimeError):
+                future.result()
+    assert service.get(lambda: "recovered") == "recovered"
+
+
+def test_reads_join_the_warm_up():
+    service = DataService(max_workers=1)
+    release = threading.Event()
+    calls = []
+
+    def query():
+        calls.append(1)
+        release.wait(5)
+        return "warm"
+
+    [future] = service.warm([(query, ())])
+    reader = threading.Thread(target=lambda: calls.append(service.get(query)))
+    reader.start()
+    # Give the reader time to find the warm-up in flight before it finishes
+    time.sleep(0.2)
+    release.set()
+    reader.join(5)
+    assert future.result() == "warm" and calls == [1, "warm"]
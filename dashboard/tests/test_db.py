@@ -0,0 +1,101 @@
+import sys
+import sqlite3
+from collections import namedtuple
+from pathlib import Path
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from utils import db
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE user_metrics (user_key INTEGER, user_id TEXT, conversion_rate REAL, ingested_at TEXT)")
+    conn.executemany("INSERT INTO user_metrics VALUES (?, ?, ?, ?)", [
+        (1, "user_1", 0.5, "2024-01-01 10:00:00"),
+        (2, "user_2", 0.0, "2024-01-02 10:00:00"),
+        (3, "user_3", 0.25, "2024-01-03 10:00:00"),
+    ])
+    yield conn
+    conn.close()
+
+
+def test_qmark_params_are_bound(conn):
+    df = db.fetch_dataframe(
+        conn, "SELECT user_key, user_id FROM user_metrics WHERE ingested_at >= ? AND ingested_at < ? ORDER BY user_key",
+        ("2024-01-02", "2024-01-04"),
+    )
+    assert df["user_key"].tolist() == [2, 3]
+    # A bound value is compared as a value, never spliced into the SQL
+    df = db.fetch_dataframe(conn, "SELECT user_key FROM user_metrics WHERE user_id = ?", ("user_1' OR '1'='1",))
+    assert df.empty
+
+
+def test_row_fallback_dtypes(conn):
+    df = db.fetch_dataframe(conn, "SELECT user_key, user_id, conversion_rate FROM user_metrics ORDER BY user_key")
+    assert list(df.columns) == ["user_key", "user_id", "conversion_rate"]
+    assert df["user_key"].dtype == "int64"
+    assert df["conversion_rate"].dtype == "float64"
+    assert df["user_id"].dtype == object
+
+
+def test_empty_result_keeps_columns(conn):
+    df = db.fetch_dataframe(conn, "SELECT user_key, user_id FROM user_metrics WHERE user_key > ?", (10,))
+    assert df.empty and list(df.columns) == ["user_key", "user_id"]
+
+
+def test_batches_cover_every_row(conn, monkeypatch):
+    monkeypatch.setattr(db, "ROW_BATCH_SIZE", 2)
+    batches = list(db.fetch_batches(conn, "SELECT user_key FROM user_metrics ORDER BY user_key"))
+    assert [len(batch) for batch in batches] == [2, 1]
+    assert pd.concat(batches)["user_key"].tolist() == [1, 2, 3]
+
+
+Column = namedtuple("Column", "name")
+
+
+class ArrowCursor:
+    """The parts of a Snowflake cursor fetch_dataframe uses."""
+
+    def __init__(self, table):
+        self.table = table
+        self.executed = None
+        self.sfqid = "01-query"
+        self.description = [Column(name) for name in (table.schema.names if table is not None else ["USER_KEY"])]
+
+    def execute(self, query, params):
+        self.executed = (query, params)
+
+    def fetch_arrow_all(self):
+        return self.table
+
+    def close(self):
+        pass
+
+
+class ArrowConnection:
+    def __init__(self, table):
+        self.cur = ArrowCursor(table)
+
+    def cursor(self):
+        return self.cur
+
+
+def test_arrow_dtypes_and_params():
+    table = pa.table({
+        "USER_KEY": pa.array([1, 2], pa.int64()),
+        "INGESTED_AT": pa.array(pd.to_datetime(["2024-01-01", "2024-01-02"]), pa.timestamp("ns")),
+    })
+    conn = ArrowConnection(table)
+    df = db.fetch_dataframe(conn, "SELECT USER_KEY, INGESTED_AT FROM user_metrics WHERE INGESTED_AT >= ?", ("2024-01-01",))
+    assert conn.cur.executed[1] == ("2024-01-01",)
+    assert df["USER_KEY"].dtype == "int64"
+    assert pd.api.types.is_datetime64_any_dtype(df["INGESTED_AT"])
+
+
+def test_arrow_empty_result_keeps_columns():
+    df = db.fetch_dataframe(ArrowConnection(None), "SELECT USER_KEY FROM user_metrics")
+    assert df.empty and list(df.columns) == ["USER_KEY"]
@@ -0,0 +1,77 @@
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+import pandas as pd
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from utils import local_cache
+from utils.local_cache import GoldTableCache
+
+T0 = pd.Timestamp("2025-01-31 12:00:00")
+
+
+class Warehouse:
+    """GOLD.PRODUCT_METRICS as the rows committed so far, answering the cache's two queries."""
+
+    def __init__(self):
+        self.rows = pd.DataFrame(columns=["PRODUCT_KEY", "NUM_VIEWS", "UPDATED_AT"])
+        self.deltas = []
+
+    def commit(self, *rows):
+        new = pd.DataFrame(rows, columns=self.rows.columns)
+        kept = self.rows[~self.rows["PRODUCT_KEY"].isin(new["PRODUCT_KEY"])]
+        self.rows = pd.concat([kept, new], ignore_index=True) if not kept.empty else new
+
+    def fetch(self, query, params):
+        if query.startswith("SELECT MAX"):
+            return pd.DataFrame({"UPDATED_AT": [self.rows["UPDATED_AT"].max()]})
+        delta = self.rows if not params else self.rows[self.rows["UPDATED_AT"] > pd.Timestamp(params[0])]
+        self.deltas.append(sorted(delta["PRODUCT_KEY"]))
+        return delta.copy()
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(local_cache, "time", SimpleNamespace(monotonic=lambda: now[0]))
+    return now
+
+
+def cached(cache):
+    return cache.table("product_metrics").sort_values("PRODUCT_KEY").reset_index(drop=True)
+
+
+def test_a_late_commit_below_the_cached_maximum_is_picked_up(tmp_path, clock):
+    warehouse = Warehouse()
+    cache = GoldTableCache(tmp_path, warehouse.fetch, refresh_seconds=0, refresh_lag_seconds=60)
+    warehouse.commit((1, 10, T0), (2, 20, T0 + pd.Timedelta(seconds=30)))
+    assert cached(cache)["NUM_VIEWS"].tolist() == [10, 20]
+
+    # A MERGE that started before product 2's commits after it
+    warehouse.commit((3, 30, T0 + pd.Timedelta(seconds=10)))
+    clock[0] = 20
+    assert cached(cache)["NUM_VIEWS"].tolist() == [10, 20, 30]
+    # The re-read covers UPDATED_AT > max - lag, so products 2 and 3 came back and are not duplicated
+    assert warehouse.deltas[-1] == [1, 2, 3]
+    assert len(cached(cache)) == 3
+
+
+def test_the_window_is_re_read_until_the_lag_has_passed(tmp_path, clock):
+    warehouse = Warehouse()
+    cache = GoldTableCache(tmp_path, warehouse.fetch, refresh_seconds=0, refresh_lag_seconds=60)
+    warehouse.commit((1, 10, T0))
+    cached(cache)
+    clock[0] = 30
+    cached(cache)
+    clock[0] = 61
+    cached(cache)
+    assert len(warehouse.deltas) == 3
+    # Settled: only the metadata probe runs until the maximum moves again
+    clock[0] = 200
+    cached(cache)
+    assert len(warehouse.deltas) == 3
+
+    warehouse.commit((1, 11, T0 + pd.Timedelta(minutes=10)))
+    assert cached(cache)["NUM_VIEWS"].tolist() == [11]
+    assert len(warehouse.deltas) == 4
@@ -0,0 +1,190 @@
+import sys
+import time
+import sqlite3
+import threading
+from pathlib import Path
+import pandas as pd
+import pytest
+import streamlit as st
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from utils import queries
+from utils.pool import ConnectionPool
+
+
+class Factory:
+    """sqlite3 connections to one database file, counting how many were opened."""
+
+    def __init__(self, path):
+        self.path = path
+        self.opened = []
+
+    def __call__(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.opened.append(conn)
+        return conn
+
+
+@pytest.fixture
+def factory(tmp_path):
+    return Factory(str(tmp_path / "pool.db"))
+
+
+def test_never_opens_more_than_max_size(factory):
+    pool = ConnectionPool(factory, max_size=2, acquire_timeout=5)
+    lock = threading.Lock()
+    active, peak = [0], [0]
+
+    def query(conn):
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        time.sleep(0.05)
+        with lock:
+            active[0] -= 1
+        return conn.execute("SELECT 1").fetchall()
+
+    threads = [threading.Thread(target=pool.run, args=(query,)) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert peak[0] == 2
+    assert len(factory.opened) == 2
+    assert pool.size == 2 and pool.idle == 2
+
+
+def test_acquire_times_out_when_every_connection_is_taken(factory):
+    pool = ConnectionPool(factory, max_size=1, acquire_timeout=0.1)
+    conn = pool.acquire()
+    started = time.monotonic()
+    with pytest.raises(TimeoutError):
+        pool.acquire()
+    assert time.monotonic() - started >= 0.1
+    pool.release(conn)
+    assert pool.acquire() is conn
+
+
+def test_released_connection_unblocks_a_waiter(factory):
+    pool = ConnectionPool(factory, max_size=1, acquire_timeout=5)
+    conn = pool.acquire()
+    threading.Timer(0.05, pool.release, args=(conn,)).start()
+    assert pool.acquire() is conn
+    assert len(factory.opened) == 1
+
+
+def test_idle_connections_are_reaped(factory):
+    pool = ConnectionPool(factory, max_size=2, idle_timeout=0.05)
+    first = pool.acquire()
+    pool.release(first)
+    time.sleep(0.1)
+    second = pool.acquire()
+    assert second is not first
+    assert pool.size == 1
+    # The reaped connection was closed
+    with pytest.raises(sqlite3.ProgrammingError):
+        first.execute("SELECT 1")
+
+
+def test_healthy_idle_connection_is_reused_after_ping(factory):
+    pings = []
+
+    def health_check(conn):
+        pings.append(conn)
+        return True
+    pool = ConnectionPool(factory, ping_after=0, health_check=health_check)
+    conn = pool.acquire()
+    pool.release(conn)
+    assert pool.acquire() is conn
+    assert pings == [conn]
+
+
+def test_failed_ping_reconnects(factory):
+    pool = ConnectionPool(factory, max_size=1, ping_after=0)
+    conn = pool.acquire()
+    pool.release(conn)
+    # The server dropped it while it sat idle
+    conn.close()
+    fresh = pool.acquire()
+    assert fresh is not conn
+    assert fresh.execute("SELECT 1").fetchall() == [(1,)]
+    assert pool.size == 1 and len(factory.opened) == 2
+
+
+def test_run_retries_on_a_fresh_connection_when_the_connection_died(factory):
+    pool = ConnectionPool(factory, max_size=1)
+    calls = []
+
+    def query(conn):
+        calls.append(conn)
+        if len(calls) == 1:
+            conn.close()
+        return conn.execute("SELECT 1").fetchall()
+
+    assert pool.run(query) == [(1,)]
+    assert calls[0] is not calls[1]
+    assert pool.size == 1
+
+
+def test_run_does_not_retry_a_failing_query(factory):
+    pool = ConnectionPool(factory, max_size=1)
+    with pytest.raises(sqlite3.OperationalError):
+        pool.run(lambda conn: conn.execute("SELECT * FROM missing_table").fetchall())
+    assert len(factory.opened) == 1 and pool.idle == 1
+
+
+@pytest.fixture
+def warehouse(tmp_path, monkeypatch):
+    """Gold and Silver as two sqlite files, served to queries.py through a pool like the Snowflake one."""
+    gold, silver = str(tmp_path / "gold.db"), str(tmp_path / "silver.db")
+    with sqlite3.connect(gold) as conn:
+        conn.execute("CREATE TABLE user_metrics (USER_KEY INTEGER, TOTAL_EVENTS INTEGER, NUM_PURCHASES INTEGER, "
+                     "NUM_CLICKS INTEGER, CONVERSION_RATE REAL, INGESTED_AT TEXT)")
+        conn.executemany("INSERT INTO user_metrics VALUES (?, ?, ?, ?, ?, ?)", [
+            (1, 10, 1, 4, 0.25, "2025-01-10 08:00:00"),
+            (2, 30, 0, 9, 0.0, "2025-01-11 08:00:00"),
+            (3, 20, 2, 5, 0.4, "2025-01-20 08:00:00"),
+        ])
+        conn.execute("CREATE TABLE anomalies (PRODUCT_KEY INTEGER, EVENT_TYPE_CODE INTEGER, BUCKET_START TEXT, "
+                     "OBSERVED INTEGER, EXPECTED REAL, Z_SCORE REAL, DIRECTION TEXT)")
+        conn.executemany("INSERT INTO anomalies VALUES (?, ?, ?, ?, ?, ?, ?)", [
+            (7, 4, "2025-01-10 09:00:00", 40, 5.0, 9.1, "spike"),
+            (7, 1, "2025-01-12 09:00:00", 0, 30.0, -6.0, "drop"),
+        ])
+    with sqlite3.connect(silver) as conn:
+        conn.execute("CREATE TABLE DIM_USER (USER_KEY INTEGER, USER_ID TEXT)")
+        conn.executemany("INSERT INTO DIM_USER VALUES (?, ?)", [(1, "user_1"), (2, "user_2"), (3, "user_3")])
+        conn.execute("CREATE TABLE DIM_PRODUCT (PRODUCT_KEY INTEGER, PRODUCT_ID TEXT)")
+        conn.execute("INSERT INTO DIM_PRODUCT VALUES (7, 'PROD_007')")
+        conn.execute("CREATE TABLE DIM_EVENT_TYPE (EVENT_TYPE_CODE INTEGER, EVENT_TYPE TEXT)")
+        conn.executemany("INSERT INTO DIM_EVENT_TYPE VALUES (?, ?)", [(1, "view_product"), (4, "purchase")])
+
+    def connect():
+        conn = sqlite3.connect(gold, check_same_thread=False)
+        conn.execute(f"ATTACH DATABASE '{silver}' AS SILVER")
+        return conn
+    pool = ConnectionPool(connect, max_size=2)
+    monkeypatch.setattr(queries, "LOCAL_CACHE_ENABLED", False)
+    monkeypatch.setattr(queries, "get_pool", lambda: pool)
+    st.cache_data.clear()
+    yield pool
+    st.cache_data.clear()
+    pool.close_all()
+
+
+def test_user_queries_run_on_pooled_connections(warehouse):
+    assert queries._get_user_behavior_count("2025-01-10", "2025-01-11") == 2
+    page = queries._get_user_behavior_page("2025-01-10", "2025-01-31", 0, 2)
+    assert page["USER_ID"].tolist() == ["user_2", "user_3"]
+    assert page["TOTAL_EVENTS"].tolist() == [30, 20]
+    csv = b"".join(queries.iter_user_behavior_csv("2025-01-10", "2025-01-31", max_rows=10)).decode()
+    assert csv.splitlines()[0].startswith("USER_ID,")
+    assert len(csv.splitlines()) == 4
+    assert warehouse.idle == warehouse.size
+
+
+def test_anomalies_are_decoded_for_display(warehouse):
+    df = queries.get_anomalies("2025-01-10", "2025-01-12")
+    assert df["PRODUCT_ID"].tolist() == ["PROD_007", "PROD_007"]
+    assert df["EVENT_TYPE"].tolist() == ["view_product", "purchase"]
+    assert pd.api.types.is_numeric_dtype(df["Z_SCORE"])
@@ -0,0 +1,64 @@
+import sys
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from utils import queries
+from utils.local_cache import GoldTableCache
+
+NUM_USERS = 5_000
+NOW = pd.Timestamp("2025-01-31 12:00:00")
+START, END = "2025-01-10", "2025-01-31"
+
+
+@pytest.fixture
+def user_metrics(tmp_path, monkeypatch):
+    """A cached user_metrics/dim_user pair; the warehouse only answers the freshness probe."""
+    rng = np.random.default_rng(7)
+    metrics = pd.DataFrame({
+        "USER_KEY": np.arange(1, NUM_USERS + 1),
+        "TOTAL_EVENTS": rng.integers(1, 300, NUM_USERS),
+        "NUM_PURCHASES": rng.integers(0, 5, NUM_USERS),
+        "NUM_CLICKS": rng.integers(0, 50, NUM_USERS),
+        "CONVERSION_RATE": rng.random(NUM_USERS),
+        "INGESTED_AT": NOW - pd.to_timedelta(rng.integers(0, 40, NUM_USERS), unit="D"),
+        "UPDATED_AT": NOW,
+    })
+    dim_user = pd.DataFrame({
+        "USER_KEY": metrics["USER_KEY"], "USER_ID": [f"user_{key}" for key in metrics["USER_KEY"]], "INGESTED_AT": NOW,
+    })
+    metrics.to_parquet(tmp_path / "user_metrics.parquet", index=False)
+    dim_user.to_parquet(tmp_path / "dim_user.parquet", index=False)
+
+    def fetch(query, params):
+        column = query.split(" AS ")[1].split(" FROM ")[0]
+        return pd.DataFrame({column: [NOW]})
+    cache = GoldTableCache(tmp_path, fetch, refresh_seconds=0)
+    monkeypatch.setattr(queries, "LOCAL_CACHE_ENABLED", True)
+    monkeypatch.setattr(queries, "get_local_cache", lambda: cache)
+    days = metrics["INGESTED_AT"].dt.normalize()
+    return metrics[(days >= pd.Timestamp(START)) & (days <= pd.Timestamp(END))]
+
+
+def test_count_and_page_match_pandas(user_metrics):
+    assert queries.get_user_behavior_count(START, END) == len(user_metrics)
+    page = queries.get_user_behavior_page(START, END, 3, 50)
+    expected = user_metrics.sort_values(["TOTAL_EVENTS", "USER_KEY"], ascending=[False, True]).iloc[150:200]
+    assert list(page.columns) == queries.USER_BEHAVIOR_COLUMNS
+    assert page["USER_ID"].tolist() == [f"user_{key}" for key in expected["USER_KEY"]]
+
+
+def test_histograms_match_numpy(user_metrics):
+    hist = queries.get_user_behavior_histograms(START, END, 20)
+    for metric in ["TOTAL_EVENTS", "CONVERSION_RATE"]:
+        counts, _ = np.histogram(user_metrics[metric].astype(float), bins=20)
+        assert hist.loc[hist["METRIC"] == metric, "NUM_USERS"].tolist() == counts[counts > 0].tolist()
+
+
+def test_csv_export_is_capped(user_metrics):
+    csv = b"".join(queries.iter_user_behavior_csv(START, END, max_rows=123)).decode()
+    lines = csv.splitlines()
+    assert lines[0] == ",".join(queries.USER_BEHAVIOR_COLUMNS)
+    assert len(lines) == 124
@@ -1,4 +1,6 @@
 import datetime
+import os
+from pathlib import Path
 
 BRANDING =  {
     "primary_colour": "#811844",
@@ -6,4 +8,29 @@ BRANDING =  {
 }
 
 DEFAULT_START_DATE = datetime.date.today() - datetime.timedelta(days=30)
-DEFAULT_END_DATE = datetime.date.today()
\ No newline at end of file
+DEFAULT_END_DATE = datetime.date.today()
+
+# Local Parquet cache of the Gold tables (set DASHBOARD_LOCAL_CACHE=0 to always query the warehouse)
+LOCAL_CACHE_ENABLED = os.getenv("DASHBOARD_LOCAL_CACHE", "1") == "1"
+LOCAL_CACHE_DIR = Path(os.getenv("DASHBOARD_CACHE_DIR", Path(__file__).resolve().parent.parent / ".cache" / "gold"))
+LOCAL_CACHE_REFRESH_SECONDS = int(os.getenv("DASHBOARD_CACHE_REFRESH_SECONDS", "600"))
+# How far behind the cached UPDATED_AT a refresh re-reads, for writes that commit late
+LOCAL_CACHE_REFRESH_LAG_SECONDS = int(os.getenv("DASHBOARD_CACHE_REFRESH_LAG_SECONDS", "300"))
+
+# Concurrent warm-up of every page dataset when the app starts
+PREFETCH_ENABLED = os.getenv("DASHBOARD_PREFETCH", "1") == "1"
+PREFETCH_MAX_WORKERS = int(os.getenv("DASHBOARD_PREFETCH_WORKERS", "4"))
+
+# User Behaviour page: histogram resolution and detail table page size
+HISTOGRAM_BINS = 20
+USER_PAGE_SIZE = 100
+# st.download_button holds the whole file in memory, so the CSV export keeps only the most active users
+EXPORT_MAX_ROWS = int(os.getenv("DASHBOARD_EXPORT_MAX_ROWS", "250000"))
+
+# Connection pool shared by every viewer session
+POOL_MAX_SIZE = int(os.getenv("DASHBOARD_POOL_SIZE", "8"))
+POOL_IDLE_TIMEOUT_SECONDS = int(os.getenv("DASHBOARD_POOL_IDLE_TIMEOUT", "300"))
+
+# Query telemetry ring buffer (set DASHBOARD_TELEMETRY_PATH to also append records to a JSONL file)
+TELEMETRY_CAPACITY = int(os.getenv("DASHBOARD_TELEMETRY_CAPACITY", "2000"))
+TELEMETRY_PATH = os.getenv("DASHBOARD_TELEMETRY_PATH") or None
@@ -0,0 +1,76 @@
+'''Concurrent data loading for the dashboard pages.'''
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Tuple
+
+
+class DataService:
+    """Collapses duplicate in-flight page queries; warm-up runs on a bounded thread pool.
+
+    Two callers asking for the same function and arguments while a query is still running
+    share one Future, so the warehouse sees a single query. Only warm() uses the pool: a page
+    read that finds nothing in flight runs on its own thread, so concurrent viewers are bounded
+    by the connection pool rather than queued behind max_workers threads.
+    """
+
+    def __init__(self, max_workers: int = 4):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="dashboard-data")
+        self._inflight: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(func: Callable, args: Tuple) -> Hashable:
+        return (func.__module__, func.__qualname__, args)
+
+    def submit(self, func: Callable, *args: Any) -> Future:
+        """Run on the pool, or join the in-flight request for the same key."""
+        key = self._key(func, args)
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                return future
+            future = self._executor.submit(func, *args)
+            self._inflight[key] = future
+        future.add_done_callback(lambda _: self._forget(key, future))
+        return future
+
+    def _forget(self, key: Hashable, future: Future) -> None:
+        with self._lock:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+    def get(self, func: Callable, *args: Any) -> Any:
+        """Blocking fetch that joins an in-flight request for the same key, else runs on the caller's thread."""
+        key = self._key(func, args)
+        with self._lock:
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                future.set_running_or_notify_cancel()
+                self._inflight[key] = future
+        if not owner:
+            return future.result()
+        try:
+            result = func(*args)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            self._forget(key, future)
+
+    def warm(self, jobs: Iterable[Tuple[Callable, Tuple]]) -> List[Future]:
+        """Start every job concurrently without waiting; failures are logged, not raised."""
+        futures = [self.submit(func, *args) for func, args in jobs]
+        for future in futures:
+            future.add_done_callback(_log_failure)
+        return futures
+
+
+def _log_failure(future: Future) -> None:
+    if future.exception() is not None:
+        logging.warning(f"Dashboard prefetch failed: {future.exception()}")
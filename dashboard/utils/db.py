@@ -0,0 +1,69 @@
+'''Parameter-bound queries fetched as Arrow and converted to pandas once.
+
+The connection is passed in, so any DB-API connection using the qmark paramstyle works: Snowflake cursors are
+read as Arrow, and cursors without fetch_arrow_all (e.g. sqlite3, as a local stand-in or in tests) fall back to
+fetchmany(), with column dtypes inferred by pandas.
+'''
+from __future__ import annotations
+from contextlib import closing
+import pandas as pd
+from typing import TYPE_CHECKING, Any, Iterator, Sequence
+from utils.telemetry import note_fetch
+
+if TYPE_CHECKING:
+    import snowflake.connector
+
+# Server-side binding: the SQL text stays identical across date ranges, so Snowflake can reuse
+# the compiled statement and values are never spliced into the query.
+PARAMSTYLE = "qmark"
+
+
+#Rows per fetchmany() call for connections without Arrow fetches
+ROW_BATCH_SIZE = 100_000
+
+
+def _columns(cur: Any) -> list:
+    # Snowflake describes columns as ResultMetadata (.name), DB-API drivers as 7-item sequences
+    return [getattr(column, "name", None) or column[0] for column in cur.description or []]
+
+
+def _empty_frame(cur: Any) -> pd.DataFrame:
+    return pd.DataFrame(columns=_columns(cur))
+
+
+def _row_batches(cur: Any) -> Iterator[pd.DataFrame]:
+    columns = _columns(cur)
+    while True:
+        rows = cur.fetchmany(ROW_BATCH_SIZE)
+        if not rows:
+            return
+        batch = pd.DataFrame.from_records(rows, columns=columns)
+        note_fetch(getattr(cur, "sfqid", None), len(batch), int(batch.memory_usage(deep=True).sum()))
+        yield batch
+
+
+def fetch_dataframe(conn: snowflake.connector.SnowflakeConnection, query: str, params: Sequence = ()) -> pd.DataFrame:
+    """Run a bound query and return the whole result, typed from the Arrow schema where the driver has one."""
+    with closing(conn.cursor()) as cur:
+        cur.execute(query, params)
+        if not hasattr(cur, "fetch_arrow_all"):
+            batches = list(_row_batches(cur))
+            return pd.concat(batches, ignore_index=True) if batches else _empty_frame(cur)
+        table = cur.fetch_arrow_all()
+        if table is None:
+            note_fetch(cur.sfqid, 0, 0)
+            return _empty_frame(cur)
+        note_fetch(cur.sfqid, table.num_rows, table.nbytes)
+        return table.to_pandas()
+
+
+def fetch_batches(conn: snowflake.connector.SnowflakeConnection, query: str, params: Sequence = ()) -> Iterator[pd.DataFrame]:
+    """Run a bound query and yield the result one Arrow result chunk (or ROW_BATCH_SIZE rows) at a time."""
+    with closing(conn.cursor()) as cur:
+        cur.execute(query, params)
+        if not hasattr(cur, "fetch_arrow_batches"):
+            yield from _row_batches(cur)
+            return
+        for batch in cur.fetch_arrow_batches():
+            note_fetch(cur.sfqid, batch.num_rows, batch.nbytes)
+            yield batch.to_pandas()
@@ -0,0 +1,207 @@
+'''Persistent local Parquet copies of the Gold tables, refreshed by updated_at deltas.
+
+Small tables are read into pandas with table(). Large ones (user_metrics, dim_user) are never loaded whole:
+query() and stream() run SQL over the Parquet files with DuckDB, which reads only the row groups and columns a
+query needs and returns only its result, and refreshes merge deltas into the files the same way.
+'''
+import os
+import time
+import logging
+import threading
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Dict, Iterator, Optional, Sequence
+import pandas as pd
+
+# DuckDB is imported when a query or refresh first runs, so pages render without paying for it
+if TYPE_CHECKING:
+    import duckdb
+
+# Gold table -> merge key used to upsert refreshed rows
+GOLD_TABLE_KEYS: Dict[str, str] = {
+    "session_metrics": "SESSION_ID",
+    "user_metrics": "USER_KEY",
+    "product_metrics": "PRODUCT_KEY",
+    "dim_user": "USER_KEY",
+    "dim_product": "PRODUCT_KEY",
+}
+# Cached tables that do not live in the GOLD schema: the dimensions used to decode surrogate keys for display
+TABLE_SOURCES: Dict[str, str] = {
+    "dim_user": "SILVER.DIM_USER",
+    "dim_product": "SILVER.DIM_PRODUCT",
+}
+# Column the refresh compares against: Gold rows can be recomputed (backfills) without a newer INGESTED_AT,
+# but every write sets UPDATED_AT. Dimension entries never change, so their INGESTED_AT is enough.
+REFRESH_COLUMNS: Dict[str, str] = {"dim_user": "INGESTED_AT", "dim_product": "INGESTED_AT"}
+DEFAULT_REFRESH_COLUMN = "UPDATED_AT"
+# A write stamps UPDATED_AT when its statement starts and its rows become visible when it commits, so a row can
+# show up with a timestamp below one already cached. Refreshes re-read this far behind the cached maximum.
+DEFAULT_REFRESH_LAG_SECONDS = 300
+
+
+class GoldTableCache:
+    """Keeps each Gold table as a Parquet file and pulls only rows with a newer UPDATED_AT.
+
+    Refreshes first ask the warehouse for MAX(UPDATED_AT), which Snowflake answers from
+    metadata without resuming the warehouse; the delta itself is fetched only when it is newer
+    than what is cached, and is merged into the file by key without loading the file. A cached
+    file without the column is reloaded in full. Rows deleted in the warehouse are not propagated.
+
+    The delta is every row with UPDATED_AT > cached max - refresh_lag_seconds, de-duplicated on the key by the
+    merge, so rows of a write that committed after a later one are not skipped. For refresh_lag_seconds after a
+    pull, refreshes re-read that window even when the maximum has not moved, since such a write can still commit.
+    """
+
+    def __init__(self, cache_dir: Path, fetch: Callable[[str, Sequence], pd.DataFrame], refresh_seconds: int = 600,
+                 refresh_lag_seconds: int = DEFAULT_REFRESH_LAG_SECONDS):
+        self.cache_dir = Path(cache_dir)
+        self.fetch = fetch
+        self.refresh_seconds = refresh_seconds
+        self.refresh_lag_seconds = refresh_lag_seconds
+        self._frames: Dict[str, pd.DataFrame] = {}
+        self._refreshed_at: Dict[str, float] = {}
+        # Table -> monotonic time until which a write older than the cached maximum may still commit
+        self._settle_by: Dict[str, float] = {}
+        self._locks = {name: threading.Lock() for name in GOLD_TABLE_KEYS}
+
+    def path(self, name: str) -> Path:
+        return self.cache_dir / f"{name}.parquet"
+
+    def table(self, name: str) -> pd.DataFrame:
+        """Return the cached table, refreshing it when the last refresh is older than refresh_seconds."""
+        with self._locks[name]:
+            self._maybe_refresh(name)
+            if name not in self._frames:
+                self._frames[name] = self._load(name)
+            return self._frames[name]
+
+    def query(self, sql: str, params: Sequence = (), tables: Sequence[str] = ()) -> pd.DataFrame:
+        """Run DuckDB SQL over the cached files, each of `tables` visible as a view of that name.
+
+        Returns an empty frame while any of them has never been cached."""
+        con = self._connect(tables)
+        if con is None:
+            return pd.DataFrame()
+        try:
+            return con.execute(sql, list(params)).df()
+        finally:
+            con.close()
+
+    def stream(self, sql: str, params: Sequence = (), tables: Sequence[str] = (),
+               batch_rows: int = 100_000) -> Iterator[pd.DataFrame]:
+        """query(), yielded batch_rows rows at a time."""
+        con = self._connect(tables)
+        if con is None:
+            return
+        try:
+            result = con.execute(sql, list(params))
+            # to_arrow_reader() replaces fetch_record_batch() in newer DuckDB releases
+            reader = result.to_arrow_reader(batch_rows) if hasattr(result, "to_arrow_reader") else result.fetch_record_batch(batch_rows)
+            for batch in reader:
+                yield batch.to_pandas()
+        finally:
+            con.close()
+
+    def _connect(self, tables: Sequence[str]) -> Optional["duckdb.DuckDBPyConnection"]:
+        import duckdb
+        for name in tables:
+            with self._locks[name]:
+                self._maybe_refresh(name)
+        if not all(self.path(name).exists() for name in tables):
+            return None
+        con = duckdb.connect()
+        for name in tables:
+            con.execute(f"CREATE VIEW {name} AS SELECT * FROM read_parquet('{self.path(name)}')")
+        return con
+
+    def _maybe_refresh(self, name: str) -> None:
+        if time.monotonic() - self._refreshed_at.get(name, float("-inf")) >= self.refresh_seconds:
+            if self._refresh(name):
+                # Reloaded lazily by the next table() call, if any
+                self._frames.pop(name, None)
+
+    def _load(self, name: str) -> pd.DataFrame:
+        path = self.path(name)
+        if path.exists():
+            return pd.read_parquet(path)
+        return pd.DataFrame()
+
+    def _watermark(self, name: str) -> Optional[pd.Timestamp]:
+        import duckdb
+        import pyarrow.parquet as pq
+        path = self.path(name)
+        column = REFRESH_COLUMNS.get(name, DEFAULT_REFRESH_COLUMN)
+        if not path.exists() or column not in pq.read_schema(path).names:
+            return None
+        with duckdb.connect() as con:
+            latest = con.execute(f"SELECT MAX({column}) FROM read_parquet('{path}')").fetchone()[0]
+        return None if latest is None or pd.isna(latest) else pd.Timestamp(latest)
+
+    def _refresh(self, name: str) -> bool:
+        """Pull rows newer than the cached file's watermark, less the lag; True if the file changed."""
+        watermark = self._watermark(name)
+        source = TABLE_SOURCES.get(name, name)
+        column = REFRESH_COLUMNS.get(name, DEFAULT_REFRESH_COLUMN)
+        latest = self.fetch(f"SELECT MAX({column}) AS {column} FROM {source}", ())[column].iloc[0]
+        now = self._refreshed_at[name] = time.monotonic()
+        if latest is None or pd.isna(latest):
+            return False
+        newer = watermark is None or pd.Timestamp(latest) > watermark
+        if not newer:
+            settle_by = self._settle_by.get(name)
+            if settle_by is None:
+                return False
+            if now >= settle_by:
+                # Every write stamped before the last pull has committed by now; this is the last re-read
+                del self._settle_by[name]
+        else:
+            self._settle_by[name] = now + self.refresh_lag_seconds
+
+        query, params = f"SELECT * FROM {source}", ()
+        if watermark is not None:
+            since = watermark - pd.Timedelta(seconds=self.refresh_lag_seconds)
+            query, params = f"{query} WHERE {column} > ?", (since.to_pydatetime(),)
+        delta = self.fetch(query, params)
+        logging.info(f"Local cache: {len(delta)} new rows for {name}")
+        if delta.empty:
+            return False
+
+        delta = delta.drop_duplicates(GOLD_TABLE_KEYS[name], keep="last").reset_index(drop=True)
+        if watermark is None:
+            self._write(name, delta)
+        else:
+            self._merge(name, delta)
+        return True
+
+    def _merge(self, name: str, delta: pd.DataFrame) -> None:
+        """Replace the file's rows whose key is in delta and append the rest of delta, without loading the file."""
+        import duckdb
+        path = self.path(name)
+        tmp_path = path.with_suffix(".parquet.tmp")
+        key = GOLD_TABLE_KEYS[name]
+        with duckdb.connect() as con:
+            con.register("delta", delta)
+            con.execute(f"""
+                COPY (
+                    SELECT cached.* FROM read_parquet('{path}') AS cached ANTI JOIN delta USING ({key})
+                    UNION ALL BY NAME
+                    SELECT * FROM delta
+                ) TO '{tmp_path}' (FORMAT parquet)
+            """)
+        os.replace(tmp_path, path)
+
+    def _write(self, name: str, frame: pd.DataFrame) -> None:
+        path = self.path(name)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(".parquet.tmp")
+        frame.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+
+
+def between(frame: pd.DataFrame, column: str, start_date, end_date, by_date: bool = False) -> pd.DataFrame:
+    """Local equivalent of `column BETWEEN 'start' AND 'end'` (or, by_date, of whole days start..end)."""
+    if frame.empty:
+        return frame
+    values = pd.to_datetime(frame[column])
+    if by_date:
+        values = values.dt.normalize()
+    return frame[(values >= pd.Timestamp(start_date)) & (values <= pd.Timestamp(end_date))]
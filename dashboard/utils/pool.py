@@ -0,0 +1,154 @@
+'''Bounded, thread-safe pool of DB-API connections shared by all dashboard sessions.'''
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, List, Tuple
+
+
+def ping(conn: Any) -> bool:
+    """Default health check: not closed, and still answers a trivial query."""
+    is_closed = getattr(conn, "is_closed", None)
+    if callable(is_closed) and is_closed():
+        return False
+    try:
+        cur = conn.cursor()
+        try:
+            cur.execute("SELECT 1")
+            cur.fetchall()
+        finally:
+            cur.close()
+        return True
+    except Exception:
+        return False
+
+
+class ConnectionPool:
+    """Hands out at most max_size connections made by `connect`, reusing idle ones.
+
+    Idle connections older than idle_timeout are closed, connections idle for longer than
+    ping_after are health-checked before reuse, and `run` retries once on a fresh connection
+    when a call fails on a connection that turns out to be dead. Any DB-API factory works,
+    e.g. `ConnectionPool(lambda: sqlite3.connect(path, check_same_thread=False))` as a local
+    stand-in for Snowflake.
+    """
+
+    def __init__(self, connect: Callable[[], Any], max_size: int = 8, idle_timeout: float = 300,
+                 ping_after: float = 60, acquire_timeout: float = 30,
+                 health_check: Callable[[Any], bool] = ping):
+        self._connect = connect
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.ping_after = ping_after
+        self.acquire_timeout = acquire_timeout
+        self._health_check = health_check
+        self._idle: List[Tuple[Any, float]] = []
+        self._size = 0
+        self._cond = threading.Condition()
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    @property
+    def idle(self) -> int:
+        return len(self._idle)
+
+    def _close(self, conn: Any) -> None:
+        try:
+            conn.close()
+        except Exception as e:
+            logging.warning(f"Error closing pooled connection: {e}")
+
+    def _reap(self) -> List[Any]:
+        # Caller holds the lock; closing happens outside it
+        cutoff = time.monotonic() - self.idle_timeout
+        expired = [conn for conn, used in self._idle if used < cutoff]
+        if expired:
+            self._idle = [(conn, used) for conn, used in self._idle if used >= cutoff]
+            self._size -= len(expired)
+        return expired
+
+    def acquire(self) -> Any:
+        deadline = time.monotonic() + self.acquire_timeout
+        while True:
+            with self._cond:
+                expired = self._reap()
+                candidate = None
+                create = False
+                while candidate is None and not create:
+                    if self._idle:
+                        candidate = self._idle.pop()
+                    elif self._size < self.max_size:
+                        self._size += 1
+                        create = True
+                    else:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0 or not self._cond.wait(remaining):
+                            raise TimeoutError(f"No pooled connection available within {self.acquire_timeout}s")
+            for conn in expired:
+                self._close(conn)
+
+            if create:
+                try:
+                    return self._connect()
+                except Exception:
+                    self._discard_slot()
+                    raise
+
+            conn, used = candidate
+            if time.monotonic() - used < self.ping_after or self._health_check(conn):
+                return conn
+            logging.info("Pooled connection failed its health check; reconnecting.")
+            self._close(conn)
+            self._discard_slot()
+
+    def _discard_slot(self) -> None:
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+
+    def release(self, conn: Any, broken: bool = False) -> None:
+        if broken:
+            self._close(conn)
+            self._discard_slot()
+            return
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self) -> Iterator[Any]:
+        conn = self.acquire()
+        broken = False
+        try:
+            yield conn
+        except Exception:
+            broken = not self._health_check(conn)
+            raise
+        finally:
+            # Also runs when a streaming consumer abandons the generator early
+            self.release(conn, broken=broken)
+
+    def run(self, func: Callable[[Any], Any], retries: int = 1) -> Any:
+        """Call func(conn) on a pooled connection, reconnecting if the connection died under it."""
+        for attempt in range(retries + 1):
+            conn = self.acquire()
+            try:
+                result = func(conn)
+            except Exception:
+                healthy = self._health_check(conn)
+                self.release(conn, broken=not healthy)
+                if healthy or attempt == retries:
+                    raise
+                logging.warning("Query failed on a dead connection; retrying on a fresh one.")
+                continue
+            self.release(conn)
+            return result
+
+    def close_all(self) -> None:
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+        for conn, _ in idle:
+            self._close(conn)
@@ -1,69 +1,329 @@
-import pandas as pd 
-import snowflake.connector
+from __future__ import annotations
+import pandas as pd
 import streamlit as st
-from typing import Dict
+from typing import TYPE_CHECKING, Dict, Iterator, Sequence, Tuple
+from utils.config import LOCAL_CACHE_ENABLED, LOCAL_CACHE_DIR, LOCAL_CACHE_REFRESH_SECONDS, LOCAL_CACHE_REFRESH_LAG_SECONDS
+from utils.config import PREFETCH_MAX_WORKERS, HISTOGRAM_BINS, USER_PAGE_SIZE, EXPORT_MAX_ROWS, POOL_MAX_SIZE, POOL_IDLE_TIMEOUT_SECONDS
+from utils.local_cache import GoldTableCache, between
+from utils.db import PARAMSTYLE, fetch_dataframe, fetch_batches
+from utils.data_service import DataService
+from utils.pool import ConnectionPool
+from utils.telemetry import instrumented
 
-@st.cache_resource
-def get_connection() -> snowflake.connector.SnowflakeConnection:
+# The connector is only imported when the pool opens its first connection, so pages render
+# (and the local Gold cache answers) without paying for it
+if TYPE_CHECKING:
+    import snowflake.connector
+
+def connect() -> snowflake.connector.SnowflakeConnection:
+    import snowflake.connector
     return snowflake.connector.connect(
         user=st.secrets["snowflake"]["user"],
         password=st.secrets["snowflake"]["password"],
         account=st.secrets["snowflake"]["account"],
         warehouse=st.secrets["snowflake"]["warehouse"],
         database=st.secrets["snowflake"]["database"],
-        schema="GOLD"
+        schema="GOLD",
+        paramstyle=PARAMSTYLE
     )
 
-@st.cache_data(ttl=600)
+@st.cache_resource
+def get_pool() -> ConnectionPool:
+    return ConnectionPool(connect, max_size=POOL_MAX_SIZE, idle_timeout=POOL_IDLE_TIMEOUT_SECONDS)
+
+def run_query(query: str, params: Sequence = ()) -> pd.DataFrame:
+    return get_pool().run(lambda pooled: fetch_dataframe(pooled, query, params))
+
+def stream_query(query: str, params: Sequence = ()) -> Iterator[pd.DataFrame]:
+    with get_pool().connection() as pooled:
+        yield from fetch_batches(pooled, query, params)
+
+@st.cache_resource
+def get_local_cache() -> GoldTableCache:
+    return GoldTableCache(
+        LOCAL_CACHE_DIR,
+        run_query,
+        refresh_seconds=LOCAL_CACHE_REFRESH_SECONDS,
+        refresh_lag_seconds=LOCAL_CACHE_REFRESH_LAG_SECONDS,
+    )
+
+@st.cache_resource
+def get_data_service() -> DataService:
+    return DataService(max_workers=PREFETCH_MAX_WORKERS)
+
+
+# Silver and Gold store integer surrogate keys; these dimensions turn them back into ids for display
+DIM_USER = "SILVER.DIM_USER"
+DIM_PRODUCT = "SILVER.DIM_PRODUCT"
+DIM_EVENT_TYPE = "SILVER.DIM_EVENT_TYPE"
+
+
+def day_range(start_date, end_date) -> Tuple[str, str]:
+    """Bounds for `col >= ? AND col < ?` covering the whole days start..end.
+
+    Same rows as `TO_DATE(col) BETWEEN start AND end`, but compares the bare column, so Snowflake can
+    prune micro-partitions on its min/max.
+    """
+    return str(pd.Timestamp(start_date).date()), str((pd.Timestamp(end_date) + pd.Timedelta(days=1)).date())
+
+
+@instrumented
 def get_kpis(start_date: str, end_date: str) -> pd.DataFrame:
-    conn = get_connection()
-    query = f"""
+    if not LOCAL_CACHE_ENABLED:
+        return _get_kpis_from_warehouse(start_date, end_date)
+    df = between(get_local_cache().table("session_metrics"), "INGESTED_AT", start_date, end_date)
+    return pd.DataFrame({
+        "USERS": [df["USER_KEY"].nunique() if not df.empty else 0],
+        "SESSIONS": [df["SESSION_ID"].nunique() if not df.empty else 0],
+        "AVG_SESSION_DURATION": [df["SESSION_DURATION_MINUTES"].mean() if not df.empty else None],
+    })
+
+@st.cache_data(ttl=600)
+def _get_kpis_from_warehouse(start_date: str, end_date: str) -> pd.DataFrame:
+    query = """
     SELECT
-        COUNT(DISTINCT USER_ID) AS users,
+        COUNT(DISTINCT USER_KEY) AS users,
         COUNT(DISTINCT SESSION_ID) AS sessions,
         AVG(SESSION_DURATION_MINUTES) AS avg_session_duration
     FROM session_metrics
-    WHERE INGESTED_AT BETWEEN '{start_date}' AND '{end_date}'
+    WHERE INGESTED_AT BETWEEN ? AND ?
     """
-    return pd.read_sql(query, conn)
+    return run_query(query, (start_date, end_date))
 
 
-@st.cache_data(ttl=600)
+USER_BEHAVIOR_COLUMNS = ["USER_ID", "TOTAL_EVENTS", "NUM_PURCHASES", "NUM_CLICKS", "CONVERSION_RATE"]
+CSV_CHUNK_ROWS = 100_000
+# The user tables are as large as the user base, so in local mode they are queried in place with DuckDB
+# (see GoldTableCache.query) instead of being loaded; the SQL below is valid in both dialects
+USER_TABLES = ["user_metrics", "dim_user"]
+
+
+def _user_query(query: str, params: Sequence) -> pd.DataFrame:
+    if LOCAL_CACHE_ENABLED:
+        return get_local_cache().query(query.format(dim_user="dim_user"), params, USER_TABLES)
+    return run_query(query.format(dim_user=DIM_USER), params)
+
+
+def _user_ranking_query(limit: str) -> str:
+    """Users in the date range, most active first, decoded after the LIMIT so only the returned rows join."""
+    return f"""
+    WITH ranked AS (
+        SELECT USER_KEY, TOTAL_EVENTS, NUM_PURCHASES, NUM_CLICKS, CONVERSION_RATE
+        FROM user_metrics
+        WHERE INGESTED_AT >= ? AND INGESTED_AT < ?
+        ORDER BY TOTAL_EVENTS DESC, USER_KEY
+        {limit}
+    )
+    SELECT d.USER_ID, r.TOTAL_EVENTS, r.NUM_PURCHASES, r.NUM_CLICKS, r.CONVERSION_RATE
+    FROM ranked r
+    LEFT JOIN {{dim_user}} d ON d.USER_KEY = r.USER_KEY
+    ORDER BY r.TOTAL_EVENTS DESC, r.USER_KEY
+    """
+
+
+def _decode(df: pd.DataFrame, dimension: str, key: str, value: str) -> pd.DataFrame:
+    """Replace the surrogate key column with its display value from the cached dimension table."""
+    dim = get_local_cache().table(dimension)
+    names = dim.set_index(key)[value] if not dim.empty else pd.Series(dtype=object)
+    df = df.copy()
+    df[value] = df.pop(key).map(names)
+    return df
+
+
+@instrumented
 def get_user_behavior(start_date: str, end_date: str) -> pd.DataFrame:
-    conn = get_connection()
-    query = f"""
-    SELECT USER_ID, TOTAL_EVENTS, NUM_PURCHASES, NUM_CLICKS, CONVERSION_RATE
+    if not LOCAL_CACHE_ENABLED:
+        return _get_user_behavior_from_warehouse(start_date, end_date)
+    return _get_user_behavior(start_date, end_date)
+
+def _get_user_behavior(start_date: str, end_date: str) -> pd.DataFrame:
+    return _user_query(_user_ranking_query(""), day_range(start_date, end_date)).reindex(columns=USER_BEHAVIOR_COLUMNS)
+
+_get_user_behavior_from_warehouse = st.cache_data(ttl=600)(_get_user_behavior)
+
+
+def _with_bin_edges(df: pd.DataFrame, bins: int) -> pd.DataFrame:
+    width = (df["HI"] - df["LO"]) / bins
+    df["BIN_START"] = df["LO"] + (df["BIN"] - 1) * width
+    df["BIN_END"] = df["BIN_START"] + width
+    return df[["METRIC", "BIN", "BIN_START", "BIN_END", "NUM_USERS"]]
+
+
+@instrumented
+def get_user_behavior_histograms(start_date: str, end_date: str, bins: int = HISTOGRAM_BINS) -> pd.DataFrame:
+    """Pre-binned user counts (METRIC, BIN, BIN_START, BIN_END, NUM_USERS) for each histogram metric."""
+    if not LOCAL_CACHE_ENABLED:
+        return _get_user_behavior_histograms_from_warehouse(start_date, end_date, bins)
+    return _get_user_behavior_histograms(start_date, end_date, bins)
+
+def _get_user_behavior_histograms(start_date: str, end_date: str, bins: int) -> pd.DataFrame:
+    # Equal-width bins between each metric's min and max, the maximum falling in the last bin (like np.histogram)
+    query = """
+    WITH filtered AS (
+        SELECT TOTAL_EVENTS, CONVERSION_RATE
+        FROM user_metrics
+        WHERE INGESTED_AT >= ? AND INGESTED_AT < ?
+    ),
+    long_values AS (
+        SELECT 'TOTAL_EVENTS' AS METRIC, CAST(TOTAL_EVENTS AS DOUBLE) AS VALUE FROM filtered
+        UNION ALL
+        SELECT 'CONVERSION_RATE' AS METRIC, CAST(CONVERSION_RATE AS DOUBLE) AS VALUE FROM filtered
+    ),
+    bounds AS (
+        SELECT METRIC, MIN(VALUE) AS LO, MAX(VALUE) AS HI
+        FROM long_values
+        GROUP BY METRIC
+    )
+    SELECT
+        v.METRIC,
+        CASE WHEN b.HI > b.LO
+            THEN LEAST(CAST(FLOOR((v.VALUE - b.LO) / (b.HI - b.LO) * ?) AS INTEGER) + 1, ?)
+            ELSE 1 END AS BIN,
+        COUNT(*) AS NUM_USERS,
+        ANY_VALUE(b.LO) AS LO,
+        ANY_VALUE(b.HI) AS HI
+    FROM long_values v
+    JOIN bounds b ON v.METRIC = b.METRIC
+    WHERE v.VALUE IS NOT NULL
+    GROUP BY v.METRIC, BIN
+    ORDER BY v.METRIC, BIN
+    """
+    df = _user_query(query, (*day_range(start_date, end_date), bins, bins))
+    if df.empty:
+        return pd.DataFrame(columns=["METRIC", "BIN", "BIN_START", "BIN_END", "NUM_USERS"])
+    return _with_bin_edges(df, bins)
+
+_get_user_behavior_histograms_from_warehouse = st.cache_data(ttl=600)(_get_user_behavior_histograms)
+
+
+@instrumented
+def get_user_behavior_count(start_date: str, end_date: str) -> int:
+    if not LOCAL_CACHE_ENABLED:
+        return _get_user_behavior_count_from_warehouse(start_date, end_date)
+    return _get_user_behavior_count(start_date, end_date)
+
+def _get_user_behavior_count(start_date: str, end_date: str) -> int:
+    query = """
+    SELECT COUNT(*) AS NUM_USERS
     FROM user_metrics
-    WHERE TO_DATE(INGESTED_AT) BETWEEN '{start_date}' AND '{end_date}';
+    WHERE INGESTED_AT >= ? AND INGESTED_AT < ?
     """
-    return pd.read_sql(query, conn)
+    df = _user_query(query, day_range(start_date, end_date))
+    return int(df["NUM_USERS"].iloc[0]) if not df.empty else 0
 
+_get_user_behavior_count_from_warehouse = st.cache_data(ttl=600)(_get_user_behavior_count)
 
-@st.cache_data(ttl=600)
+
+@instrumented
+def get_user_behavior_page(start_date: str, end_date: str, page: int = 0, page_size: int = USER_PAGE_SIZE) -> pd.DataFrame:
+    """One page of the detail table, most active users first."""
+    if not LOCAL_CACHE_ENABLED:
+        return _get_user_behavior_page_from_warehouse(start_date, end_date, page, page_size)
+    return _get_user_behavior_page(start_date, end_date, page, page_size)
+
+def _get_user_behavior_page(start_date: str, end_date: str, page: int, page_size: int) -> pd.DataFrame:
+    df = _user_query(_user_ranking_query("LIMIT ? OFFSET ?"), (*day_range(start_date, end_date), page_size, page * page_size))
+    return df.reindex(columns=USER_BEHAVIOR_COLUMNS)
+
+_get_user_behavior_page_from_warehouse = st.cache_data(ttl=600)(_get_user_behavior_page)
+
+
+def iter_user_behavior_csv(start_date: str, end_date: str, max_rows: int = EXPORT_MAX_ROWS) -> Iterator[bytes]:
+    """Stream the max_rows most active users as CSV chunks without materializing them as one frame."""
+    query = _user_ranking_query("LIMIT ?")
+    params = (*day_range(start_date, end_date), max_rows)
+    if LOCAL_CACHE_ENABLED:
+        batches = get_local_cache().stream(query.format(dim_user="dim_user"), params, USER_TABLES, CSV_CHUNK_ROWS)
+    else:
+        batches = stream_query(query.format(dim_user=DIM_USER), params)
+    header = True
+    for batch in batches:
+        yield batch.to_csv(index=False, header=header).encode("utf-8")
+        header = False
+
+
+@instrumented
 def get_funnel_metrics(start_date: str, end_date: str) -> Dict[str, int]:
-    conn = get_connection()
-    query = f"""
+    if not LOCAL_CACHE_ENABLED:
+        return _get_funnel_metrics_from_warehouse(start_date, end_date)
+    df = between(get_local_cache().table("product_metrics"), "INGESTED_AT", start_date, end_date)
+    if df.empty:
+        return {"VIEWS": 0, "ADD_TO_CART": 0, "PURCHASES": 0}
+    return {
+        "VIEWS": int(df["NUM_VIEWS"].sum()),
+        "ADD_TO_CART": int(df["NUM_ADD_TO_CART"].sum()),
+        "PURCHASES": int(df["NUM_PURCHASES"].sum()),
+    }
+
+@st.cache_data(ttl=600)
+def _get_funnel_metrics_from_warehouse(start_date: str, end_date: str) -> Dict[str, int]:
+    query = """
     SELECT
         SUM(NUM_VIEWS) AS views,
         SUM(NUM_ADD_TO_CART) AS add_to_cart,
         SUM(NUM_PURCHASES) AS purchases
     FROM product_metrics
-    WHERE INGESTED_AT BETWEEN '{start_date}' AND '{end_date}';
+    WHERE INGESTED_AT BETWEEN ? AND ?;
     """
-    df = pd.read_sql(query, conn)
+    df = run_query(query, (start_date, end_date))
 
     if df.empty:
-        return {"views": 0, "add_to_cart": 0, "purchases": 0}
+        return {"VIEWS": 0, "ADD_TO_CART": 0, "PURCHASES": 0}
     return df.iloc[0].to_dict()
 
-@st.cache_data(ttl=600)
+
+@instrumented
 def get_top_products(start_date: str, end_date: str) -> pd.DataFrame:
-    conn = get_connection()
+    if not LOCAL_CACHE_ENABLED:
+        return _get_top_products_from_warehouse(start_date, end_date)
+    df = between(get_local_cache().table("product_metrics"), "INGESTED_AT", start_date, end_date)
+    if df.empty:
+        return pd.DataFrame(columns=["PRODUCT_ID", "NUM_PURCHASES", "NUM_ADD_TO_CART", "NUM_VIEWS"])
+    df = df.sort_values("NUM_PURCHASES", ascending=False).head(10)
+    df = _decode(df, "dim_product", "PRODUCT_KEY", "PRODUCT_ID")
+    return df.reindex(columns=["PRODUCT_ID", "NUM_PURCHASES", "NUM_ADD_TO_CART", "NUM_VIEWS"]).reset_index(drop=True)
+
+@st.cache_data(ttl=600)
+def _get_top_products_from_warehouse(start_date: str, end_date: str) -> pd.DataFrame:
     query = f"""
-    SELECT PRODUCT_ID, NUM_PURCHASES, NUM_ADD_TO_CART, NUM_VIEWS
-    FROM product_metrics
-    WHERE INGESTED_AT BETWEEN '{start_date}' AND '{end_date}'
-    ORDER BY NUM_PURCHASES DESC
-    LIMIT 10;
+    WITH top AS (
+        SELECT PRODUCT_KEY, NUM_PURCHASES, NUM_ADD_TO_CART, NUM_VIEWS
+        FROM product_metrics
+        WHERE INGESTED_AT BETWEEN ? AND ?
+        ORDER BY NUM_PURCHASES DESC
+        LIMIT 10
+    )
+    SELECT d.PRODUCT_ID, t.NUM_PURCHASES, t.NUM_ADD_TO_CART, t.NUM_VIEWS
+    FROM top t
+    JOIN {DIM_PRODUCT} d ON d.PRODUCT_KEY = t.PRODUCT_KEY
+    ORDER BY t.NUM_PURCHASES DESC;
     """
-    return pd.read_sql(query, conn)
\ No newline at end of file
+    return run_query(query, (start_date, end_date))
+
+
+@instrumented
+@st.cache_data(ttl=600)
+def get_anomalies(start_date: str, end_date: str) -> pd.DataFrame:
+    query = f"""
+    SELECT p.PRODUCT_ID, e.EVENT_TYPE, a.BUCKET_START, a.OBSERVED, a.EXPECTED, a.Z_SCORE, a.DIRECTION
+    FROM anomalies a
+    LEFT JOIN {DIM_PRODUCT} p ON p.PRODUCT_KEY = a.PRODUCT_KEY
+    LEFT JOIN {DIM_EVENT_TYPE} e ON e.EVENT_TYPE_CODE = a.EVENT_TYPE_CODE
+    WHERE a.BUCKET_START >= ? AND a.BUCKET_START < ?
+    ORDER BY a.BUCKET_START DESC, ABS(a.Z_SCORE) DESC;
+    """
+    return run_query(query, day_range(start_date, end_date))
+
+
+
+def prefetch_page_data(start_date, end_date) -> None:
+    """Warm every page's dataset concurrently; pages then join the in-flight or cached result."""
+    get_data_service().warm([
+        (get_kpis, (start_date, end_date)),
+        (get_user_behavior_histograms, (start_date, end_date)),
+        (get_user_behavior_count, (start_date, end_date)),
+        (get_user_behavior_page, (start_date, end_date, 0)),
+        (get_funnel_metrics, (start_date, end_date)),
+        (get_top_products, (start_date, end_date)),
+        (get_anomalies, (start_date, end_date)),
+    ])
@@ -0,0 +1,110 @@
+'''In-process query telemetry for the dashboard: latency, volume and cache behaviour per call.'''
+import json
+import time
+import logging
+import functools
+import threading
+from collections import deque
+from dataclasses import dataclass, asdict, field
+from pathlib import Path
+from typing import Callable, Deque, List, Optional
+import pandas as pd
+
+
+@dataclass
+class QueryRecord:
+    name: str
+    started_at: float
+    wall_ms: float = 0.0
+    rows: int = 0
+    bytes: int = 0
+    cache_hit: bool = True
+    query_ids: List[str] = field(default_factory=list)
+    error: Optional[str] = None
+
+
+class QueryTelemetry:
+    """Bounded ring buffer of QueryRecords, optionally mirrored to a JSONL file."""
+
+    def __init__(self, capacity: int = 2000, persist_path: Optional[Path] = None):
+        self._records: Deque[QueryRecord] = deque(maxlen=capacity)
+        self._lock = threading.Lock()
+        self.persist_path = Path(persist_path) if persist_path else None
+        if self.persist_path and self.persist_path.exists():
+            self._load()
+
+    def _load(self) -> None:
+        with open(self.persist_path, encoding="utf-8") as f:
+            lines = deque(f, maxlen=self._records.maxlen)
+        for line in lines:
+            try:
+                self._records.append(QueryRecord(**json.loads(line)))
+            except (ValueError, TypeError) as e:
+                logging.warning(f"Skipping unreadable telemetry line: {e}")
+
+    def record(self, rec: QueryRecord) -> None:
+        with self._lock:
+            self._records.append(rec)
+            if self.persist_path:
+                self.persist_path.parent.mkdir(parents=True, exist_ok=True)
+                with open(self.persist_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(asdict(rec)) + "\n")
+
+    def frame(self, window_seconds: Optional[float] = None) -> pd.DataFrame:
+        with self._lock:
+            records = list(self._records)
+        if window_seconds is not None:
+            cutoff = time.time() - window_seconds
+            records = [rec for rec in records if rec.started_at >= cutoff]
+        df = pd.DataFrame([asdict(rec) for rec in records], columns=list(QueryRecord.__dataclass_fields__))
+        df["started_at"] = pd.to_datetime(df["started_at"], unit="s")
+        df["query_ids"] = df["query_ids"].map(lambda ids: ", ".join(ids) if isinstance(ids, list) else "")
+        return df
+
+
+_local = threading.local()
+_telemetry: Optional[QueryTelemetry] = None
+_telemetry_lock = threading.Lock()
+
+
+def get_telemetry() -> QueryTelemetry:
+    global _telemetry
+    with _telemetry_lock:
+        if _telemetry is None:
+            from utils.config import TELEMETRY_CAPACITY, TELEMETRY_PATH
+            _telemetry = QueryTelemetry(TELEMETRY_CAPACITY, TELEMETRY_PATH)
+        return _telemetry
+
+
+def note_fetch(query_id: Optional[str], rows: int, nbytes: int) -> None:
+    """Called by the query layer for every warehouse round trip made inside an instrumented call."""
+    rec = getattr(_local, "current", None)
+    if rec is None:
+        return
+    rec.cache_hit = False
+    rec.rows += rows
+    rec.bytes += nbytes
+    if query_id and query_id not in rec.query_ids:
+        rec.query_ids.append(query_id)
+
+
+def instrumented(func: Callable) -> Callable:
+    """Time a dashboard query function; a call that reaches no warehouse fetch counts as a cache hit."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        outer = getattr(_local, "current", None)
+        if outer is not None:
+            return func(*args, **kwargs)
+        rec = QueryRecord(name=func.__name__, started_at=time.time())
+        _local.current = rec
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        except Exception as e:
+            rec.error = str(e)
+            raise
+        finally:
+            rec.wall_ms = (time.perf_counter() - started) * 1000
+            _local.current = None
+            get_telemetry().record(rec)
+    return wrapper
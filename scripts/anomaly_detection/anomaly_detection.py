@@ -0,0 +1,423 @@
+from __future__ import annotations
+import io
+import os
+import sys
+import argparse
+import logging
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import TYPE_CHECKING, List, Optional
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+from user_scoring import UserWindowScorer, SCORE_COLUMNS, DEFAULT_MAX_USERS
+from state_store import StateStore
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import event_time
+import profiling
+import dimensions
+
+#Snowpark is only needed against the warehouse; the detectors themselves (and benchmark_detector.py) run without it
+if TYPE_CHECKING:
+    from snowflake.snowpark import Session
+    from snowflake.snowpark.table import MergeResult
+
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+
+
+
+SILVER = "SILVER"
+GOLD = "GOLD"
+GOLD_STAGE = "GOLD_STAGING"
+
+SILVER_EVENTS = f"{SILVER}.EVENTS_CLEANED"
+ANOMALIES_TABLE = f"{GOLD}.ANOMALIES"
+USER_SCORES_TABLE = f"{GOLD}.USER_ANOMALY_SCORES"
+USER_SCORES_STAGE = f"{GOLD_STAGE}.USER_ANOMALY_SCORES_STAGE"
+ANOMALIES_STAGE = f"{GOLD_STAGE}.ANOMALIES_STAGE"
+ANOMALY_COLUMNS = ["product_key", "event_type_code", "bucket_start", "observed", "expected", "z_score", "direction", "detected_at"]
+
+#Folder Stucture (state stays here only with ANOMALY_STATE=local)
+BASE_DIR = Path(__file__).resolve().parent.parent.parent
+STATE_DIR = BASE_DIR / "data" / "state"
+PRODUCT_STATE_FILE = "product_anomaly_state.npz"
+USER_STATE_FILE = "user_score_state.npz"
+
+MONITORED_EVENT_TYPES: List[str] = ["view_product", "add_to_cart", "purchase"]
+BUCKET = "hour"
+BUCKET_FREQ = "h"
+
+#Detector defaults: on benchmark_detector.py's Poisson series these catch every injected spike with
+#fewer than one false positive per 100,000 scored series-buckets
+DEFAULT_ALPHA = 0.1
+DEFAULT_THRESHOLD = 5.0
+DEFAULT_WARMUP = 12
+
+KEY_COLUMNS = ["PRODUCT_KEY", "EVENT_TYPE_CODE"]
+
+
+class EwmaDetector:
+    """EWMA mean/variance baseline per (product_key, event_type_code) series, updated one time bucket at a time.
+
+    Counts are scored on the Anscombe scale, 2 * (sqrt(x + 3/8) - sqrt(mean + 3/8)), where a Poisson count has
+    unit variance whatever its mean, divided by the series' dispersion sqrt(var / mean) when that is above 1.
+    A plain (x - mean) / std over-flags quiet series: their EWMA variance is noisy and their counts are skewed.
+
+    Every update is vectorized across all known series, so the cost of a bucket is
+    independent of how much history has been seen.
+    """
+
+    def __init__(self, alpha: float = DEFAULT_ALPHA, threshold: float = DEFAULT_THRESHOLD,
+                 warmup: int = DEFAULT_WARMUP):
+        self.alpha = alpha
+        self.threshold = threshold
+        self.warmup = warmup
+        self.last_bucket: Optional[pd.Timestamp] = None
+        self.state = pd.DataFrame(
+            {"mean": pd.Series(dtype="float64"), "var": pd.Series(dtype="float64"), "n": pd.Series(dtype="int64")},
+            index=pd.MultiIndex.from_arrays([np.array([], dtype=np.int64)] * 2, names=KEY_COLUMNS),
+        )
+
+    def update(self, bucket: pd.Timestamp, counts: pd.Series) -> pd.DataFrame:
+        """Score one bucket of counts (indexed by product/event type) and fold it into the baseline."""
+        keys = self.state.index.union(counts.index) if len(counts) else self.state.index
+        state = self.state.reindex(keys)
+        x = counts.reindex(keys, fill_value=0).to_numpy(dtype="float64")
+
+        is_new = state["n"].isna().to_numpy()
+        mean = np.where(is_new, x, state["mean"].to_numpy())
+        # Seed new series with a Poisson variance so early buckets are not over-flagged
+        var = np.where(is_new, x, state["var"].to_numpy())
+        n = np.where(is_new, 0, state["n"].to_numpy()).astype("int64")
+
+        dispersion = np.sqrt(np.maximum(var / np.maximum(mean, 1e-9), 1.0))
+        z = 2 * (np.sqrt(x + 0.375) - np.sqrt(np.maximum(mean, 0) + 0.375)) / dispersion
+        flagged = (n >= self.warmup) & (np.abs(z) >= self.threshold)
+
+        diff = x - mean
+        incr = self.alpha * diff
+        new_mean = mean + incr
+        new_var = (1 - self.alpha) * (var + diff * incr)
+
+        self.state = pd.DataFrame({"mean": new_mean, "var": new_var, "n": n + 1}, index=keys)
+        self.last_bucket = bucket
+
+        if not flagged.any():
+            return _empty_anomalies()
+        hits = keys[flagged]
+        return pd.DataFrame({
+            "PRODUCT_KEY": hits.get_level_values(0),
+            "EVENT_TYPE_CODE": hits.get_level_values(1),
+            "BUCKET_START": bucket,
+            "OBSERVED": x[flagged].astype("int64"),
+            "EXPECTED": mean[flagged],
+            "Z_SCORE": z[flagged],
+            "DIRECTION": np.where(z[flagged] > 0, "spike", "drop"),
+        })
+
+    def update_many(self, bucket_counts: pd.DataFrame, until: Optional[pd.Timestamp] = None) -> pd.DataFrame:
+        """Feed a long frame of PRODUCT_KEY, EVENT_TYPE_CODE, BUCKET_START, NUM_EVENTS in bucket order.
+
+        Every bucket after the last one scored is scored, up to `until` (default: the last bucket in the frame).
+        Buckets with no rows at all are still scored so that drops to zero are detected, including when the
+        frame is empty because every series went quiet.
+        """
+        if self.last_bucket is not None:
+            first = self.last_bucket + pd.Timedelta(1, BUCKET_FREQ)
+        elif not bucket_counts.empty:
+            first = bucket_counts["BUCKET_START"].min()
+        else:
+            return _empty_anomalies()
+        if until is None:
+            if bucket_counts.empty:
+                return _empty_anomalies()
+            until = bucket_counts["BUCKET_START"].max()
+        buckets = pd.date_range(first, until, freq=BUCKET_FREQ)
+        if buckets.empty:
+            return _empty_anomalies()
+
+        grouped = {
+            bucket: frame.set_index(KEY_COLUMNS)["NUM_EVENTS"]
+            for bucket, frame in bucket_counts.groupby("BUCKET_START")
+        }
+        empty = pd.Series(dtype="int64", index=pd.MultiIndex.from_arrays([np.array([], dtype=np.int64)] * 2, names=KEY_COLUMNS))
+        found = [self.update(bucket, grouped.get(bucket, empty)) for bucket in buckets]
+        found = [frame for frame in found if not frame.empty]
+        return pd.concat(found, ignore_index=True) if found else _empty_anomalies()
+
+    def to_bytes(self) -> bytes:
+        buffer = io.BytesIO()
+        np.savez(
+            buffer,
+            product_key=self.state.index.get_level_values(0).to_numpy(dtype=np.int64),
+            event_type_code=self.state.index.get_level_values(1).to_numpy(dtype=np.int64),
+            mean=self.state["mean"].to_numpy(),
+            var=self.state["var"].to_numpy(),
+            n=self.state["n"].to_numpy(),
+            last_bucket=np.array(str(self.last_bucket) if self.last_bucket is not None else ""),
+        )
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, payload: Optional[bytes], **kwargs) -> "EwmaDetector":
+        detector = cls(**kwargs)
+        if payload is None:
+            logging.info("No detector state saved yet, starting a fresh baseline.")
+            return detector
+        data = np.load(io.BytesIO(payload), allow_pickle=False)
+        if "product_key" not in data:
+            logging.warning("Detector state predates the integer product keys; starting a fresh baseline.")
+            return detector
+        index = pd.MultiIndex.from_arrays([data["product_key"], data["event_type_code"]], names=KEY_COLUMNS)
+        detector.state = pd.DataFrame({"mean": data["mean"], "var": data["var"], "n": data["n"]}, index=index)
+        last_bucket = str(data["last_bucket"])
+        detector.last_bucket = pd.Timestamp(last_bucket) if last_bucket else None
+        logging.info(f"Loaded detector state for {len(index)} series up to bucket {detector.last_bucket}")
+        return detector
+
+
+def _empty_anomalies() -> pd.DataFrame:
+    return pd.DataFrame(columns=KEY_COLUMNS + ["BUCKET_START", "OBSERVED", "EXPECTED", "Z_SCORE", "DIRECTION"])
+
+
+
+def ensure_anomaly_tables(session: Session) -> None:
+    logging.info("Ensuring anomaly tables exist...")
+    session.sql(f"""
+        CREATE TABLE IF NOT EXISTS {ANOMALIES_TABLE} (
+            product_key INT,
+            event_type_code SMALLINT,
+            bucket_start TIMESTAMP,
+            observed INT,
+            expected FLOAT,
+            z_score FLOAT,
+            direction STRING,
+            detected_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP()
+        )
+    """).collect()
+
+    session.sql(f"""
+        CREATE TABLE IF NOT EXISTS {USER_SCORES_TABLE} (
+            user_key INT,
+            window_events INT,
+            num_views INT,
+            num_add_to_cart INT,
+            num_remove_from_cart INT,
+            num_purchases INT,
+            events_per_minute FLOAT,
+            cart_churn FLOAT,
+            purchase_without_view FLOAT,
+            bot_score FLOAT,
+            is_suspicious BOOLEAN,
+            window_end TIMESTAMP,
+            ingested_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP()
+        )
+    """).collect()
+
+
+def last_completed_bucket(session: Session, lateness: timedelta = timedelta(0)) -> pd.Timestamp:
+    """Start of the latest bucket that is completed by the warehouse clock.
+
+    A bucket only counts as completed once the allowed lateness has passed since it ended, so events that
+    arrive late (but within it) are still scored with their bucket. Later ones are missed, since the EWMA
+    baseline cannot go back.
+    """
+    cutoff = session.sql(f"""
+        SELECT DATEADD({BUCKET}, -1, DATE_TRUNC('{BUCKET}',
+            DATEADD('second', -{int(lateness.total_seconds())}, CURRENT_TIMESTAMP()::TIMESTAMP_NTZ)))
+    """).collect()[0][0]
+    return pd.Timestamp(cutoff)
+
+
+def fetch_bucket_counts(session: Session, last_bucket: Optional[pd.Timestamp], until: pd.Timestamp) -> pd.DataFrame:
+    """Return per-product event counts for every bucket after last_bucket, up to and including until."""
+    lower_bound, params = "", [str(until)]
+    if last_bucket is not None:
+        lower_bound = f"AND timestamp >= DATEADD({BUCKET}, 1, ?::TIMESTAMP)"
+        params.append(str(last_bucket))
+    # The detector state is keyed by the surrogate keys, so nothing is decoded here
+    query = f"""
+        SELECT
+            product_key,
+            event_type_code,
+            DATE_TRUNC('{BUCKET}', timestamp) AS bucket_start,
+            COUNT(*) AS num_events
+        FROM {SILVER_EVENTS}
+        WHERE event_type_code IN ({dimensions.event_type_codes(MONITORED_EVENT_TYPES)})
+          AND product_key IS NOT NULL
+          AND timestamp < DATEADD({BUCKET}, 1, ?::TIMESTAMP)
+          {lower_bound}
+        GROUP BY 1, 2, 3
+        ORDER BY bucket_start
+    """
+    counts = session.sql(query, params=params).to_pandas()
+    counts["BUCKET_START"] = pd.to_datetime(counts["BUCKET_START"])
+    counts[KEY_COLUMNS] = counts[KEY_COLUMNS].astype("int64")
+    return counts
+
+
+def detect_product_anomalies(session: Session, store: StateStore, alpha: float, threshold: float,
+                             lateness: timedelta = timedelta(0)) -> None:
+    from snowflake.snowpark.functions import when_matched, when_not_matched
+    logging.info(f"Starting product event-rate anomaly detection (allowed lateness {lateness})...")
+    detector = EwmaDetector.from_bytes(store.read(PRODUCT_STATE_FILE), alpha=alpha, threshold=threshold)
+
+    until = last_completed_bucket(session, lateness)
+    if detector.last_bucket is not None and detector.last_bucket >= until:
+        logging.info("No completed buckets to score.")
+        return
+    counts = fetch_bucket_counts(session, detector.last_bucket, until)
+    if counts.empty and detector.last_bucket is None:
+        logging.info("No events to build a baseline from yet.")
+        return
+
+    # Buckets without events are scored too, so a series that drops to zero is flagged
+    anomalies = detector.update_many(counts, until)
+    logging.info(f"Scored {len(detector.state)} series up to bucket {detector.last_bucket}; {len(anomalies)} anomalies found.")
+
+    if not anomalies.empty:
+        anomalies["DETECTED_AT"] = pd.Timestamp(datetime.now())
+        session.write_pandas(
+            anomalies, ANOMALIES_STAGE.split(".")[1], schema=GOLD_STAGE,
+            auto_create_table=True, overwrite=True, quote_identifiers=False, table_type="temporary",
+            use_logical_type=True,
+        )
+        # A MERGE on the series and bucket, so a run that re-scores buckets (lost state, retried task) does not
+        # write them twice
+        try:
+            target = session.table(ANOMALIES_TABLE)
+            staging = session.table(ANOMALIES_STAGE)
+            merge_result: MergeResult = target.merge(
+                staging,
+                (target["product_key"] == staging["product_key"])
+                & (target["event_type_code"] == staging["event_type_code"])
+                & (target["bucket_start"] == staging["bucket_start"]),
+                [
+                    when_matched().update({c: staging[c] for c in ANOMALY_COLUMNS[3:]}),
+                    when_not_matched().insert({c: staging[c] for c in ANOMALY_COLUMNS}),
+                ]
+            )
+        finally:
+            session.sql(f"DROP TABLE IF EXISTS {ANOMALIES_STAGE}").collect()
+        logging.info(
+            f"Anomalies merged into {ANOMALIES_TABLE}: {merge_result.rows_inserted} inserted, {merge_result.rows_updated} updated."
+        )
+
+    # Persist only after the anomalies are written so a failed run re-scores the same buckets
+    store.write(PRODUCT_STATE_FILE, detector.to_bytes())
+
+
+def score_users(session: Session, store: StateStore, max_users: int) -> None:
+    from snowflake.snowpark.functions import when_matched, when_not_matched
+    logging.info("Starting user behaviour scoring...")
+    scorer = UserWindowScorer.from_bytes(store.read(USER_STATE_FILE), max_users=max_users)
+
+    delta = session.table(SILVER_EVENTS).select("user_key", "event_type_code", "timestamp", "ingested_at")
+    if scorer.watermark is not None:
+        delta = delta.filter(f"ingested_at > '{scorer.watermark}'::TIMESTAMP")
+
+    # Keep only the latest score per user across the streamed batches
+    latest = {}
+    num_events = 0
+    watermark = scorer.watermark
+    for batch in delta.to_pandas_batches():
+        num_events += len(batch)
+        batch_max = pd.Timestamp(batch["INGESTED_AT"].max())
+        watermark = batch_max if watermark is None else max(watermark, batch_max)
+        scores = scorer.update(batch)
+        latest.update(zip(scores["USER_KEY"], scores.to_dict("records")))
+
+    if num_events == 0:
+        logging.info("No new user events to score.")
+        return
+    scorer.watermark = watermark
+    scores = pd.DataFrame(list(latest.values()), columns=SCORE_COLUMNS)
+    scores["INGESTED_AT"] = watermark
+    logging.info(f"Scored {len(scores)} users from {num_events} events; {int(scores['IS_SUSPICIOUS'].sum())} suspicious.")
+
+    # A temporary table: no Time Travel/Fail-safe copies, and it is gone with the session even if the drop below fails
+    session.write_pandas(
+        scores, USER_SCORES_STAGE.split(".")[1], schema=GOLD_STAGE,
+        auto_create_table=True, overwrite=True, quote_identifiers=False, table_type="temporary",
+        use_logical_type=True,
+    )
+    try:
+        target = session.table(USER_SCORES_TABLE)
+        staging = session.table(USER_SCORES_STAGE)
+        columns = [c.lower() for c in SCORE_COLUMNS] + ["ingested_at"]
+        merge_result: MergeResult = target.merge(
+            staging,
+            target["user_key"] == staging["user_key"],
+            [
+                when_matched().update({c: staging[c] for c in columns if c != "user_key"}),
+                when_not_matched().insert({c: staging[c] for c in columns}),
+            ]
+        )
+    finally:
+        session.sql(f"DROP TABLE IF EXISTS {USER_SCORES_STAGE}").collect()
+    logging.info(f"User scores merged: {merge_result.rows_inserted} inserted, {merge_result.rows_updated} updated.")
+
+    # Persist only after the scores are merged so a failed run re-reads the same delta
+    store.write(USER_STATE_FILE, scorer.to_bytes())
+
+
+
+def main(step: str, env_path: str, state_dir: Path, alpha: float, threshold: float, max_users: int,
+         lateness_minutes: Optional[float] = None):
+
+    # Check if file exists
+    if not os.path.exists(env_path):
+        raise FileNotFoundError(f".env file not found at path: {env_path}")
+    #Default Configs
+    load_dotenv(dotenv_path=env_path) #Load credentials found in .env file
+
+    #Connection credentials
+    connection_params={
+        "account": os.getenv("SNOWFLAKE_ACCOUNT"),
+        "user": os.getenv("SNOWFLAKE_USER"),
+        "password": os.getenv("SNOWFLAKE_PASSWORD"),
+        "warehouse": os.getenv("SNOWFLAKE_WAREHOUSE"),
+        "database": os.getenv("SNOWFLAKE_DATABASE"),
+        "schema": os.getenv("SNOWFLAKE_SCHEMA"),
+        "role": os.getenv("SNOWFLAKE_ROLE"),
+    }
+    # Check that all required environment variables are set
+    missing = [k for k,v in connection_params.items() if not v]
+    if missing:
+        raise ValueError(f"Missing enviroment variables: {','.join(missing)}")
+
+    from snowflake.snowpark import Session
+    session = Session.builder.configs(connection_params).create()
+    ensure_anomaly_tables(session)
+    try:
+        if step in ["all","products"]:
+            with profiling.step("detect_product_anomalies"):
+                detect_product_anomalies(
+                    session, StateStore.from_env(session, state_dir), alpha, threshold,
+                    event_time.allowed_lateness(lateness_minutes)
+                )
+        if step in ["all","users"]:
+            with profiling.step("score_users"):
+                score_users(session, StateStore.from_env(session, state_dir), max_users)
+    finally:
+        session.close()
+        logging.info("Snowpark session closed.")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--step", choices=["all", "products", "users"], default="all")
+    parser.add_argument("--env", default=".env", help="Path to .env file")
+    parser.add_argument("--state-dir", type=Path, default=STATE_DIR, help="Directory holding detector and scorer state with ANOMALY_STATE=local")
+    parser.add_argument("--alpha", type=float, default=DEFAULT_ALPHA, help="EWMA smoothing factor")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="Absolute variance-stabilized z-score that flags an anomaly")
+    parser.add_argument("--max-users", type=int, default=DEFAULT_MAX_USERS, help="Users kept in the scoring window state")
+    parser.add_argument(
+        "--allowed-lateness-minutes", type=float, default=None,
+        help=f"Minutes a bucket stays open for late events (default: ALLOWED_LATENESS_MINUTES or {event_time.DEFAULT_ALLOWED_LATENESS_MINUTES})"
+    )
+    profiling.add_profile_arguments(parser)
+    args = parser.parse_args()
+    profiling.configure(args.profile, "anomaly_detection", args.profile_dir)
+    main(args.step, args.env, args.state_dir, args.alpha, args.threshold, args.max_users, args.allowed_lateness_minutes)
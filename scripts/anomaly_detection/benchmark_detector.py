@@ -0,0 +1,156 @@
+import sys
+import time
+import logging
+import argparse
+from typing import List, Tuple
+import numpy as np
+import pandas as pd
+from anomaly_detection import EwmaDetector, KEY_COLUMNS, MONITORED_EVENT_TYPES, BUCKET_FREQ
+from user_scoring import UserWindowScorer, TYPE_CODES
+from dimensions import EVENT_TYPE_CODES
+
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+
+DEFAULT_NUM_PRODUCTS = 100_000
+DEFAULT_NUM_BUCKETS = 48
+DEFAULT_USER_COUNTS = [50_000, 100_000, 500_000]
+DEFAULT_NUM_EVENTS = 5_000_000
+DEFAULT_BATCH_SIZE = 50_000
+DURATION_SECONDS = 2 * 3600
+#One user in BOT_EVERY is a bot firing BOT_EVENTS_PER_HOUR events: half churn carts, half scrape product pages
+BOT_EVERY = 1000
+BOT_EVENTS_PER_HOUR = 360
+#The users benchmark fails below these, at every user count
+MIN_PRECISION = 0.9
+MIN_RECALL = 0.9
+
+
+def synthetic_counts(num_products: int, num_buckets: int, seed: int) -> Tuple[pd.DataFrame, pd.MultiIndex]:
+    """Poisson counts for every product/event type series with a handful of spikes injected into the last
+    bucket, and the keys of the spiked series."""
+    rng = np.random.default_rng(seed)
+    products = np.arange(1, num_products + 1, dtype=np.int64)
+    num_series = num_products * len(MONITORED_EVENT_TYPES)
+    monitored_codes = [EVENT_TYPE_CODES[event_type] for event_type in MONITORED_EVENT_TYPES]
+    rates = rng.gamma(2.0, 5.0, size=num_series)
+    buckets = pd.date_range("2025-01-01", periods=num_buckets, freq=BUCKET_FREQ)
+
+    counts = rng.poisson(rates, size=(num_buckets, num_series))
+    spikes = rng.integers(0, num_series, size=max(1, num_series // 1000))
+    counts[-1, spikes] += (rates[spikes] * 10).astype("int64") + 20
+
+    counts = pd.DataFrame({
+        "PRODUCT_KEY": np.tile(np.repeat(products, len(MONITORED_EVENT_TYPES)), num_buckets),
+        "EVENT_TYPE_CODE": np.tile(np.tile(monitored_codes, num_products), num_buckets),
+        "BUCKET_START": np.repeat(buckets, num_series),
+        "NUM_EVENTS": counts.ravel(),
+    })
+    spiked = counts.iloc[(num_buckets - 1) * num_series + np.unique(spikes)]
+    return counts, pd.MultiIndex.from_frame(spiked[KEY_COLUMNS])
+
+
+def synthetic_events(num_users: int, num_events: int, seed: int) -> Tuple[pd.DataFrame, np.ndarray]:
+    """num_events ordinary events spread over two hours plus the bots' events, and the bots' user keys.
+
+    Ordinary users draw from a fixed event-type mix, so the fewer users share num_events, the busier each one is;
+    bots fire at the same rate at every user count."""
+    rng = np.random.default_rng(seed)
+    user_keys = rng.integers(0, num_users, size=num_events) + 1
+    types = rng.choice(len(TYPE_CODES), size=num_events, p=[0.6, 0.2, 0.1, 0.1])
+    offsets = rng.integers(0, DURATION_SECONDS, size=num_events)
+
+    bots = np.arange(1, num_users + 1, BOT_EVERY)
+    ordinary = ~np.isin(user_keys, bots)
+    per_bot = BOT_EVENTS_PER_HOUR * DURATION_SECONDS // 3600
+    bot_keys = np.repeat(bots, per_bot)
+    churners = np.repeat(np.arange(len(bots)) % 2 == 0, per_bot)
+    bot_types = np.where(churners, rng.choice([1, 2], size=len(bot_keys)), 0)
+    bot_offsets = rng.integers(0, DURATION_SECONDS, size=len(bot_keys))
+
+    events = pd.DataFrame({
+        "USER_KEY": np.concatenate([user_keys[ordinary], bot_keys]),
+        "EVENT_TYPE_CODE": np.array(TYPE_CODES)[np.concatenate([types[ordinary], bot_types])],
+        "TIMESTAMP": pd.Timestamp("2025-01-01") + pd.to_timedelta(
+            np.concatenate([offsets[ordinary], bot_offsets]), unit="s"),
+    })
+    return events.sort_values("TIMESTAMP", kind="stable", ignore_index=True), bots
+
+
+def benchmark_users(args: argparse.Namespace) -> bool:
+    """Throughput, precision and recall at each user count; False if any count misses the quality bounds."""
+    passed = True
+    for num_users in args.users:
+        events, bots = synthetic_events(num_users, args.events, args.seed)
+        scorer = UserWindowScorer(max_users=num_users)
+        suspicious = set()
+        started = time.perf_counter()
+        for offset in range(0, len(events), args.batch_size):
+            scores = scorer.update(events.iloc[offset:offset + args.batch_size])
+            suspicious.update(scores.loc[scores["IS_SUSPICIOUS"], "USER_KEY"].tolist())
+        elapsed = time.perf_counter() - started
+
+        caught = len(suspicious.intersection(bots.tolist()))
+        precision = caught / len(suspicious) if suspicious else 1.0
+        recall = caught / len(bots)
+        ok = precision >= MIN_PRECISION and recall >= MIN_RECALL
+        passed &= ok
+        logging.log(
+            logging.INFO if ok else logging.ERROR,
+            f"{num_users:>9,} users: {len(events):,} events in {elapsed:.2f}s "
+            f"({len(events) / elapsed * 60:,.0f} events/min), {caught}/{len(bots)} bots caught, "
+            f"{len(suspicious) - caught} other users flagged (precision {precision:.2f}, recall {recall:.2f}), "
+            f"state {scorer.counts.nbytes / 1e6:.1f} MB"
+        )
+    return passed
+
+
+def benchmark_products(args: argparse.Namespace) -> None:
+    counts, spiked = synthetic_counts(args.products, args.buckets, args.seed)
+    num_series = args.products * len(MONITORED_EVENT_TYPES)
+    logging.info(f"Generated {len(counts):,} bucket counts over {num_series:,} series")
+
+    # Full replay: every bucket once, the way a first run catches up
+    detector = EwmaDetector()
+    started = time.perf_counter()
+    anomalies = detector.update_many(counts)
+    elapsed = time.perf_counter() - started
+    last = counts["BUCKET_START"].max()
+    flagged = pd.MultiIndex.from_frame(anomalies.loc[anomalies["BUCKET_START"] == last, KEY_COLUMNS])
+    caught = int(spiked.isin(flagged).sum())
+    logging.info(
+        f"Replay: {args.buckets} buckets in {elapsed:.2f}s "
+        f"({len(counts) / elapsed:,.0f} series-buckets/s), {len(anomalies)} anomalies: "
+        f"{caught}/{len(spiked)} injected spikes caught, {len(anomalies) - caught} other buckets flagged"
+    )
+
+    # Steady state: one new bucket against the warmed-up baseline
+    next_bucket = counts[counts["BUCKET_START"] == last].assign(BUCKET_START=last + pd.Timedelta(1, BUCKET_FREQ))
+    started = time.perf_counter()
+    detector.update(next_bucket["BUCKET_START"].iloc[0], next_bucket.set_index(KEY_COLUMNS)["NUM_EVENTS"])
+    elapsed = time.perf_counter() - started
+    logging.info(f"Incremental: 1 bucket over {num_series:,} series in {elapsed * 1000:.1f} ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the product anomaly detector and user scorer.")
+    parser.add_argument("--detector", choices=["products", "users"], default="products")
+    parser.add_argument("--products", type=int, default=DEFAULT_NUM_PRODUCTS, help="Number of products")
+    parser.add_argument("--buckets", type=int, default=DEFAULT_NUM_BUCKETS, help="Number of time buckets")
+    parser.add_argument("--users", type=lambda value: [int(n) for n in value.split(",")], default=DEFAULT_USER_COUNTS,
+                        help="Comma-separated user counts to score the same number of events over")
+    parser.add_argument("--events", type=int, default=DEFAULT_NUM_EVENTS, help="Number of ordinary user events")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Events per scorer update")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed for reproducibility")
+    args = parser.parse_args()
+
+    if args.detector == "users":
+        if not benchmark_users(args):
+            logging.error(f"User scorer below precision {MIN_PRECISION} or recall {MIN_RECALL}")
+            sys.exit(1)
+    else:
+        benchmark_products(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+'''Where the anomaly detectors keep their state between runs.
+
+The Airflow containers only mount dags, logs, scripts and .env, so a file written next to the scripts' data
+folder is gone on the next task run and every run would start from an empty baseline. By default the state is
+therefore one .npz blob per detector on a Snowflake internal stage, like the Silver dedupe index; "local" keeps
+it in a directory instead, for runs outside Airflow.
+'''
+import io
+import os
+import logging
+from pathlib import Path
+from typing import Any, Optional
+
+DEFAULT_STAGE = "GOLD_STAGING.ANOMALY_STATE"
+DEFAULT_DIR = Path(__file__).resolve().parent.parent.parent / "data" / "state"
+
+
+class StateStore:
+    """Named state blobs on a stage ("stage") or in a local directory ("local")."""
+
+    def __init__(self, session: Any, store: str = "stage", stage: str = DEFAULT_STAGE, directory: Path = DEFAULT_DIR):
+        if store not in ("stage", "local"):
+            raise ValueError(f"Unknown anomaly state store: {store}")
+        self.session = session
+        self.store = store
+        self.stage = stage
+        self.directory = Path(directory)
+
+    @classmethod
+    def from_env(cls, session: Any, directory: Path = DEFAULT_DIR) -> "StateStore":
+        """ANOMALY_STATE=stage|local; ANOMALY_STATE_STAGE names the stage."""
+        return cls(
+            session,
+            store=os.getenv("ANOMALY_STATE", "stage").lower(),
+            stage=os.getenv("ANOMALY_STATE_STAGE", DEFAULT_STAGE),
+            directory=directory,
+        )
+
+    def __str__(self) -> str:
+        return f"@{self.stage}" if self.store == "stage" else str(self.directory)
+
+    def read(self, name: str) -> Optional[bytes]:
+        """The blob saved under name, or None if there is none yet."""
+        if self.store == "local":
+            path = self.directory / name
+            return path.read_bytes() if path.exists() else None
+        self.session.sql(f"CREATE STAGE IF NOT EXISTS {self.stage}").collect()
+        if not self.session.sql(f"LIST @{self.stage}/{name}").collect():
+            return None
+        return self.session.file.get_stream(f"@{self.stage}/{name}").read()
+
+    def write(self, name: str, payload: bytes) -> None:
+        if self.store == "local":
+            self.directory.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.directory / f"{name}.tmp"
+            tmp_path.write_bytes(payload)
+            os.replace(tmp_path, self.directory / name)
+        else:
+            self.session.file.put_stream(io.BytesIO(payload), f"@{self.stage}/{name}", auto_compress=False, overwrite=True)
+        logging.info(f"Saved {name} to {self}")
@@ -0,0 +1,260 @@
+import io
+import sys
+import logging
+from pathlib import Path
+from typing import List, Optional
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from dimensions import EVENT_TYPE_CODES
+
+#Silver's event_type_code values, in the order of the state's last axis
+EVENT_TYPES: List[str] = ["view_product", "add_to_cart", "remove_from_cart", "purchase"]
+TYPE_CODES: List[int] = [EVENT_TYPE_CODES[event_type] for event_type in EVENT_TYPES]
+VIEW, ADD, REMOVE, PURCHASE = range(len(EVENT_TYPES))
+
+#Scorer defaults
+DEFAULT_BUCKET_SECONDS = 300
+DEFAULT_WINDOW_BUCKETS = 12
+DEFAULT_IDLE_BUCKETS = 288
+DEFAULT_MAX_USERS = 500_000
+INITIAL_CAPACITY = 1024
+
+#Score limits: a component reaching its limit contributes a full score of 1.0
+RATE_Z_LIMIT = 6.0
+CHURN_LIMIT = 8.0
+MIN_CHURN_CYCLES = 10
+MIN_BLIND_PURCHASES = 5
+SUSPICIOUS_SCORE = 1.0
+#Users with fewer events in the window are not scored: a handful of events says nothing about a bot
+MIN_WINDOW_EVENTS = 20
+
+SCORE_COLUMNS = [
+    "USER_KEY", "WINDOW_EVENTS", "NUM_VIEWS", "NUM_ADD_TO_CART", "NUM_REMOVE_FROM_CART", "NUM_PURCHASES",
+    "EVENTS_PER_MINUTE", "CART_CHURN", "PURCHASE_WITHOUT_VIEW", "BOT_SCORE", "IS_SUSPICIOUS", "WINDOW_END",
+]
+
+
+class UserWindowScorer:
+    """Per-user sliding-window event counts kept in a fixed ring of time buckets.
+
+    State is a dense [users, window, event types] counter array keyed by Silver's integer user_key,
+    so memory is bounded by max_users. Users idle for longer than idle_buckets are evicted first when space is
+    needed, then the least recently seen users.
+
+    Each user's window total is cached as of the batch that last touched it, so a batch only recounts its own
+    users; the event-rate population is every cached total still inside the window.
+    """
+
+    def __init__(self, bucket_seconds: int = DEFAULT_BUCKET_SECONDS, window_buckets: int = DEFAULT_WINDOW_BUCKETS,
+                 idle_buckets: int = DEFAULT_IDLE_BUCKETS, max_users: int = DEFAULT_MAX_USERS):
+        self.bucket_seconds = bucket_seconds
+        self.window_buckets = window_buckets
+        self.idle_buckets = idle_buckets
+        self.max_users = max_users
+        self.now_bucket = -1
+        self.watermark: Optional[pd.Timestamp] = None
+        self._allocate(min(INITIAL_CAPACITY, max_users))
+
+    def _allocate(self, capacity: int) -> None:
+        self.user_keys = np.full(capacity, -1, dtype=np.int64)
+        self.counts = np.zeros((capacity, self.window_buckets, len(EVENT_TYPES)), dtype=np.uint32)
+        self.ring_bucket = np.full((capacity, self.window_buckets), -1, dtype=np.int64)
+        self.last_seen = np.full(capacity, -1, dtype=np.int64)
+        self.window_total = np.zeros(capacity, dtype=np.int64)
+        self._lookup = pd.Index([], dtype=np.int64)
+        self._lookup_slots = np.array([], dtype=np.int64)
+
+    @property
+    def capacity(self) -> int:
+        return len(self.user_keys)
+
+    @property
+    def num_users(self) -> int:
+        return len(self._lookup)
+
+    def _grow(self, needed: int) -> None:
+        capacity = self.capacity
+        while capacity < needed and capacity < self.max_users:
+            capacity = min(capacity * 2, self.max_users)
+        if capacity == self.capacity:
+            return
+        extra = capacity - self.capacity
+        self.user_keys = np.concatenate([self.user_keys, np.full(extra, -1, dtype=np.int64)])
+        self.counts = np.concatenate([self.counts, np.zeros((extra,) + self.counts.shape[1:], dtype=self.counts.dtype)])
+        self.ring_bucket = np.concatenate([self.ring_bucket, np.full((extra, self.window_buckets), -1, dtype=np.int64)])
+        self.last_seen = np.concatenate([self.last_seen, np.full(extra, -1, dtype=np.int64)])
+        self.window_total = np.concatenate([self.window_total, np.zeros(extra, dtype=np.int64)])
+
+    def _evict(self, needed: int, protected: np.ndarray) -> None:
+        occupied = np.flatnonzero(self.last_seen >= 0)
+        candidates = occupied[~np.isin(occupied, protected)]
+        idle = candidates[self.last_seen[candidates] < self.now_bucket - self.idle_buckets]
+        victims = idle
+        if len(victims) < needed:
+            rest = candidates[~np.isin(candidates, idle)]
+            take = min(needed - len(victims), len(rest))
+            oldest = rest[np.argpartition(self.last_seen[rest], take - 1)[:take]] if take else rest[:0]
+            victims = np.concatenate([victims, oldest])
+        if len(victims):
+            logging.info(f"Evicting {len(victims)} users from the scoring window")
+        self.user_keys[victims] = -1
+        self.counts[victims] = 0
+        self.ring_bucket[victims] = -1
+        self.last_seen[victims] = -1
+        self.window_total[victims] = 0
+
+    def _slots_for(self, users: np.ndarray) -> np.ndarray:
+        """Map unique user keys to state slots, allocating (and evicting) for unseen users."""
+        found = self._lookup.get_indexer(users)
+        slots = np.full(len(users), -1, dtype=np.int64)
+        slots[found >= 0] = self._lookup_slots[found[found >= 0]]
+        new = np.flatnonzero(slots < 0)
+        if len(new):
+            free = np.flatnonzero(self.last_seen < 0)
+            if len(free) < len(new):
+                self._grow(self.num_users + len(new))
+                free = np.flatnonzero(self.last_seen < 0)
+            if len(free) < len(new):
+                self._evict(len(new) - len(free), slots[slots >= 0])
+                free = np.flatnonzero(self.last_seen < 0)
+            if len(free) < len(new):
+                logging.warning(f"Scorer full: dropping {len(new) - len(free)} new users from this batch")
+                new = new[:len(free)]
+            slots[new] = free[:len(new)]
+            self.user_keys[slots[new]] = users[new]
+            self.last_seen[slots[new]] = self.now_bucket
+
+            occupied = np.flatnonzero(self.last_seen >= 0)
+            self._lookup = pd.Index(self.user_keys[occupied])
+            self._lookup_slots = occupied
+        return slots
+
+    def update(self, events: pd.DataFrame) -> pd.DataFrame:
+        """Fold a batch of USER_KEY, EVENT_TYPE_CODE, TIMESTAMP rows into the windows and score touched users."""
+        type_codes = pd.Categorical(events["EVENT_TYPE_CODE"], categories=TYPE_CODES).codes.astype(np.int64)
+        timestamps = pd.to_datetime(events["TIMESTAMP"]).to_numpy(dtype="datetime64[ns]").astype(np.int64)
+        buckets = timestamps // (self.bucket_seconds * 1_000_000_000)
+        user_codes, users = pd.factorize(events["USER_KEY"])
+
+        if len(buckets):
+            self.now_bucket = max(self.now_bucket, int(buckets.max()))
+        keep = (type_codes >= 0) & (user_codes >= 0) & (buckets > self.now_bucket - self.window_buckets)
+        if not keep.any():
+            return pd.DataFrame(columns=SCORE_COLUMNS)
+
+        unique_slots = self._slots_for(np.asarray(users, dtype=np.int64))
+        slots = unique_slots[user_codes[keep]]
+        types, buckets = type_codes[keep], buckets[keep]
+        allocated = slots >= 0
+        slots, types, buckets = slots[allocated], types[allocated], buckets[allocated]
+        positions = buckets % self.window_buckets
+
+        # Advance ring cells that now hold a newer bucket, then count only events for each cell's bucket
+        before = self.ring_bucket[slots, positions]
+        np.maximum.at(self.ring_bucket, (slots, positions), buckets)
+        after = self.ring_bucket[slots, positions]
+        advanced = after != before
+        self.counts[slots[advanced], positions[advanced]] = 0
+        current = buckets == after
+        np.add.at(self.counts, (slots[current], positions[current], types[current]), 1)
+        np.maximum.at(self.last_seen, slots, buckets)
+
+        return self.score(np.unique(slots))
+
+    def _window_totals(self, slots: np.ndarray) -> np.ndarray:
+        """[slots, event types] counts over the buckets still inside the window."""
+        in_window = self.ring_bucket[slots] > self.now_bucket - self.window_buckets
+        return (self.counts[slots] * in_window[:, :, None]).sum(axis=1, dtype=np.int64)
+
+    def score(self, slots: np.ndarray) -> pd.DataFrame:
+        totals = self._window_totals(slots)
+        window_events = totals.sum(axis=1)
+        self.window_total[slots] = window_events
+        window_minutes = self.window_buckets * self.bucket_seconds / 60
+
+        # Event rate against every user active in the window, not just the ones this batch touched
+        # (robust z-score on log counts)
+        active = self.last_seen > self.now_bucket - self.window_buckets
+        log_population = np.log1p(self.window_total[active])
+        median = np.median(log_population)
+        mad = np.median(np.abs(log_population - median)) * 1.4826
+        rate_z = (np.log1p(window_events) - median) / max(mad, 0.25)
+
+        adds, removes = totals[:, ADD], totals[:, REMOVE]
+        purchases, views = totals[:, PURCHASE], totals[:, VIEW]
+        # Add/remove cycles that never turn into purchases, weighted by how much of the user's activity is cart
+        # churn: shoppers who also browse a lot are not bots
+        cycles = np.minimum(adds, removes)
+        cart_share = (adds + removes) / np.maximum(window_events, 1)
+        cart_churn = np.where(cycles >= MIN_CHURN_CYCLES, cycles / (purchases + 1) * cart_share, 0.0)
+        purchase_without_view = np.where(
+            purchases >= MIN_BLIND_PURCHASES, np.clip(purchases - views, 0, None) / np.maximum(purchases, 1), 0.0
+        )
+
+        bot_score = np.maximum.reduce([
+            np.clip(rate_z / RATE_Z_LIMIT, 0, 1),
+            np.clip(cart_churn / CHURN_LIMIT, 0, 1),
+            purchase_without_view,
+        ])
+        bot_score = np.where(window_events >= MIN_WINDOW_EVENTS, bot_score, 0.0)
+        window_end = pd.Timestamp((self.now_bucket + 1) * self.bucket_seconds, unit="s")
+
+        return pd.DataFrame({
+            "USER_KEY": self.user_keys[slots],
+            "WINDOW_EVENTS": window_events,
+            "NUM_VIEWS": views,
+            "NUM_ADD_TO_CART": adds,
+            "NUM_REMOVE_FROM_CART": removes,
+            "NUM_PURCHASES": purchases,
+            "EVENTS_PER_MINUTE": window_events / window_minutes,
+            "CART_CHURN": cart_churn,
+            "PURCHASE_WITHOUT_VIEW": purchase_without_view,
+            "BOT_SCORE": bot_score,
+            "IS_SUSPICIOUS": bot_score >= SUSPICIOUS_SCORE,
+            "WINDOW_END": window_end,
+        })
+
+    def to_bytes(self) -> bytes:
+        buffer = io.BytesIO()
+        occupied = np.flatnonzero(self.last_seen >= 0)
+        np.savez(
+            buffer,
+            user_keys=self.user_keys[occupied],
+            counts=self.counts[occupied],
+            ring_bucket=self.ring_bucket[occupied],
+            last_seen=self.last_seen[occupied],
+            now_bucket=np.array(self.now_bucket),
+            watermark=np.array(str(self.watermark) if self.watermark is not None else ""),
+        )
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, payload: Optional[bytes], **kwargs) -> "UserWindowScorer":
+        scorer = cls(**kwargs)
+        if payload is None:
+            logging.info("No scorer state saved yet, starting empty windows.")
+            return scorer
+        data = np.load(io.BytesIO(payload), allow_pickle=False)
+        if "user_keys" not in data:
+            logging.warning("Scorer state predates the integer user keys; starting empty windows.")
+            return scorer
+        if data["counts"].shape[1] != scorer.window_buckets:
+            logging.warning("Window size changed since the state was saved; starting empty windows.")
+            return scorer
+        num_users = len(data["user_keys"])
+        scorer._allocate(max(min(INITIAL_CAPACITY, scorer.max_users), min(num_users, scorer.max_users)))
+        num_users = min(num_users, scorer.capacity)
+        scorer.user_keys[:num_users] = data["user_keys"][:num_users]
+        scorer.counts[:num_users] = data["counts"][:num_users]
+        scorer.ring_bucket[:num_users] = data["ring_bucket"][:num_users]
+        scorer.last_seen[:num_users] = data["last_seen"][:num_users]
+        scorer.now_bucket = int(data["now_bucket"])
+        scorer.window_total[:num_users] = scorer._window_totals(np.arange(num_users)).sum(axis=1)
+        scorer._lookup = pd.Index(scorer.user_keys[:num_users])
+        scorer._lookup_slots = np.arange(num_users)
+        watermark = str(data["watermark"])
+        scorer.watermark = pd.Timestamp(watermark) if watermark else None
+        logging.info(f"Loaded scorer state for {num_users} users up to {scorer.watermark}")
+        return scorer
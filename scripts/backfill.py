@@ -0,0 +1,243 @@
+from __future__ import annotations
+import os
+import sys
+import logging
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Dict, List, Set, Tuple
+from dotenv import load_dotenv
+
+SCRIPTS_DIR = Path(__file__).resolve().parent
+for stage_dir in ["bronze_to_silver", "gold_aggregation"]:
+    sys.path.insert(0, str(SCRIPTS_DIR / stage_dir))
+
+import bronze_to_silver as silver
+import gold_aggregation as gold
+import dimensions
+import profiling
+
+if TYPE_CHECKING:
+    from snowflake.snowpark import Session
+
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+
+STATE_TABLE = "GOLD_STAGING.BACKFILL_STATE"
+
+Window = Tuple[datetime, datetime]
+
+
+def ensure_state_table(session: Session) -> None:
+    session.sql(f"""
+        CREATE TABLE IF NOT EXISTS {STATE_TABLE} (
+            step STRING,
+            window_start TIMESTAMP,
+            window_end TIMESTAMP,
+            rows_inserted INT,
+            rows_updated INT,
+            finished_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP()
+        )
+    """).collect()
+
+
+def split_windows(start: datetime, end: datetime, window: timedelta) -> List[Window]:
+    windows = []
+    while start < end:
+        windows.append((start, min(start + window, end)))
+        start += window
+    return windows
+
+
+def finished_units(session: Session, start: datetime, end: datetime) -> Set[Tuple[str, datetime, datetime]]:
+    from snowflake.snowpark.functions import col
+    rows = (
+        session.table(STATE_TABLE)
+        .filter((col("window_start") >= start) & (col("window_end") <= end))
+        .select("step", "window_start", "window_end")
+        .collect()
+    )
+    return {(row[0], row[1], row[2]) for row in rows}
+
+
+def record_unit(session: Session, step: str, window: Window, inserted: int, updated: int) -> None:
+    session.sql(
+        f"INSERT INTO {STATE_TABLE} (step, window_start, window_end, rows_inserted, rows_updated) VALUES (?, ?, ?, ?, ?)",
+        params=[step, window[0], window[1], inserted, updated],
+    ).collect()
+
+
+#Silver: each Bronze row belongs to exactly one event-time window, so windows write disjoint keys.
+#Only rows Silver has already processed (ingested_at <= its watermark) are replayed, which keeps the
+#watermark in place for the next incremental run.
+
+def bronze_events(session: Session, window: Window, watermark):
+    from snowflake.snowpark.functions import col
+    bronze = session.table(silver.EVENTS_TABLE).filter(
+        (col("timestamp") >= window[0]) & (col("timestamp") < window[1]) &
+        (col("ingested_at") <= watermark)
+    )
+    return silver.build_events_cleaned(bronze)
+
+
+def bronze_sessions(session: Session, window: Window, watermark):
+    from snowflake.snowpark.functions import col
+    bronze = session.table(silver.SESSIONS_TABLE).filter(
+        (col("start_time") >= window[0]) & (col("start_time") < window[1]) &
+        (col("ingested_at") <= watermark)
+    )
+    return silver.build_session_events_flat(bronze)
+
+
+def register_dimensions(session: Session, window: Window, watermarks: Dict[str, object]) -> None:
+    """Assign keys to every dimension value in the range up front; the windows then only look them up, as
+    key assignment needs a single writer."""
+    dimensions.register(session, bronze_events(session, window, watermarks["silver_events"]))
+    dimensions.register(session, bronze_sessions(session, window, watermarks["silver_sessions"]))
+
+
+def silver_events_unit(session: Session, window: Window, watermark) -> Tuple[int, int]:
+    staging = dimensions.encode(session, bronze_events(session, window, watermark))
+    result = silver.merge_events(session.table(silver.EVENTS_SILVER_TABLE), staging)
+    return result.rows_inserted, result.rows_updated
+
+
+def silver_sessions_unit(session: Session, window: Window, watermark) -> Tuple[int, int]:
+    staging = dimensions.encode(session, bronze_sessions(session, window, watermark))
+    result = silver.merge_session_events(session.table(silver.SESSIONS_SILVER_TABLE), staging)
+    return result.rows_inserted, result.rows_updated
+
+
+#Gold: every key touched by the range is recomputed from all of its Silver rows, once, by the window
+#holding its earliest event in the range. The final value of a key therefore does not depend on which
+#windows ran, in what order, or concurrently.
+
+def owned_keys_sql(spec: gold.MetricSpec) -> str:
+    """Keys whose first event since the range start falls in the window; params: range start, window end, window start."""
+    key_cols = ", ".join(c.name for c in spec.keys)
+    return f"""
+        SELECT {key_cols} FROM {spec.source}
+        WHERE {spec.event_time} >= ? AND {spec.event_time} < ?
+        GROUP BY {key_cols}
+        HAVING MIN({spec.event_time}) >= ?
+    """
+
+
+def gold_unit(spec: gold.MetricSpec) -> Callable[[Session, Window, datetime], Tuple[int, int]]:
+    merge_sql = gold.build_merge_sql(spec, owned_keys_sql(spec))
+
+    def run(session: Session, window: Window, range_start: datetime) -> Tuple[int, int]:
+        row = session.sql(merge_sql, params=[range_start, window[1], window[0]]).collect()[0]
+        return row[0], row[1]
+    return run
+
+
+SILVER_STEPS: Dict[str, Callable] = {
+    "silver_events": silver_events_unit,
+    "silver_sessions": silver_sessions_unit,
+}
+GOLD_STEPS: Dict[str, Callable] = {f"gold_{name}": gold_unit(spec) for name, spec in gold.METRIC_SPECS.items()}
+
+
+def run_phase(session: Session, steps: Dict[str, Callable], windows: List[Window], done: Set,
+              max_workers: int, step_args: Dict[str, object]) -> int:
+    """Run every (step, window) not in done on up to max_workers threads; return the number of failures.
+
+    step_args holds each step's last argument: the Silver watermark, or the range start for Gold.
+    """
+    units = [(step, window) for step in steps for window in windows if (step, *window) not in done]
+    skipped = len(steps) * len(windows) - len(units)
+    if skipped:
+        logging.info(f"Skipping {skipped} windows already recorded in {STATE_TABLE}.")
+    failures = 0
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {
+            pool.submit(steps[step], session, window, step_args[step]): (step, window)
+            for step, window in units
+        }
+        for future in as_completed(futures):
+            step, window = futures[future]
+            try:
+                inserted, updated = future.result()
+            except Exception as e:
+                failures += 1
+                logging.error(f"{step} {window[0]} -> {window[1]} failed: {e}")
+                continue
+            record_unit(session, step, window, inserted, updated)
+            logging.info(f"{step} {window[0]} -> {window[1]}: {inserted} inserted, {updated} updated.")
+    return failures
+
+
+def main(start: datetime, end: datetime, window_hours: int, step: str, max_workers: int, restart: bool, env_path: str):
+
+    # Check if file exists
+    if not os.path.exists(env_path):
+        raise FileNotFoundError(f".env file not found at path: {env_path}")
+    load_dotenv(dotenv_path=env_path) #Load credentials found in .env file
+
+    #Connection credentials
+    connection_params={
+        "account": os.getenv("SNOWFLAKE_ACCOUNT"),
+        "user": os.getenv("SNOWFLAKE_USER"),
+        "password": os.getenv("SNOWFLAKE_PASSWORD"),
+        "warehouse": os.getenv("SNOWFLAKE_WAREHOUSE"),
+        "database": os.getenv("SNOWFLAKE_DATABASE"),
+        "schema": os.getenv("SNOWFLAKE_SCHEMA"),
+        "role": os.getenv("SNOWFLAKE_ROLE"),
+    }
+    # Check that all required environment variables are set
+    missing = [k for k,v in connection_params.items() if not v]
+    if missing:
+        raise ValueError(f"Missing enviroment variables: {','.join(missing)}")
+
+    windows = split_windows(start, end, timedelta(hours=window_hours))
+    logging.info(f"Backfilling {start} -> {end} as {len(windows)} windows with up to {max_workers} workers.")
+
+    from snowflake.snowpark import Session
+    session = Session.builder.configs(connection_params).create()
+    try:
+        ensure_state_table(session)
+        silver.ensure_tables(session)
+        gold.ensure_gold_tables(session)
+        if restart:
+            session.sql(
+                f"DELETE FROM {STATE_TABLE} WHERE window_start >= ? AND window_end <= ?", params=[start, end]
+            ).collect()
+        done = finished_units(session, start, end)
+
+        if step in ["all", "silver"]:
+            watermarks = {
+                "silver_events": silver.get_last_ingested_at(session, silver.EVENTS_SILVER_TABLE),
+                "silver_sessions": silver.get_last_ingested_at(session, silver.SESSIONS_SILVER_TABLE),
+            }
+            with profiling.step("silver_phase"):
+                register_dimensions(session, (start, end), watermarks)
+                failures = run_phase(session, SILVER_STEPS, windows, done, max_workers, watermarks)
+            if failures:
+                # Gold recomputes read Silver, so it must not run over a partially backfilled Silver
+                raise RuntimeError("Silver backfill had failed windows; rerun to resume.")
+        if step in ["all", "gold"]:
+            with profiling.step("gold_phase"):
+                failures = run_phase(session, GOLD_STEPS, windows, done, max_workers, dict.fromkeys(GOLD_STEPS, start))
+            if failures:
+                raise RuntimeError("Gold backfill had failed windows; rerun to resume.")
+        logging.info("Backfill complete.")
+    finally:
+        session.close()
+        logging.info("Snowpark session closed.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Re-process an event-time range through Silver and Gold in parallel windows.")
+    parser.add_argument("--start", type=datetime.fromisoformat, required=True, help="Range start (inclusive), e.g. 2024-01-01")
+    parser.add_argument("--end", type=datetime.fromisoformat, required=True, help="Range end (exclusive), e.g. 2024-02-01")
+    parser.add_argument("--window-hours", type=int, default=24, help="Width of each window")
+    parser.add_argument("--step", choices=["all", "silver", "gold"], default="all")
+    parser.add_argument("--max-workers", type=int, default=4, help="Windows processed concurrently (1 = sequential)")
+    parser.add_argument("--restart", action="store_true", help="Forget finished windows in this range and redo them")
+    parser.add_argument("--env", default=".env", help="Path to .env file")
+    profiling.add_profile_arguments(parser)
+    args = parser.parse_args()
+    profiling.configure(args.profile, "backfill", args.profile_dir)
+    main(args.start, args.end, args.window_hours, args.step, args.max_workers, args.restart, args.env)
@@ -0,0 +1,436 @@
+import os
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+import platform
+import resource
+import tempfile
+import threading
+import statistics
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+import numpy as np
+import pandas as pd
+from simulate_events import generate_csv_events, generate_json_sessions
+from local_backend import LocalBackend, dimension_table
+from dedupe_index import ScalableBloomFilter, key_hashes
+import dimensions
+
+sys.path.insert(0, str(Path(__file__).resolve().parent / "gold_aggregation"))
+import gold_aggregation as gold
+import event_time
+
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+DASHBOARD_DIR = BASE_DIR / "dashboard"
+BASELINE_PATH = Path(__file__).resolve().parent / "benchmark_baseline.json"
+
+DEFAULT_SIZES = [1_000, 10_000, 100_000]
+# Silver rows per table for the stages run on the DuckDB stand-in (local_warehouse.py)
+DEFAULT_WAREHOUSE_SIZES = [1_000_000, 10_000_000]
+DEFAULT_WAREHOUSE_REPEAT = 3
+# Share of the incremental delta in the Silver tables, and of its rows that arrive late
+INCREMENTAL_SHARE = 0.1
+LATE_SHARE = 0.01
+DEFAULT_THRESHOLD = 0.25
+# Runs shorter than this are dominated by timer and scheduler noise, so their throughput is not gated
+MIN_GATED_SECONDS = 0.05
+# simulate_events.py draws 2-6 events per session
+EVENTS_PER_SESSION = 4
+
+
+def current_rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        # No /proc (macOS): fall back to the process high-water mark
+        scale = 1 if sys.platform == "darwin" else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+
+class PeakRssSampler:
+    """Samples RSS on a background thread so each benchmark gets its own peak, not the process high-water mark."""
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self.peak = max(self.peak, current_rss_bytes())
+            self._stop.wait(self.interval)
+
+    def __enter__(self) -> "PeakRssSampler":
+        self.peak = current_rss_bytes()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss_bytes())
+
+
+def measure(name: str, scale: int, rows: int, run: Callable[[], None], setup: Callable[[], None] = lambda: None,
+            repeat: int = 3, gated: bool = True) -> Dict:
+    """Best and median wall time and worst peak RSS over `repeat` runs; setup runs before each and is not timed.
+
+    Throughput is taken from the best run, which is the least affected by other load on the machine. Results with
+    gated=False are reported but never compared against the baseline.
+    """
+    walls, peaks = [], []
+    # Keep the stages' own progress logging out of the report
+    logging.disable(logging.INFO)
+    try:
+        for _ in range(repeat):
+            setup()
+            with PeakRssSampler() as sampler:
+                started = time.perf_counter()
+                run()
+                walls.append(time.perf_counter() - started)
+            peaks.append(sampler.peak)
+    finally:
+        logging.disable(logging.NOTSET)
+    wall = min(walls)
+    result = {
+        "benchmark": name,
+        "scale": scale,
+        "rows": rows,
+        "wall_seconds": round(wall, 6),
+        "wall_seconds_median": round(statistics.median(walls), 6),
+        "rows_per_second": round(rows / wall, 1) if wall > 0 else None,
+        "peak_rss_mb": round(max(peaks) / 2**20, 1),
+        "gated": gated,
+    }
+    logging.info(
+        f"{name:<22} scale={scale:>10,} rows={rows:>10,} {wall:8.3f}s "
+        f"{result['rows_per_second'] or 0:>14,.0f} rows/s peak RSS {result['peak_rss_mb']:,.1f} MB"
+    )
+    return result
+
+
+def snapshot(backend: LocalBackend, tables: List[str]) -> Dict[str, pd.DataFrame]:
+    return {name: backend.tables[name].copy() for name in tables}
+
+
+def restore(backend: LocalBackend, tables: Dict[str, pd.DataFrame]) -> None:
+    """Reset the backend to empty tables except for copies of `tables`."""
+    fresh = LocalBackend().tables
+    fresh.update({name: frame.copy() for name, frame in tables.items()})
+    backend.tables = fresh
+
+
+DIMENSION_TABLES = [dimension_table(dim) for dim in dimensions.DIMENSIONS.values()]
+GOLD_KEYS = {"user_metrics": ("silver_events", "user_key"), "product_metrics": ("silver_events", "product_key"),
+             "session_metrics": ("silver_sessions", "session_id")}
+# Gold tables plus the dimensions the dashboard decodes keys with
+DASHBOARD_TABLES = ["user_metrics", "session_metrics", "product_metrics", "dim_user", "dim_product"]
+
+
+def dashboard_benchmark(gold: Dict[str, pd.DataFrame], workdir: Path) -> Callable[[], None]:
+    """Run the dashboard's local-cache query functions over the given Gold tables."""
+    sys.path.insert(0, str(DASHBOARD_DIR))
+    from utils import queries
+    from utils.local_cache import GoldTableCache, TABLE_SOURCES
+
+    cache_dir = workdir / "gold_cache"
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    frames = {}
+    for name in DASHBOARD_TABLES:
+        frames[name] = gold[name].rename(columns=str.upper)
+        frames[name].to_parquet(cache_dir / f"{name}.parquet", index=False)
+    # The dimensions are cached under their local name but probed by their qualified one
+    names = {TABLE_SOURCES.get(name, name): name for name in frames}
+
+    def fetch(query: str, params) -> pd.DataFrame:
+        # Only the freshness probe reaches here: the Parquet copies are already current
+        column, table = query.split(" AS ")[1].split(" FROM ")
+        table = names[table.split()[0]]
+        return pd.DataFrame({column: [frames[table][column].max()]})
+
+    cache = GoldTableCache(cache_dir, fetch, refresh_seconds=10**9)
+    queries.get_local_cache = lambda: cache
+    start, end = str(date.today() - timedelta(days=30)), str(date.today() + timedelta(days=1))
+
+    def run() -> None:
+        queries.get_kpis(start, end)
+        queries.get_user_behavior_histograms(start, end)
+        queries.get_user_behavior_count(start, end)
+        queries.get_user_behavior_page(start, end, 0)
+        queries.get_funnel_metrics(start, end)
+        queries.get_top_products(start, end)
+    return run
+
+
+def smoke_check(backend: LocalBackend) -> None:
+    """Every key in Silver has exactly one Gold row; the local stages are a smoke test, not a timing gate."""
+    for table, (source, key) in GOLD_KEYS.items():
+        expected = backend.tables[source][key].nunique()
+        gold = backend.tables[table]
+        if expected == 0 or len(gold) != expected or gold[key].duplicated().any():
+            raise RuntimeError(f"Local backend smoke check failed: {table} has {len(gold):,} rows for {expected:,} {key}s")
+
+
+def synthetic_silver(rows: int, seed: int, ingested_at: pd.Timestamp, late_share: float = 0.0,
+                     first_id: int = 0) -> Dict[str, pd.DataFrame]:
+    """Keyed Silver events and session events, rows of each, with event times over the day before ingested_at.
+
+    late_share of the rows get event times a week earlier, which is late against any watermark the earlier rows set.
+    """
+    rng = np.random.default_rng(seed)
+    num_users, num_products = max(10, rows // 20), 500
+    event_times = ingested_at - pd.to_timedelta(rng.integers(0, 86_400, rows), unit="s")
+    late = rng.random(rows) < late_share
+    event_times = event_times.where(~late, event_times - pd.Timedelta(days=7))
+    events = pd.DataFrame({
+        "event_id": np.arange(first_id, first_id + rows, dtype=np.int64),
+        "user_key": rng.integers(1, num_users + 1, rows, dtype=np.int64),
+        "event_type_code": rng.integers(1, len(dimensions.EVENT_TYPES) + 1, rows).astype(np.int16),
+        "product_key": rng.integers(1, num_products + 1, rows, dtype=np.int64),
+        "timestamp": event_times,
+        "ingested_at": ingested_at,
+    })
+    session_number = (first_id + np.arange(rows)) // EVENTS_PER_SESSION
+    start = ingested_at - pd.to_timedelta(rng.integers(3_600, 86_400, rows), unit="s")
+    sessions = pd.DataFrame({
+        "session_id": pd.Series(session_number).map("s{}".format),
+        "user_key": events["user_key"],
+        "start_time": start,
+        "end_time": start + pd.to_timedelta(rng.integers(60, 3_600, rows), unit="s"),
+        "event_type_code": events["event_type_code"],
+        "product_key": events["product_key"],
+        "browser_code": rng.integers(1, 6, rows).astype(np.int16),
+        "operating_system_code": rng.integers(1, 6, rows).astype(np.int16),
+        "country": "US",
+        "city_code": rng.integers(1, 50, rows).astype(np.int16),
+        "event_timestamp": event_times,
+        "ingested_at": ingested_at,
+    })
+    frames = {gold.SILVER_EVENTS: events, gold.SILVER_SESSIONS: sessions}
+    # Microseconds, like TIMESTAMP_NTZ; DuckDB cannot cast the second-resolution columns pandas infers here
+    for frame in frames.values():
+        for column in frame.select_dtypes("datetime").columns:
+            frame[column] = frame[column].astype("datetime64[us]")
+    return frames
+
+
+def append_silver(warehouse: Any, frames: Dict[str, pd.DataFrame]) -> None:
+    for table, frame in frames.items():
+        warehouse.con.register("silver_frame", frame)
+        if warehouse.con.execute(
+            "SELECT COUNT(*) FROM information_schema.tables WHERE table_schema || '.' || table_name = ?", [table]
+        ).fetchone()[0]:
+            warehouse.con.execute(f"INSERT INTO {table} SELECT * FROM silver_frame")
+        else:
+            warehouse.con.execute(f"CREATE TABLE {table} AS SELECT * FROM silver_frame")
+        warehouse.con.unregister("silver_frame")
+
+
+# Everything run_metric_specs writes, so each timed run starts from the same state
+GOLD_STATE_TABLES = [spec.table for spec in gold.METRIC_SPECS.values()] + [
+    event_time.WATERMARKS_TABLE, event_time.LATENESS_TABLE,
+]
+
+
+def save_gold_state(warehouse: Any) -> None:
+    for table in GOLD_STATE_TABLES:
+        warehouse.con.execute(f"CREATE OR REPLACE TABLE {table}_SAVED AS SELECT * FROM {table}")
+
+
+def restore_gold_state(warehouse: Any) -> None:
+    for table in GOLD_STATE_TABLES:
+        warehouse.con.execute(f"DELETE FROM {table}")
+        warehouse.con.execute(f"INSERT INTO {table} SELECT * FROM {table}_SAVED")
+
+
+def duckdb_version() -> str:
+    import duckdb
+    return duckdb.__version__
+
+
+def run_warehouse_suite(sizes: List[int], repeat: int, seed: int) -> List[Dict]:
+    """Gold's own SQL (ensure_gold_tables, run_metric_specs) on the DuckDB stand-in, and the dedupe index Bronze ->
+    Silver runs on the client, over synthetic keyed Silver tables of each size."""
+    from local_warehouse import LocalWarehouse
+    specs = list(gold.METRIC_SPECS.values())
+    lateness = timedelta(minutes=30)
+    results = []
+    for size in sizes:
+        delta_rows = int(size * INCREMENTAL_SHARE)
+        base_rows = size - delta_rows
+        base_at = pd.Timestamp("2025-01-01 12:00:00")
+        delta_at = base_at + pd.Timedelta(hours=1)
+
+        warehouse = LocalWarehouse()
+        try:
+            append_silver(warehouse, synthetic_silver(base_rows, seed, base_at))
+            logging.disable(logging.INFO)
+            try:
+                gold.ensure_gold_tables(warehouse)
+            finally:
+                logging.disable(logging.NOTSET)
+            save_gold_state(warehouse)
+
+            # Full load: every Silver row goes into empty Gold tables
+            results.append(measure("silver_to_gold", size, 2 * base_rows,
+                                   lambda: gold.run_metric_specs(warehouse, specs, lateness),
+                                   lambda: restore_gold_state(warehouse), repeat))
+
+            # Incremental: a delta past the Gold watermarks, a few of its rows late, merged into the Gold tables the
+            # last full load left behind
+            save_gold_state(warehouse)
+            append_silver(warehouse, synthetic_silver(delta_rows, seed + 1, delta_at, LATE_SHARE, first_id=base_rows))
+            results.append(measure("silver_to_gold_incremental", size, 2 * delta_rows,
+                                   lambda: gold.run_metric_specs(warehouse, specs, lateness),
+                                   lambda: restore_gold_state(warehouse), repeat))
+        finally:
+            warehouse.close()
+
+        # Bronze -> Silver's client-side work per delta: hash the keys, probe the filter, then index them
+        keys = pd.DataFrame({"event_id": np.arange(size, dtype=np.int64)})
+        filters: Dict[str, ScalableBloomFilter] = {}
+
+        def empty_filter() -> None:
+            filters["events"] = ScalableBloomFilter(size)
+
+        def dedupe() -> None:
+            h1, h2 = key_hashes(keys)
+            filters["events"].contains(h1, h2)
+            filters["events"].add(h1, h2)
+        results.append(measure("silver_dedupe_index", size, size, dedupe, empty_filter, repeat))
+    return results
+
+
+def run_suite(sizes: List[int], repeat: int, seed: int, include_dashboard: bool = True) -> List[Dict]:
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = Path(tmp)
+        for size in sizes:
+            csv_path, json_path = workdir / f"events_{size}.csv", workdir / f"sessions_{size}.json"
+            num_users, num_sessions = max(10, size // 20), max(1, size // EVENTS_PER_SESSION)
+
+            def seeded() -> None:
+                random.seed(seed)
+                np.random.seed(seed)
+
+            def simulate() -> None:
+                generate_csv_events(num_users, size, csv_path)
+                generate_json_sessions(num_users, num_sessions, json_path)
+            results.append(measure("simulate_events", size, size + num_sessions * EVENTS_PER_SESSION,
+                                   simulate, seeded, repeat))
+
+            backend = LocalBackend()
+            results.append(measure("local_ingest", size, size + num_sessions,
+                                   lambda: backend.ingest([csv_path], [json_path]),
+                                   lambda: restore(backend, {}), repeat, gated=False))
+
+            bronze = snapshot(backend, ["bronze_events", "bronze_sessions"])
+            bronze_rows = sum(len(frame) for frame in bronze.values())
+            results.append(measure("local_bronze_to_silver", size, bronze_rows, backend.bronze_to_silver,
+                                   lambda: restore(backend, bronze), repeat, gated=False))
+
+            silver = snapshot(backend, ["silver_events", "silver_sessions", *DIMENSION_TABLES])
+            silver_rows = len(silver["silver_events"]) + len(silver["silver_sessions"])
+            results.append(measure("local_silver_to_gold", size, silver_rows, backend.silver_to_gold,
+                                   lambda: restore(backend, silver), repeat, gated=False))
+            smoke_check(backend)
+
+            if include_dashboard:
+                gold = snapshot(backend, DASHBOARD_TABLES)
+                gold_rows = sum(len(gold[name]) for name in ["user_metrics", "session_metrics", "product_metrics"])
+                results.append(measure("dashboard_queries", size, gold_rows,
+                                       dashboard_benchmark(gold, workdir / str(size)), repeat=repeat))
+    return results
+
+
+def compare(results: List[Dict], baseline: Dict, threshold: float) -> List[str]:
+    """Regressions: throughput below (1 - threshold) x baseline, or peak RSS above (1 + threshold) x baseline.
+
+    The local_* stages are not gated: they run on LocalBackend, a pandas smoke-test harness whose timings say
+    nothing about the Snowpark stages. Gold is gated on its own SQL run by local_warehouse.py instead."""
+    expected = {(r["benchmark"], r["scale"]): r for r in baseline["results"]}
+    regressions = []
+    for result in results:
+        base = expected.get((result["benchmark"], result["scale"]))
+        if base is None or not result.get("gated", True):
+            continue
+        label = f"{result['benchmark']} @ {result['scale']:,}"
+        gated = base["wall_seconds"] >= MIN_GATED_SECONDS and base["rows_per_second"]
+        if gated and result["rows_per_second"] < base["rows_per_second"] * (1 - threshold):
+            regressions.append(
+                f"{label}: {result['rows_per_second']:,.0f} rows/s vs baseline {base['rows_per_second']:,.0f}"
+            )
+        if result["peak_rss_mb"] > base["peak_rss_mb"] * (1 + threshold):
+            regressions.append(f"{label}: peak RSS {result['peak_rss_mb']:,.1f} MB vs baseline {base['peak_rss_mb']:,.1f} MB")
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the simulator, Gold's SQL, the dedupe index and the dashboard queries, and smoke-test the stages on the local backend.")
+    parser.add_argument("--sizes", default=",".join(str(s) for s in DEFAULT_SIZES),
+                        help="Comma-separated event counts for the simulator, local backend and dashboard, e.g. 1000,10000,100000")
+    parser.add_argument("--warehouse-sizes", default=",".join(str(s) for s in DEFAULT_WAREHOUSE_SIZES),
+                        help="Comma-separated Silver rows per table for Gold on DuckDB and the dedupe index; empty to skip")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per benchmark; throughput uses the fastest")
+    parser.add_argument("--warehouse-repeat", type=int, default=DEFAULT_WAREHOUSE_REPEAT, help="Runs per warehouse benchmark")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--skip-dashboard", action="store_true", help="Skip the dashboard query benchmark")
+    parser.add_argument("--output", type=Path, default=None, help="Write results as JSON to this file")
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH, help="Baseline JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="Allowed relative regression (0.25 = 25%%)")
+    parser.add_argument("--save-baseline", action="store_true", help="Overwrite the baseline with this run instead of comparing")
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    warehouse_sizes = [int(size) for size in args.warehouse_sizes.split(",") if size]
+    results = run_suite(sizes, args.repeat, args.seed, include_dashboard=not args.skip_dashboard)
+    results += run_warehouse_suite(warehouse_sizes, args.warehouse_repeat, args.seed)
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "processor": platform.processor() or platform.machine(),
+            "cpu_count": os.cpu_count(),
+            "pandas": pd.__version__,
+            "duckdb": duckdb_version(),
+            "seed": args.seed,
+            "repeat": args.repeat,
+            "warehouse_repeat": args.warehouse_repeat,
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+    }
+
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2))
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps(report, indent=2) + "\n")
+        logging.info(f"Baseline written to {args.baseline}")
+        return 0
+    if not args.baseline.exists():
+        logging.warning(f"No baseline at {args.baseline}; run with --save-baseline to create one.")
+        return 0
+
+    regressions = compare(results, json.loads(args.baseline.read_text()), args.threshold)
+    for regression in regressions:
+        logging.error(f"Regression: {regression}")
+    if regressions:
+        return 1
+    logging.info(f"No regressions beyond {args.threshold:.0%} against {args.baseline}.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,148 @@
+import ast
+import sys
+import json
+import time
+import logging
+import argparse
+import statistics
+import subprocess
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+
+SCRIPTS_DIR = Path(__file__).resolve().parent
+DASHBOARD_DIR = SCRIPTS_DIR.parent / "dashboard"
+
+# Script entry points are timed on `--help`: argument parsing is all they do before the first real
+# work, so anything slower is import cost that every Airflow task start pays.
+SCRIPT_ENTRY_POINTS: Dict[str, str] = {
+    "simulate_events": "simulate_events.py",
+    "ingestion_to_snowflake": "ingestion_to_snowflake.py",
+    "check_new_data": "check_new_data.py",
+    "bronze_to_silver": "bronze_to_silver/bronze_to_silver.py",
+    "gold_aggregation": "gold_aggregation/gold_aggregation.py",
+    "anomaly_detection": "anomaly_detection/anomaly_detection.py",
+    "micro_batch": "micro_batch.py",
+    "backfill": "backfill.py",
+    "local_lake": "local_lake.py",
+}
+
+# Seconds of startup on top of a bare interpreter. Scripts that touch Snowflake must stay well under
+# the ~1s the connector or Snowpark take to import; the rest need pandas (and numpy/pyarrow/streamlit).
+DEFAULT_BUDGET_SECONDS = 0.3
+BUDGETS: Dict[str, float] = {
+    "anomaly_detection": 1.0,
+    "local_lake": 1.0,
+}
+DASHBOARD_BUDGET_SECONDS = 1.6
+
+
+def dashboard_entry_points() -> Dict[str, Path]:
+    return {
+        f"dashboard/{path.stem}": path
+        for path in [DASHBOARD_DIR / "app.py", *sorted((DASHBOARD_DIR / "pages").glob("*.py"))]
+    }
+
+
+def import_only_source(path: Path) -> str:
+    """The top-level import statements of a Streamlit script, i.e. what a page switch imports before it renders."""
+    tree = ast.parse(path.read_text(encoding="utf-8"))
+    imports = [node for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom))]
+    return ast.unparse(ast.Module(body=imports, type_ignores=[]))
+
+
+def run_once(argv: List[str], cwd: Path) -> float:
+    started = time.perf_counter()
+    result = subprocess.run(argv, cwd=cwd, capture_output=True, text=True)
+    elapsed = time.perf_counter() - started
+    if result.returncode != 0:
+        raise RuntimeError(f"{' '.join(argv)} exited with {result.returncode}: {result.stderr.strip()[-500:]}")
+    return elapsed
+
+
+def time_command(argv: List[str], cwd: Path, repeat: int) -> Tuple[float, float]:
+    """Best and median wall time of `repeat` fresh interpreter runs."""
+    walls = [run_once(argv, cwd) for _ in range(repeat)]
+    return min(walls), statistics.median(walls)
+
+
+def slowest_imports(argv: List[str], cwd: Path, top: int = 5) -> List[Tuple[str, float]]:
+    """Top-level imports by cumulative time, from `python -X importtime`."""
+    result = subprocess.run([argv[0], "-X", "importtime", *argv[1:]], cwd=cwd, capture_output=True, text=True)
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if cumulative.strip().isdigit() and not name.startswith("  "):
+            imports.append((name.strip(), int(cumulative) / 1e6))
+    return sorted(imports, key=lambda item: item[1], reverse=True)[:top]
+
+
+def commands() -> Dict[str, Tuple[List[str], Path, float]]:
+    entries = {
+        name: ([sys.executable, str(SCRIPTS_DIR / script), "--help"], SCRIPTS_DIR, BUDGETS.get(name, DEFAULT_BUDGET_SECONDS))
+        for name, script in SCRIPT_ENTRY_POINTS.items()
+    }
+    for name, path in dashboard_entry_points().items():
+        entries[name] = ([sys.executable, "-c", import_only_source(path)], DASHBOARD_DIR, DASHBOARD_BUDGET_SECONDS)
+    return entries
+
+
+def run_suite(repeat: int, only: Optional[List[str]] = None, budget_scale: float = 1.0) -> List[Dict]:
+    interpreter, _ = time_command([sys.executable, "-c", "pass"], SCRIPTS_DIR, repeat)
+    logging.info(f"{'interpreter':<28} {interpreter:6.3f}s (subtracted from every entry point)")
+    results = []
+    for name, (argv, cwd, budget) in commands().items():
+        if only and name not in only:
+            continue
+        budget *= budget_scale
+        best, median = time_command(argv, cwd, repeat)
+        startup = max(0.0, best - interpreter)
+        result = {
+            "entry_point": name,
+            "startup_seconds": round(startup, 4),
+            "wall_seconds": round(best, 4),
+            "wall_seconds_median": round(median, 4),
+            "budget_seconds": round(budget, 3),
+            "within_budget": startup <= budget,
+        }
+        if not result["within_budget"]:
+            result["slowest_imports"] = slowest_imports(argv, cwd)
+        logging.info(
+            f"{name:<28} {startup:6.3f}s startup (budget {budget:.2f}s)"
+            f"{'' if result['within_budget'] else '  OVER BUDGET'}"
+        )
+        results.append(result)
+    return results
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Measure the cold-start import time of every entry point against its budget.")
+    parser.add_argument("--repeat", type=int, default=5, help="Fresh interpreter runs per entry point; the fastest counts")
+    parser.add_argument("--only", default=None, help="Comma-separated entry points to measure, e.g. bronze_to_silver,dashboard/app")
+    parser.add_argument("--budget-scale", type=float, default=1.0, help="Multiply every budget, e.g. 2 on a slow CI runner")
+    parser.add_argument("--output", type=Path, default=None, help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    results = run_suite(args.repeat, args.only.split(",") if args.only else None, args.budget_scale)
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2))
+
+    over = [result for result in results if not result["within_budget"]]
+    for result in over:
+        imports = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in result["slowest_imports"])
+        logging.error(
+            f"{result['entry_point']} starts in {result['startup_seconds']:.2f}s, over its "
+            f"{result['budget_seconds']:.2f}s budget; slowest imports: {imports}"
+        )
+    if over:
+        return 1
+    logging.info(f"All {len(results)} entry points start within budget.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
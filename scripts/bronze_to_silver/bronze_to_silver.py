@@ -1,11 +1,24 @@
+from __future__ import annotations
 import os 
+import sys
 import argparse
 import logging
-from snowflake.snowpark import Session
-from snowflake.snowpark.functions import col, flatten, lower, max as sf_max ,when_matched, when_not_matched, call_table_function
-from snowflake.snowpark.table import  MergeResult 
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, Optional
 from dotenv import load_dotenv
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from pipeline_telemetry import RunTelemetry, note
+from warehouse_sizing import WarehouseController, estimate_delta
+from staging import staged
+import dimensions
+import profiling
+
+#Snowpark takes over a second to import, so it is loaded by the functions that use it
+if TYPE_CHECKING:
+    from snowflake.snowpark import Session, DataFrame
+    from snowflake.snowpark.table import MergeResult, Table
+    from dedupe_index import DedupeIndex
 
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
@@ -22,6 +35,16 @@ EVENTS_SILVER_TABLE = f"{SILVER_SCHEMA}.EVENTS_CLEANED"
 SESSIONS_SILVER_TABLE = f"{SILVER_SCHEMA}.SESSION_EVENTS"
 EVENTS_STAGING_TABLE = f"{STAGING_SCHEMA}.EVENTS_STAGE"
 SESSIONS_STAGING_TABLE = f"{STAGING_SCHEMA}.SESSIONS_STAGE"
+# Incremental runs filter on ingested_at and backfills/anomaly detection on event time, so both lead the
+# clustering key; day granularity keeps automatic reclustering cheap
+CLUSTER_KEYS = {
+    EVENTS_SILVER_TABLE: "TO_DATE(ingested_at), TO_DATE(timestamp)",
+    SESSIONS_SILVER_TABLE: "TO_DATE(ingested_at), TO_DATE(event_timestamp)",
+}
+#Where a delta none of whose rows reached Silver moves the watermark, since MAX(ingested_at) of Silver cannot
+INGESTED_WATERMARKS_TABLE = f"{STAGING_SCHEMA}.INGESTED_WATERMARKS"
+EVENTS_KEYS = ["event_id"]
+SESSION_EVENTS_KEYS = ["session_id", "event_type_code", "event_timestamp"]
 
 
 def ensure_tables(session: Session) -> None:
@@ -30,34 +53,49 @@ def ensure_tables(session: Session) -> None:
     create_events_sql = f"""
     CREATE TABLE IF NOT EXISTS {EVENTS_SILVER_TABLE} (
         event_id INT,
-        user_id STRING,
-        event_type STRING,
-        product_id STRING,
+        user_key INT,
+        event_type_code SMALLINT,
+        product_key INT,
         timestamp TIMESTAMP,
         ingested_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP()
     )
+    CLUSTER BY ({CLUSTER_KEYS[EVENTS_SILVER_TABLE]})
     """
 
     create_sessions_sql = f"""
     CREATE TABLE IF NOT EXISTS {SESSIONS_SILVER_TABLE} (
         session_id STRING,
-        user_id STRING,
+        user_key INT,
         start_time TIMESTAMP,
         end_time TIMESTAMP,
-        event_type STRING,
-        product_id STRING,
-        browser STRING,
-        operating_system STRING,
+        event_type_code SMALLINT,
+        product_key INT,
+        browser_code SMALLINT,
+        operating_system_code SMALLINT,
         country STRING,
-        city STRING,
+        city_code SMALLINT,
        
         event_timestamp TIMESTAMP,
         ingested_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP()
     )
+    CLUSTER BY ({CLUSTER_KEYS[SESSIONS_SILVER_TABLE]})
+    """
+
+    create_watermarks_sql = f"""
+    CREATE TABLE IF NOT EXISTS {INGESTED_WATERMARKS_TABLE} (
+        table_name STRING,
+        ingested_watermark TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP()
+    )
     """
 
+    dimensions.ensure_dimension_tables(session)
     session.sql(create_events_sql).collect()
     session.sql(create_sessions_sql).collect()
+    session.sql(create_watermarks_sql).collect()
+    #Tables created before the clustering keys were added get them here
+    for table, cluster_key in CLUSTER_KEYS.items():
+        session.sql(f"ALTER TABLE {table} CLUSTER BY ({cluster_key})").collect()
 
     logging.info("Silver tables ensured.")
 
@@ -65,6 +103,7 @@ def ensure_tables(session: Session) -> None:
 
 def get_last_ingested_at(session: Session, table_name: str, timestamp_col: str = "ingested_at"):
     """Return latest ingested_at timestamp or default."""
+    from snowflake.snowpark.functions import col, max as sf_max
     try:
         max_ts = session.table(table_name).select(sf_max(col(timestamp_col))).collect()[0][0]
         if max_ts is None:
@@ -78,15 +117,50 @@ def get_last_ingested_at(session: Session, table_name: str, timestamp_col: str =
 
 
 
-def clean_events(session: Session) -> None:
-    logging.info("Starting clean events incremental load...")
-    last_ingested_at = get_last_ingested_at(session, EVENTS_SILVER_TABLE)
+def get_delta_watermark(session: Session, table_name: str):
+    """Where the next incremental run starts: the table's own MAX(ingested_at), or the watermark
+    advance_watermark() recorded for it when that is later.
 
-    events_df = session.table(EVENTS_TABLE).filter(col("ingested_at").cast("timestamp") > last_ingested_at)
-    if events_df.count() == 0:
-        logging.info("No new event records to process.")
+    Backfills replay Bronze only up to get_last_ingested_at(): a replayed duplicate would otherwise stamp its
+    Silver row with an ingested_at past Gold's watermark."""
+    last_ingested_at = get_last_ingested_at(session, table_name)
+    try:
+        recorded = session.sql(
+            f"SELECT MAX(ingested_watermark) FROM {INGESTED_WATERMARKS_TABLE} WHERE table_name = ?",
+            params=[table_name],
+        ).collect()[0][0]
+    except Exception as e:
+        logging.warning(f"Could not read the recorded watermark of {table_name}: {e}")
+        return last_ingested_at
+    #A string is the full-load default: the table is empty
+    if recorded is not None and (isinstance(last_ingested_at, str) or recorded > last_ingested_at):
+        logging.info(f"Skipping past the recorded watermark of {table_name}: {recorded}")
+        return recorded
+    return last_ingested_at
+
+
+def advance_watermark(session: Session, table_name: str, delta_df: DataFrame) -> None:
+    """Record the latest ingested_at of a Bronze delta that left no rows in table_name, so the next run starts
+    after it instead of cleaning and probing the same rows again."""
+    from snowflake.snowpark.functions import col, max as sf_max
+    latest = delta_df.select(sf_max(col("ingested_at"))).collect()[0][0]
+    if latest is None:
         return
-    events_cleaned = (
+    session.sql(f"""
+        MERGE INTO {INGESTED_WATERMARKS_TABLE} AS target
+        USING (SELECT ? AS table_name, ?::TIMESTAMP AS ingested_watermark) AS source
+        ON target.table_name = source.table_name
+        WHEN MATCHED AND source.ingested_watermark > target.ingested_watermark THEN
+            UPDATE SET ingested_watermark = source.ingested_watermark, updated_at = CURRENT_TIMESTAMP()
+        WHEN NOT MATCHED THEN
+            INSERT (table_name, ingested_watermark) VALUES (source.table_name, source.ingested_watermark)
+    """, params=[table_name, str(latest)]).collect()
+    logging.info(f"{table_name} watermark moved to {latest} past a delta with no new rows.")
+
+
+def build_events_cleaned(events_df: DataFrame) -> DataFrame:
+    from snowflake.snowpark.functions import col, lower
+    return (
         events_df
         .with_column("event_type",lower(col("event_type")))
         .filter(
@@ -95,15 +169,95 @@ def clean_events(session: Session) -> None:
             (col("event_type").is_not_null()) &
             (col("timestamp").is_not_null()) 
         )
-        .drop_duplicates(["event_id"])
+        .drop_duplicates(EVENTS_KEYS)
+    )
+
+
+def merge_events(target_table: Table, staging_df: DataFrame) -> MergeResult:
+    from snowflake.snowpark.functions import when_matched, when_not_matched
+    return target_table.merge(
+        staging_df,
+        target_table["event_id"] == staging_df["event_id"],
+        [
+            when_matched().update({
+                "user_key": staging_df["user_key"],
+                "event_type_code": staging_df["event_type_code"],
+                "product_key": staging_df["product_key"],
+                "timestamp": staging_df["timestamp"],
+                "ingested_at": staging_df["ingested_at"]
+            }),
+            when_not_matched().insert({
+                "event_id": staging_df["event_id"],
+                "user_key": staging_df["user_key"],
+                "event_type_code": staging_df["event_type_code"],
+                "product_key": staging_df["product_key"],
+                "timestamp": staging_df["timestamp"],
+                "ingested_at": staging_df["ingested_at"]
+            })
+        ]
     )
-    if events_cleaned.count() == 0:
+
+
+def dedupe_indexes(session: Session, **kwargs) -> Dict[str, DedupeIndex]:
+    """Seen-key indexes of the two Silver tables, configured from DEDUPE_INDEX_* (see dedupe_index.py)."""
+    from dedupe_index import DedupeIndex
+    return {
+        "events": DedupeIndex.from_env(session, "events_cleaned", EVENTS_KEYS, EVENTS_SILVER_TABLE, **kwargs),
+        "sessions": DedupeIndex.from_env(session, "session_events", SESSION_EVENTS_KEYS, SESSIONS_SILVER_TABLE, **kwargs),
+    }
+
+
+def bronze_events_delta(session: Session) -> DataFrame:
+    from snowflake.snowpark.functions import col
+    last_ingested_at = get_delta_watermark(session, EVENTS_SILVER_TABLE)
+    return build_events_cleaned(session.table(EVENTS_TABLE).filter(col("ingested_at") > last_ingested_at))
+
+
+def bronze_sessions_delta(session: Session) -> DataFrame:
+    from snowflake.snowpark.functions import col
+    last_ingested_at = get_delta_watermark(session, SESSIONS_SILVER_TABLE)
+    return build_session_events_flat(session.table(SESSIONS_TABLE).filter(col("ingested_at") > last_ingested_at))
+
+
+def register_dimensions(session: Session) -> None:
+    """Register the dimension values of both pending Bronze deltas. Runs before the events and sessions steps,
+    which may run in parallel and only look keys up (see dimensions.py)."""
+    logging.info("Registering dimension values of the pending Bronze rows...")
+    added: Dict[str, int] = {}
+    for delta in [bronze_events_delta(session), bronze_sessions_delta(session)]:
+        for table, rows in dimensions.register(session, delta).items():
+            added[table] = added.get(table, 0) + rows
+    logging.info("New dimension entries: " + ", ".join(f"{table} {rows}" for table, rows in added.items()))
+
+
+def clean_events(session: Session, dedupe: Optional[DedupeIndex] = None) -> None:
+    from snowflake.snowpark.functions import col
+    logging.info("Starting clean events incremental load...")
+    last_ingested_at = get_delta_watermark(session, EVENTS_SILVER_TABLE)
+
+    events_df = session.table(EVENTS_TABLE).filter(col("ingested_at") > last_ingested_at)
+    rows_in = events_df.count()
+    note(rows_in=rows_in)
+    if rows_in == 0:
+        logging.info("No new event records to process.")
+        return
+    events_cleaned = build_events_cleaned(events_df)
+    rows_out = events_cleaned.count()
+    note(rows_out=rows_out)
+    if rows_out == 0:
         logging.info("No valid records after cleaning")
+        advance_watermark(session, EVENTS_SILVER_TABLE, events_df)
         return
-    
-    # Write staging table and merge
-    logging.info(f"Writing cleaned events to {EVENTS_STAGING_TABLE}...")
-    events_cleaned.write.save_as_table(EVENTS_STAGING_TABLE, mode="overwrite")
+    #Silver stores the surrogate keys of user, product and event type, registered by register_dimensions()
+    events_cleaned = dimensions.encode(session, events_cleaned)
+    #Drop events already merged by an earlier batch
+    dropped = 0
+    if dedupe is not None:
+        events_cleaned, dropped = dedupe.drop_seen(events_cleaned)
+        if dropped == rows_out:
+            logging.info("All cleaned events were already in silver.")
+            advance_watermark(session, EVENTS_SILVER_TABLE, events_df)
+            return
 
     #If silver table doesn't exist create it with the new cleaned events
     try:
@@ -111,48 +265,27 @@ def clean_events(session: Session) -> None:
     except Exception:
         logging.info(f"Target table {EVENTS_SILVER_TABLE} not found; creating new.")
         events_cleaned.write.save_as_table(EVENTS_SILVER_TABLE, mode="overwrite")
+        note(rows_inserted=rows_out)
+        if dedupe is not None:
+            dedupe.commit()
         return
 
-    #If silver table does exists we continue with the merge
-    staging_df = session.table(EVENTS_STAGING_TABLE)
-    try:
-        merge_result: MergeResult  = target_table.merge(
-            staging_df,
-            target_table["event_id"] == staging_df["event_id"],
-            [
-                when_matched().update({
-                    "user_id": staging_df["user_id"],
-                    "event_type": staging_df["event_type"],
-                    "product_id": staging_df["product_id"],
-                    "timestamp": staging_df["timestamp"],
-                    "ingested_at": staging_df["ingested_at"]
-                }),
-                when_not_matched().insert({
-                    "event_id": staging_df["event_id"],
-                    "user_id": staging_df["user_id"],
-                    "event_type": staging_df["event_type"],
-                    "product_id": staging_df["product_id"],
-                    "timestamp": staging_df["timestamp"],
-                    "ingested_at": staging_df["ingested_at"]
-                })
-            ]
-        )
-        logging.info(f"Events merged: {merge_result.rows_inserted} inserted, {merge_result.rows_updated} updated.")
-    except Exception as e:
-        logging.error(f"Merge failed for {EVENTS_SILVER_TABLE}: {e}")
-        raise
-
-def flatten_session(session: Session) -> None:
-    logging.info("Starting flatten_sessions incremental load...")
-    last_ingested_at = get_last_ingested_at(session, SESSIONS_SILVER_TABLE)
-
-    session_df = session.table(SESSIONS_TABLE).filter(col("ingested_at").cast("timestamp") > last_ingested_at)
-
-    if session_df.count() == 0:
-        logging.info("No new session records to process")
-        return
-
-    session_events_flat = (
+    #If silver table does exists we merge, from a staging table only when the delta is large
+    with staged(session, events_cleaned, EVENTS_STAGING_TABLE, rows_out - dropped) as staging_df:
+        try:
+            merge_result = merge_events(target_table, staging_df)
+            note(rows_inserted=merge_result.rows_inserted, rows_updated=merge_result.rows_updated)
+            logging.info(f"Events merged: {merge_result.rows_inserted} inserted, {merge_result.rows_updated} updated.")
+        except Exception as e:
+            logging.error(f"Merge failed for {EVENTS_SILVER_TABLE}: {e}")
+            raise
+    if dedupe is not None:
+        dedupe.commit()
+
+
+def build_session_events_flat(session_df: DataFrame) -> DataFrame:
+    from snowflake.snowpark.functions import col, lower
+    return (
         session_df
         .join_table_function(
             "flatten",
@@ -164,75 +297,107 @@ def flatten_session(session: Session) -> None:
             col("start_time"),
             col("end_time"),
             lower(col("value")["type"]).as_("event_type"),
-            col("value")["product_id"].as_("product_id"),
-            col("device")["browser"].as_("browser"),
-            col("device")["os"].as_("operating_system"),
+            #Cast from VARIANT so the values compare with the STRING dimension columns
+            col("value")["product_id"].cast("string").as_("product_id"),
+            col("device")["browser"].cast("string").as_("browser"),
+            col("device")["os"].cast("string").as_("operating_system"),
             col("location")["country"].as_("country"),
-            col("location")["city"].as_("city"),
+            col("location")["city"].cast("string").as_("city"),
             col("value")["timestamp"].cast("timestamp").as_("event_timestamp"),
             col("ingested_at")
         )
+        #Still event_type here; it becomes event_type_code when the keys are encoded
         .drop_duplicates(["session_id", "event_type", "event_timestamp"])
     )
 
 
+def merge_session_events(target_table: Table, staging_df: DataFrame) -> MergeResult:
+    from snowflake.snowpark.functions import when_matched, when_not_matched
+    return target_table.merge(
+        staging_df,
+        (target_table["session_id"] == staging_df["session_id"])&
+        (target_table["event_type_code"] == staging_df["event_type_code"])&
+        (target_table["event_timestamp"] == staging_df["event_timestamp"]),
+        [
+            when_matched().update({
+                "user_key": staging_df["user_key"],
+                "start_time": staging_df["start_time"],
+                "end_time": staging_df["end_time"],
+                "product_key": staging_df["product_key"],
+                "browser_code": staging_df["browser_code"],
+                "operating_system_code": staging_df["operating_system_code"],
+                "country": staging_df["country"],
+                "city_code": staging_df["city_code"],
+                "ingested_at": staging_df["ingested_at"]
+            }),
+            when_not_matched().insert({
+                "session_id": staging_df["session_id"],
+                "user_key": staging_df["user_key"],
+                "start_time": staging_df["start_time"],
+                "end_time": staging_df["end_time"],
+                "event_type_code": staging_df["event_type_code"],
+                "product_key": staging_df["product_key"],
+                "browser_code": staging_df["browser_code"],
+                "operating_system_code": staging_df["operating_system_code"],
+                "country": staging_df["country"],
+                "city_code": staging_df["city_code"],
+                "event_timestamp": staging_df["event_timestamp"],
+                "ingested_at": staging_df["ingested_at"]
+            })
+        ]
+    )
+
 
+def flatten_session(session: Session, dedupe: Optional[DedupeIndex] = None) -> None:
+    from snowflake.snowpark.functions import col
+    logging.info("Starting flatten_sessions incremental load...")
+    last_ingested_at = get_delta_watermark(session, SESSIONS_SILVER_TABLE)
 
+    session_df = session.table(SESSIONS_TABLE).filter(col("ingested_at") > last_ingested_at)
+    rows_in = session_df.count()
+    note(rows_in=rows_in)
 
+    if rows_in == 0:
+        logging.info("No new session records to process")
+        return
 
-    if session_events_flat.count() == 0:
+    session_events_flat = build_session_events_flat(session_df)
+    rows_out = session_events_flat.count()
+    note(rows_out=rows_out)
+
+    if rows_out == 0:
         logging.info("No new flattened session data")
+        advance_watermark(session, SESSIONS_SILVER_TABLE, session_df)
         return
-    
-    logging.info(f"Writing flattened sessions to {SESSIONS_STAGING_TABLE}...")
-    session_events_flat.write.save_as_table(SESSIONS_STAGING_TABLE,mode="overwrite")
+    session_events_flat = dimensions.encode(session, session_events_flat)
+    dropped = 0
+    if dedupe is not None:
+        session_events_flat, dropped = dedupe.drop_seen(session_events_flat)
+        if dropped == rows_out:
+            logging.info("All flattened session events were already in silver.")
+            advance_watermark(session, SESSIONS_SILVER_TABLE, session_df)
+            return
 
     try:
         target_table = session.table(SESSIONS_SILVER_TABLE)
     except Exception:
         logging.info(f"Target table {SESSIONS_SILVER_TABLE} not found; creating new.")
         session_events_flat.write.save_as_table(SESSIONS_SILVER_TABLE, mode="overwrite")
+        note(rows_inserted=rows_out)
+        if dedupe is not None:
+            dedupe.commit()
         return
     
-    staging_df = session.table(SESSIONS_STAGING_TABLE)
-    try:
-        merge_result: MergeResult = target_table.merge(
-            staging_df,
-            (target_table["session_id"] == staging_df["session_id"])&
-            (target_table["event_type"] == staging_df["event_type"])&
-            (target_table["event_timestamp"] == staging_df["event_timestamp"]),
-            [
-                when_matched().update({
-                    "user_id": staging_df["user_id"],
-                    "start_time": staging_df["start_time"],
-                    "end_time": staging_df["end_time"],
-                    "product_id": staging_df["product_id"],
-                    "browser": staging_df["browser"],
-                    "operating_system": staging_df["operating_system"],
-                    "country": staging_df["country"],
-                    "city": staging_df["city"],
-                    "ingested_at": staging_df["ingested_at"]
-                }),
-                when_not_matched().insert({
-                    "session_id": staging_df["session_id"],
-                    "user_id": staging_df["user_id"],
-                    "start_time": staging_df["start_time"],
-                    "end_time": staging_df["end_time"],
-                    "event_type": staging_df["event_type"],
-                    "product_id": staging_df["product_id"],
-                    "browser": staging_df["browser"],
-                    "operating_system": staging_df["operating_system"],
-                    "country": staging_df["country"],
-                    "city": staging_df["city"],
-                    "event_timestamp": staging_df["event_timestamp"],
-                    "ingested_at": staging_df["ingested_at"]
-                })
-            ]
-        )
-        logging.info(f"Sessions merged: {merge_result.rows_inserted} inserted, {merge_result.rows_updated} updated.")
-    except Exception as e:
-        logging.error(f"Merge failed for {SESSIONS_SILVER_TABLE} : {e}")
-        raise
+    with staged(session, session_events_flat, SESSIONS_STAGING_TABLE, rows_out - dropped) as staging_df:
+        try:
+            merge_result = merge_session_events(target_table, staging_df)
+            note(rows_inserted=merge_result.rows_inserted, rows_updated=merge_result.rows_updated)
+            logging.info(f"Sessions merged: {merge_result.rows_inserted} inserted, {merge_result.rows_updated} updated.")
+        except Exception as e:
+            logging.error(f"Merge failed for {SESSIONS_SILVER_TABLE} : {e}")
+            raise
+    if dedupe is not None:
+        dedupe.commit()
 
 
 
@@ -259,21 +424,38 @@ def main(step: str, env_path: str):
         raise ValueError(f"Missing enviroment variables: {','.join(missing)}")
     
     
+    from snowflake.snowpark import Session
     session = Session.builder.configs(connection_params).create()
-    ensure_tables(session)
+    telemetry = RunTelemetry("bronze_to_silver", session)
+    sizing = WarehouseController.from_env(session)
+    dedupe = dedupe_indexes(session)
     try:
+        with telemetry.step("ensure_tables"), profiling.step("ensure_tables"):
+            ensure_tables(session)
+        if step in ["all","dimensions"]:
+            with telemetry.step("dimensions"), profiling.step("register_dimensions"):
+                register_dimensions(session)
         if step in ["all","events"]:
-            clean_events(session)
+            with telemetry.step("events"), sizing.sized(
+                "events", lambda: estimate_delta(session, EVENTS_TABLE, EVENTS_SILVER_TABLE)
+            ), profiling.step("clean_events"):
+                clean_events(session, dedupe["events"])
         if step in ["all","sessions"]:
-            flatten_session(session)
+            with telemetry.step("sessions"), sizing.sized(
+                "sessions", lambda: estimate_delta(session, SESSIONS_TABLE, SESSIONS_SILVER_TABLE)
+            ), profiling.step("flatten_session"):
+                flatten_session(session, dedupe["sessions"])
     finally:
+        telemetry.flush()
         session.close()
         logging.info("Snowpark session closed.")
     
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
-    parser.add_argument("--step", choices=["all", "events", "sessions"], default="all")
+    parser.add_argument("--step", choices=["all", "dimensions", "events", "sessions"], default="all")
     parser.add_argument("--env", default=".env", help="Path to .env file")
+    profiling.add_profile_arguments(parser)
     args = parser.parse_args()
+    profiling.configure(args.profile, "bronze_to_silver", args.profile_dir)
     main(args.step, args.env)
@@ -0,0 +1,92 @@
+from __future__ import annotations
+import os
+import sys
+import argparse
+import logging
+from typing import TYPE_CHECKING, Dict, List, Tuple
+from dotenv import load_dotenv
+import profiling
+
+if TYPE_CHECKING:
+    import snowflake.connector
+
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+
+# Exit code the Airflow BashOperators treat as "skip" (skip_on_exit_code)
+NO_NEW_DATA_EXIT_CODE = 99
+
+# Check name -> (source table, tables built from it). Silver keeps Bronze's ingested_at and Gold keeps
+# the newest Silver ingested_at it has merged, so source MAX > target MAX means unprocessed rows.
+CHECKS: Dict[str, Tuple[str, List[str]]] = {
+    "bronze_events": ("BRONZE.EVENTS", ["SILVER.EVENTS_CLEANED"]),
+    "bronze_sessions": ("BRONZE.SESSIONS", ["SILVER.SESSION_EVENTS"]),
+    "silver_events": ("SILVER.EVENTS_CLEANED", ["GOLD.USER_METRICS", "GOLD.PRODUCT_METRICS"]),
+    "silver_sessions": ("SILVER.SESSION_EVENTS", ["GOLD.SESSION_METRICS"]),
+}
+
+
+def has_new_rows(conn: snowflake.connector.SnowflakeConnection, source: str, targets: List[str]) -> bool:
+    """Compare watermarks in one query; MAX on a column is answered from micro-partition metadata."""
+    import snowflake.connector
+    selects = ",\n".join(f"(SELECT MAX(ingested_at) FROM {table})" for table in [source] + targets)
+    try:
+        with conn.cursor() as cur:
+            cur.execute(f"SELECT {selects}")
+            source_max, *target_maxes = cur.fetchone()
+    except snowflake.connector.errors.ProgrammingError as e:
+        # A missing table means the downstream step has never run, so let it run
+        logging.warning(f"Watermark check failed ({e}); assuming new data.")
+        return True
+
+    logging.info(f"{source} watermark: {source_max}; downstream watermarks: {dict(zip(targets, target_maxes))}")
+    if source_max is None:
+        return False
+    return any(target_max is None or source_max > target_max for target_max in target_maxes)
+
+
+def main(check: str, env_path: str) -> int:
+
+    # Check if file exists
+    if not os.path.exists(env_path):
+        raise FileNotFoundError(f".env file not found at path: {env_path}")
+    load_dotenv(dotenv_path=env_path) #Load credentials found in .env file
+
+    #Connection credentials
+    connection_params={
+        "account": os.getenv("SNOWFLAKE_ACCOUNT"),
+        "user": os.getenv("SNOWFLAKE_USER"),
+        "password": os.getenv("SNOWFLAKE_PASSWORD"),
+        "warehouse": os.getenv("SNOWFLAKE_WAREHOUSE"),
+        "database": os.getenv("SNOWFLAKE_DATABASE"),
+        "schema": os.getenv("SNOWFLAKE_SCHEMA"),
+        "role": os.getenv("SNOWFLAKE_ROLE"),
+    }
+    # Check that all required environment variables are set
+    missing = [k for k,v in connection_params.items() if not v]
+    if missing:
+        raise ValueError(f"Missing enviroment variables: {','.join(missing)}")
+
+    import snowflake.connector
+    source, targets = CHECKS[check]
+    conn = snowflake.connector.connect(**connection_params)
+    try:
+        with profiling.step("has_new_rows"):
+            new_rows = has_new_rows(conn, source, targets)
+        if new_rows:
+            logging.info(f"New rows in {source}; running downstream tasks.")
+            return 0
+        logging.info(f"No new rows in {source}; skipping downstream tasks.")
+        return NO_NEW_DATA_EXIT_CODE
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Exit with 99 when a layer has no rows newer than its downstream tables.")
+    parser.add_argument("--check", choices=list(CHECKS), required=True)
+    parser.add_argument("--env", default=".env", help="Path to .env file")
+    profiling.add_profile_arguments(parser)
+    args = parser.parse_args()
+    profiling.configure(args.profile, f"check_{args.check}", args.profile_dir)
+    sys.exit(main(args.check, args.env))
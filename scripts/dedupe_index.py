@@ -0,0 +1,413 @@
+'''Cross-batch dedupe index over Silver keys: a scalable Bloom filter with an exact check on its positives.
+
+drop_duplicates() in Bronze -> Silver only sees the current delta, so a key redelivered in a later batch reaches
+the MERGE, which probes the whole Silver table for it. DedupeIndex.drop_seen() answers "seen before?" on the
+client first. A negative is certain; only the keys the filter flags are looked up in Silver (a semi-join on those
+keys alone), and the confirmed ones are dropped from the delta before it is staged. A false positive costs one
+extra lookup and the row is kept. A key the index has never seen (written by a backfill, or the index was lost)
+falls through to the MERGE as before, so a stale or deleted index never changes the result, only the cost.
+
+The filter grows by slices (Almeida et al., "Scalable Bloom Filters"): slice i holds capacity * GROWTH**i keys at
+error_rate * (1 - TIGHTENING) * TIGHTENING**i, so the compound false-positive rate stays under error_rate however
+many keys arrive. It is persisted as one .npz blob, on a Snowflake stage (default) or in a local directory.
+
+Memory is capped at max_bytes, the first slice included. When the keys already in Silver need a bigger first
+slice than the cap allows, no filter is built and drop_seen() falls back to an anti-join of the delta against
+the Silver keys, which drops the same rows without holding anything on the client.
+'''
+import io
+import os
+import json
+import math
+import logging
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+
+DEFAULT_STAGE = "SILVER_STAGING.DEDUPE_INDEX"
+CANDIDATES_SCHEMA = "SILVER_STAGING"
+DEFAULT_DIR = Path(__file__).resolve().parent.parent / "data" / "dedupe"
+DEFAULT_ERROR_RATE = 0.01
+DEFAULT_CAPACITY = 1_000_000
+DEFAULT_MAX_MB = 64
+GROWTH = 2
+TIGHTENING = 0.5
+# Probe j of a slice is (h1 + j * h2) mod bits (Kirsch-Mitzenmacher double hashing)
+HASH_KEY = "silver-dedupe-v1"
+FORMAT_VERSION = 1
+
+
+def _mix(values: np.ndarray) -> np.ndarray:
+    """splitmix64 finalizer, to derive a second hash independent of the first."""
+    values = values ^ (values >> np.uint64(30))
+    values = values * np.uint64(0xBF58476D1CE4E5B9)
+    values = values ^ (values >> np.uint64(27))
+    values = values * np.uint64(0x94D049BB133111EB)
+    return values ^ (values >> np.uint64(31))
+
+
+def key_hashes(keys: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray]:
+    """Two uint64 hashes per row of key columns, stable across processes and across the pandas dtypes
+    Snowpark picks for the same column (int8..int64, datetime64 of any unit)."""
+    columns = {}
+    for name in keys.columns:
+        values = keys[name]
+        if pd.api.types.is_datetime64_any_dtype(values):
+            if getattr(values.dt, "tz", None) is not None:
+                values = values.dt.tz_convert(None)
+            values = values.astype("datetime64[ns]").astype("int64")
+        elif pd.api.types.is_integer_dtype(values) and not pd.api.types.is_bool_dtype(values):
+            values = values.astype("int64")
+        else:
+            values = values.astype(str)
+        columns[str(name).lower()] = values.reset_index(drop=True)
+    frame = pd.DataFrame(columns)
+    h1 = pd.util.hash_pandas_object(frame, index=False, hash_key=HASH_KEY).to_numpy(dtype=np.uint64)
+    # pandas only applies hash_key to strings, so the second hash is mixed from the first rather than keyed;
+    # an odd step never collapses the probes of a key onto one bit
+    return h1, _mix(h1 ^ np.uint64(0x9E3779B97F4A7C15)) | np.uint64(1)
+
+
+@dataclass
+class BloomSlice:
+    capacity: int
+    error_rate: float
+    num_hashes: int
+    bits: np.ndarray
+    count: int = 0
+
+    @staticmethod
+    def size_bytes(capacity: int, error_rate: float) -> int:
+        num_bits = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        return max(8, -(-num_bits // 8))
+
+    @classmethod
+    def create(cls, capacity: int, error_rate: float) -> "BloomSlice":
+        num_bytes = cls.size_bytes(capacity, error_rate)
+        num_hashes = max(1, round(num_bytes * 8 / capacity * math.log(2)))
+        return cls(capacity, error_rate, num_hashes, np.zeros(num_bytes, dtype=np.uint8))
+
+    @property
+    def num_bits(self) -> np.uint64:
+        return np.uint64(self.bits.size * 8)
+
+    def _probes(self, h1: np.ndarray, h2: np.ndarray):
+        for j in range(self.num_hashes):
+            position = (h1 + np.uint64(j) * h2) % self.num_bits
+            yield position >> np.uint64(3), (position & np.uint64(7)).astype(np.uint8)
+
+    def contains(self, h1: np.ndarray, h2: np.ndarray) -> np.ndarray:
+        found = np.ones(h1.size, dtype=bool)
+        for byte, bit in self._probes(h1, h2):
+            found &= (self.bits[byte] >> bit) & 1 == 1
+        return found
+
+    def add(self, h1: np.ndarray, h2: np.ndarray) -> None:
+        for byte, bit in self._probes(h1, h2):
+            np.bitwise_or.at(self.bits, byte, np.left_shift(1, bit).astype(np.uint8))
+        self.count += int(h1.size)
+
+
+class ScalableBloomFilter:
+    def __init__(self, capacity: int = DEFAULT_CAPACITY, error_rate: float = DEFAULT_ERROR_RATE,
+                 max_bytes: int = DEFAULT_MAX_MB * 2 ** 20, slices: Optional[List[BloomSlice]] = None):
+        if not 0 < error_rate < 1:
+            raise ValueError(f"error_rate must be between 0 and 1, got {error_rate}")
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.max_bytes = max_bytes
+        self.slices = slices or []
+        self.full = False
+
+    @property
+    def count(self) -> int:
+        return sum(s.count for s in self.slices)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(s.bits.nbytes for s in self.slices)
+
+    def contains(self, h1: np.ndarray, h2: np.ndarray) -> np.ndarray:
+        found = np.zeros(h1.size, dtype=bool)
+        for s in self.slices:
+            # Keys an earlier slice already matched are not probed again
+            pending = ~found
+            if not pending.any():
+                break
+            found[pending] = s.contains(h1[pending], h2[pending])
+        return found
+
+    def fits(self) -> bool:
+        """Whether the next slice stays within max_bytes (for an empty filter: whether the first one does)."""
+        i = len(self.slices)
+        size = BloomSlice.size_bytes(self.capacity * GROWTH ** i, self.error_rate * (1 - TIGHTENING) * TIGHTENING ** i)
+        return self.nbytes + size <= self.max_bytes
+
+    def _next_slice(self) -> Optional[BloomSlice]:
+        if not self.fits():
+            return None
+        i = len(self.slices)
+        new = BloomSlice.create(
+            self.capacity * GROWTH ** i, self.error_rate * (1 - TIGHTENING) * TIGHTENING ** i
+        )
+        self.slices.append(new)
+        return new
+
+    def add(self, h1: np.ndarray, h2: np.ndarray) -> int:
+        """Add the keys not already present; returns how many were added (0 for all once the memory cap is hit)."""
+        new = ~self.contains(h1, h2)
+        h1, h2 = h1[new], h2[new]
+        added = 0
+        while added < h1.size:
+            current = self.slices[-1] if self.slices else None
+            if current is None or current.count >= current.capacity:
+                current = self._next_slice()
+                if current is None:
+                    if not self.full:
+                        logging.warning(
+                            f"Dedupe index reached its {self.max_bytes / 2 ** 20:.0f} MB cap; "
+                            f"{h1.size - added:,} new keys are not indexed and will be checked by the MERGE."
+                        )
+                    self.full = True
+                    break
+            take = min(current.capacity - current.count, h1.size - added)
+            current.add(h1[added:added + take], h2[added:added + take])
+            added += take
+        return added
+
+    def to_bytes(self) -> bytes:
+        meta = {
+            "format": FORMAT_VERSION, "capacity": self.capacity, "error_rate": self.error_rate,
+            "slices": [
+                {"capacity": s.capacity, "error_rate": s.error_rate, "num_hashes": s.num_hashes, "count": s.count}
+                for s in self.slices
+            ],
+        }
+        buffer = io.BytesIO()
+        np.savez(buffer, meta=np.array(json.dumps(meta)), **{f"bits_{i}": s.bits for i, s in enumerate(self.slices)})
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, payload: bytes, max_bytes: int = DEFAULT_MAX_MB * 2 ** 20) -> "ScalableBloomFilter":
+        with np.load(io.BytesIO(payload), allow_pickle=False) as arrays:
+            meta = json.loads(str(arrays["meta"]))
+            if meta["format"] != FORMAT_VERSION:
+                raise ValueError(f"Unsupported dedupe index format {meta['format']}")
+            slices = [
+                BloomSlice(s["capacity"], s["error_rate"], s["num_hashes"], arrays[f"bits_{i}"].copy(), s["count"])
+                for i, s in enumerate(meta["slices"])
+            ]
+        return cls(meta["capacity"], meta["error_rate"], max_bytes, slices)
+
+
+class DedupeIndex:
+    """Seen keys of one Silver table, loaded on first use and saved by commit() after the delta is merged.
+
+    store is "stage" (a file on a Snowflake internal stage, which survives the short-lived task containers),
+    "local" (a file under directory) or "off". A missing index is rebuilt from the Silver table's keys; one that
+    cannot fit in max_bytes is replaced by an anti-join against them for the run.
+    """
+
+    def __init__(self, session: Any, name: str, keys: List[str], table: str, store: str = "stage",
+                 stage: str = DEFAULT_STAGE, directory: Path = DEFAULT_DIR, capacity: int = DEFAULT_CAPACITY,
+                 error_rate: float = DEFAULT_ERROR_RATE, max_bytes: int = DEFAULT_MAX_MB * 2 ** 20,
+                 autosave: bool = True):
+        if store not in ("stage", "local", "off"):
+            raise ValueError(f"Unknown dedupe index store: {store}")
+        self.session = session
+        self.name = name
+        self.keys = keys
+        self.table = table
+        self.store = store
+        self.stage = stage
+        self.directory = Path(directory)
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.max_bytes = max_bytes
+        self.autosave = autosave
+        self.bloom: Optional[ScalableBloomFilter] = None
+        self.fallback = False
+        self._pending: Optional[Tuple[np.ndarray, np.ndarray]] = None
+
+    @classmethod
+    def from_env(cls, session: Any, name: str, keys: List[str], table: str, **kwargs: Any) -> "DedupeIndex":
+        """DEDUPE_INDEX=stage|local|off; DEDUPE_INDEX_ERROR_RATE, _CAPACITY (keys in the first slice), _MAX_MB,
+        _STAGE and _DIR tune it."""
+        return cls(
+            session, name, keys, table,
+            store=os.getenv("DEDUPE_INDEX", "stage").lower(),
+            stage=os.getenv("DEDUPE_INDEX_STAGE", DEFAULT_STAGE),
+            directory=Path(os.getenv("DEDUPE_INDEX_DIR", DEFAULT_DIR)),
+            capacity=int(os.getenv("DEDUPE_INDEX_CAPACITY", DEFAULT_CAPACITY)),
+            error_rate=float(os.getenv("DEDUPE_INDEX_ERROR_RATE", DEFAULT_ERROR_RATE)),
+            max_bytes=int(float(os.getenv("DEDUPE_INDEX_MAX_MB", DEFAULT_MAX_MB)) * 2 ** 20),
+            **kwargs,
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.store != "off"
+
+    @property
+    def file_name(self) -> str:
+        return f"{self.name}.npz"
+
+    def _read(self) -> Optional[bytes]:
+        if self.store == "local":
+            path = self.directory / self.file_name
+            return path.read_bytes() if path.exists() else None
+        self.session.sql(f"CREATE STAGE IF NOT EXISTS {self.stage}").collect()
+        listed = self.session.sql(f"LIST @{self.stage}/{self.file_name}").collect()
+        if not listed:
+            return None
+        return self.session.file.get_stream(f"@{self.stage}/{self.file_name}").read()
+
+    def _write(self, payload: bytes) -> None:
+        if self.store == "local":
+            self.directory.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.directory / f"{self.file_name}.tmp"
+            tmp_path.write_bytes(payload)
+            os.replace(tmp_path, self.directory / self.file_name)
+        else:
+            self.session.file.put_stream(
+                io.BytesIO(payload), f"@{self.stage}/{self.file_name}", auto_compress=False, overwrite=True
+            )
+
+    def load(self) -> Optional[ScalableBloomFilter]:
+        """The filter, or None when it does not fit in max_bytes (drop_seen() then anti-joins against Silver)."""
+        if self.bloom is not None or self.fallback:
+            return self.bloom
+        try:
+            payload = self._read()
+            if payload is not None:
+                bloom = ScalableBloomFilter.from_bytes(payload, self.max_bytes)
+                if bloom.nbytes > self.max_bytes:
+                    logging.warning(
+                        f"Dedupe index {self.name} is {bloom.nbytes / 2 ** 20:.1f} MB, over its "
+                        f"{self.max_bytes / 2 ** 20:.0f} MB cap; rebuilding it."
+                    )
+                else:
+                    self.bloom = bloom
+                    logging.info(
+                        f"Dedupe index {self.name}: {bloom.count:,} keys in {len(bloom.slices)} slices "
+                        f"({bloom.nbytes / 2 ** 20:.1f} MB)."
+                    )
+                    return self.bloom
+        except Exception as e:
+            logging.warning(f"Could not load dedupe index {self.name} ({e}); rebuilding it.")
+        self.bloom = self.rebuild()
+        self.fallback = self.bloom is None
+        return self.bloom
+
+    def rebuild(self) -> Optional[ScalableBloomFilter]:
+        """A new filter holding every key already in the Silver table, its first slice sized to fit them;
+        None if that slice would exceed max_bytes."""
+        try:
+            existing = self.session.table(self.table).count()
+        except Exception:
+            existing = 0
+        bloom = ScalableBloomFilter(max(self.capacity, existing), self.error_rate, self.max_bytes)
+        if not bloom.fits():
+            logging.warning(
+                f"Dedupe index {self.name}: {existing:,} keys of {self.table} do not fit in "
+                f"{self.max_bytes / 2 ** 20:.0f} MB at error rate {self.error_rate}; "
+                f"anti-joining deltas against {self.table} instead."
+            )
+            return None
+        if existing:
+            for batch in self.session.table(self.table).select(self.keys).to_pandas_batches():
+                bloom.add(*key_hashes(batch))
+        logging.info(f"Dedupe index {self.name}: rebuilt from {existing:,} rows of {self.table}.")
+        return bloom
+
+    def _anti_join(self, delta: Any) -> Tuple[Any, int]:
+        rows = delta.count()
+        remaining = delta.join(self.session.table(self.table).select(self.keys), self.keys, how="leftanti")
+        dropped = rows - remaining.count()
+        logging.info(f"Dedupe index {self.name}: anti-join against {self.table} dropped {dropped:,} duplicate rows.")
+        return remaining, dropped
+
+    def _confirm(self, candidates: pd.DataFrame) -> Any:
+        """The candidate keys that really are in the Silver table, computed in the warehouse.
+
+        The candidates are uploaded to a temporary table rather than inlined into the query text."""
+        table = f"DEDUPE_CANDIDATES_{self.name.upper()}"
+        self.session.write_pandas(
+            candidates.rename(columns=str.upper), table, schema=CANDIDATES_SCHEMA,
+            auto_create_table=True, overwrite=True, quote_identifiers=False, table_type="temporary",
+            use_logical_type=True,
+        )
+        try:
+            candidate_df = self.session.table(f"{CANDIDATES_SCHEMA}.{table}")
+            return (
+                self.session.table(self.table).select(self.keys)
+                .join(candidate_df, self.keys, how="leftsemi").cache_result()
+            )
+        finally:
+            try:
+                self.session.sql(f"DROP TABLE IF EXISTS {CANDIDATES_SCHEMA}.{table}").collect()
+            except Exception as e:
+                # A temporary table still goes away with the session
+                logging.warning(f"Could not drop candidate table {table}: {e}")
+
+    def drop_seen(self, delta: Any) -> Tuple[Any, int]:
+        """The delta without keys already in the Silver table, and how many rows were dropped."""
+        if not self.enabled:
+            return delta, 0
+        bloom = self.load()
+        if bloom is None:
+            return self._anti_join(delta)
+
+        # Keys are streamed: only their hashes and the flagged keys are kept on the client
+        hashes, flagged = [], []
+        num_keys = 0
+        for batch in delta.select(self.keys).to_pandas_batches():
+            h1, h2 = key_hashes(batch)
+            hashes.append((h1, h2))
+            maybe = bloom.contains(h1, h2)
+            if maybe.any():
+                flagged.append(batch[maybe])
+            num_keys += len(batch)
+        self._pending = (
+            np.concatenate([h[0] for h in hashes]) if hashes else np.array([], dtype=np.uint64),
+            np.concatenate([h[1] for h in hashes]) if hashes else np.array([], dtype=np.uint64),
+        )
+        if not flagged:
+            logging.info(f"Dedupe index {self.name}: none of {num_keys:,} keys seen before.")
+            return delta, 0
+
+        # Exact check, on the flagged keys only
+        candidates = pd.concat(flagged, ignore_index=True).drop_duplicates()
+        seen = self._confirm(candidates)
+        confirmed = seen.count()
+        if confirmed == 0:
+            logging.info(f"Dedupe index {self.name}: {len(candidates):,} candidate keys, all false positives.")
+            return delta, 0
+        remaining = delta.join(seen, self.keys, how="leftanti")
+        dropped = num_keys - remaining.count()
+        logging.info(
+            f"Dedupe index {self.name}: {len(candidates):,} candidate keys, {confirmed:,} already in "
+            f"{self.table}; dropped {dropped:,} duplicate rows before the MERGE."
+        )
+        return remaining, dropped
+
+    def commit(self) -> None:
+        """Index the keys of the last drop_seen() delta once it is merged, and save when autosave is on."""
+        if not self.enabled or self._pending is None or self.bloom is None:
+            return
+        added = self.bloom.add(*self._pending)
+        self._pending = None
+        logging.info(f"Dedupe index {self.name}: {added:,} new keys ({self.bloom.count:,} total).")
+        if self.autosave:
+            self.save()
+
+    def save(self) -> None:
+        if not self.enabled or self.bloom is None:
+            return
+        try:
+            self._write(self.bloom.to_bytes())
+        except Exception as e:
+            # The index is only an optimisation; an unsaved one is rebuilt or catches up later
+            logging.warning(f"Could not save dedupe index {self.name}: {e}")
@@ -0,0 +1,141 @@
+'''Dictionary-encoded dimensions: integer surrogate keys for users and products, small-int codes for attributes.
+
+Bronze carries user_id ("user_N"), product_id ("PROD_NNN"), event_type, browser, operating_system and city as
+strings repeated on every row. register() adds the values a delta brings that are not yet in their dimension
+table (next key = MAX(key) + 1, in value order), and encode() replaces each string column with its key. Silver
+and Gold store, group and join on the integers, and the dashboard joins the dimension back only for display.
+
+Event types are seeded with fixed codes (EVENT_TYPE_CODES), so Gold measures and the detectors can filter on
+literal codes. Every other key is assigned on first sight and never changes.
+
+Registration takes MAX(key) inside its MERGE, so two registrations running at once could hand one key to two
+values or add a value twice. It therefore has a single writer: the DAG's register_dimensions task (bronze_to_silver.py
+--step dimensions) runs before the parallel events and sessions tasks, micro_batch.py registers before it encodes,
+and the backfill registers its whole range before the parallel windows. Everything else only calls encode(), which
+refuses a delta with values that were never registered instead of writing NULL keys.
+'''
+from __future__ import annotations
+from dataclasses import dataclass
+from functools import reduce
+from typing import TYPE_CHECKING, Dict, List, Sequence, Tuple
+
+if TYPE_CHECKING:
+    from snowflake.snowpark import Session, DataFrame
+
+SCHEMA = "SILVER"
+
+EVENT_TYPES: Tuple[str, ...] = ("view_product", "add_to_cart", "remove_from_cart", "purchase")
+EVENT_TYPE_CODES: Dict[str, int] = {event_type: code for code, event_type in enumerate(EVENT_TYPES, start=1)}
+
+
+@dataclass(frozen=True)
+class Dimension:
+    """One dictionary table: value (the natural string column) <-> key."""
+    table: str
+    value: str
+    key: str
+    key_type: str = "INT"
+    seed: Tuple[str, ...] = ()
+
+
+USER = Dimension(f"{SCHEMA}.DIM_USER", "user_id", "user_key")
+PRODUCT = Dimension(f"{SCHEMA}.DIM_PRODUCT", "product_id", "product_key")
+EVENT_TYPE = Dimension(f"{SCHEMA}.DIM_EVENT_TYPE", "event_type", "event_type_code", "SMALLINT", EVENT_TYPES)
+BROWSER = Dimension(f"{SCHEMA}.DIM_BROWSER", "browser", "browser_code", "SMALLINT")
+OPERATING_SYSTEM = Dimension(f"{SCHEMA}.DIM_OPERATING_SYSTEM", "operating_system", "operating_system_code", "SMALLINT")
+CITY = Dimension(f"{SCHEMA}.DIM_CITY", "city", "city_code", "SMALLINT")
+
+DIMENSIONS: Dict[str, Dimension] = {dim.value: dim for dim in [USER, PRODUCT, EVENT_TYPE, BROWSER, OPERATING_SYSTEM, CITY]}
+
+
+def event_type_codes(event_types: Sequence[str]) -> str:
+    """Comma-separated codes, for `event_type_code IN (...)`."""
+    return ", ".join(str(EVENT_TYPE_CODES[event_type]) for event_type in event_types)
+
+
+def build_create_sql(dim: Dimension) -> str:
+    # ingested_at lets the dashboard cache pull new entries incrementally, like the Gold tables
+    return f"""
+        CREATE TABLE IF NOT EXISTS {dim.table} (
+            {dim.key} {dim.key_type} NOT NULL,
+            {dim.value} STRING NOT NULL,
+            ingested_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP()
+        )
+    """
+
+
+def build_seed_sql(dim: Dimension) -> str:
+    """Insert the fixed codes of a seeded dimension; "" for the others."""
+    if not dim.seed:
+        return ""
+    rows = ", ".join(f"({code}, '{value}')" for code, value in enumerate(dim.seed, start=1))
+    return f"""
+        MERGE INTO {dim.table} AS target
+        USING (SELECT column1 AS {dim.key}, column2 AS {dim.value} FROM VALUES {rows}) AS source
+        ON target.{dim.value} = source.{dim.value}
+        WHEN NOT MATCHED THEN
+            INSERT ({dim.key}, {dim.value}) VALUES (source.{dim.key}, source.{dim.value})
+    """
+
+
+def ensure_dimension_tables(session: Session) -> None:
+    for dim in DIMENSIONS.values():
+        session.sql(build_create_sql(dim)).collect()
+        seed_sql = build_seed_sql(dim)
+        if seed_sql:
+            session.sql(seed_sql).collect()
+
+
+def _dimensions_of(delta: DataFrame) -> List[Dimension]:
+    columns = {c.upper() for c in delta.columns}
+    return [dim for dim in DIMENSIONS.values() if dim.value.upper() in columns]
+
+
+def register(session: Session, delta: DataFrame) -> Dict[str, int]:
+    """Give every new value in the delta's dimension columns the next key; returns the new entries per table."""
+    from snowflake.snowpark import Window
+    from snowflake.snowpark.functions import col, row_number, sql_expr, when_not_matched
+    added = {}
+    for dim in _dimensions_of(delta):
+        target = session.table(dim.table)
+        new_values = (
+            delta.select(col(dim.value)).filter(col(dim.value).is_not_null()).distinct()
+            .join(target.select(col(dim.value)), on=dim.value, how="leftanti")
+        )
+        source = new_values.select(
+            col(dim.value),
+            (sql_expr(f"(SELECT COALESCE(MAX({dim.key}), 0) FROM {dim.table})")
+             + row_number().over(Window.order_by(col(dim.value)))).as_(dim.key),
+        )
+        result = target.merge(
+            source,
+            target[dim.value] == source[dim.value],
+            [when_not_matched().insert({dim.key: source[dim.key], dim.value: source[dim.value]})],
+        )
+        added[dim.table] = result.rows_inserted
+    return added
+
+
+def encode(session: Session, delta: DataFrame, check: bool = True) -> DataFrame:
+    """The delta with each dimension column replaced by its key column (NULL stays NULL).
+
+    With check, one count over the lookup raises if a non-NULL value has no key yet, i.e. register() has not
+    seen it (Bronze rows that landed after the register_dimensions task); the rows are picked up next run.
+    """
+    from snowflake.snowpark.functions import col
+    dims = _dimensions_of(delta)
+    for dim in dims:
+        lookup = session.table(dim.table).select(col(dim.value).as_(f"dim_{dim.value}"), col(dim.key))
+        delta = delta.join(lookup, delta[dim.value] == lookup[f"dim_{dim.value}"], how="left")
+    if check and dims:
+        unregistered = reduce(
+            lambda a, b: a | b, [col(dim.value).is_not_null() & col(dim.key).is_null() for dim in dims]
+        )
+        missing = delta.filter(unregistered).count()
+        if missing:
+            raise RuntimeError(
+                f"{missing} rows have values missing from {', '.join(dim.table for dim in dims)}; "
+                "run bronze_to_silver.py --step dimensions first"
+            )
+    return delta.drop(*[name for dim in dims for name in (dim.value, f"dim_{dim.value}")])
+
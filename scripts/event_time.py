@@ -0,0 +1,193 @@
+'''Event-time watermarks with an allowed lateness, and per-run lateness statistics.
+
+A consumer's event-time watermark is the latest event time it has processed. A row whose event time is more than
+the allowed lateness behind that watermark when it arrives is late. Gold adds on-time rows to the existing totals
+of their keys and recomputes only the keys that received late rows from all of their Silver rows. The anomaly
+detector keeps each hourly bucket open for the allowed lateness before scoring it.
+
+Watermarks are kept in EVENT_TIME_WATERMARKS, one row per consumer, and every run's lateness figures are appended
+to LATENESS_STATS. Both are written in the consumer's own transaction, so they move together with its data.
+'''
+import os
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import List, Optional, Sequence
+
+WATERMARKS_TABLE = "GOLD_STAGING.EVENT_TIME_WATERMARKS"
+LATENESS_TABLE = "GOLD_STAGING.LATENESS_STATS"
+DEFAULT_ALLOWED_LATENESS_MINUTES = 30
+
+
+def allowed_lateness(minutes: Optional[float] = None) -> timedelta:
+    """minutes if given, else ALLOWED_LATENESS_MINUTES, else the default."""
+    if minutes is None:
+        minutes = float(os.getenv("ALLOWED_LATENESS_MINUTES", DEFAULT_ALLOWED_LATENESS_MINUTES))
+    if minutes < 0:
+        raise ValueError(f"Allowed lateness must not be negative, got {minutes} minutes")
+    return timedelta(minutes=minutes)
+
+
+def sql_timestamp(value: Optional[datetime]) -> str:
+    return "NULL" if value is None else f"'{value.isoformat(sep=' ')}'::TIMESTAMP"
+
+
+def sql_string(value: Optional[str]) -> str:
+    return "NULL" if value is None else "'" + value.replace("'", "''") + "'"
+
+
+def build_create_sql() -> List[str]:
+    return [
+        f"""
+        CREATE TABLE IF NOT EXISTS {WATERMARKS_TABLE} (
+            consumer STRING,
+            event_time_watermark TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP()
+        )
+        """,
+        f"""
+        CREATE TABLE IF NOT EXISTS {LATENESS_TABLE} (
+            consumer STRING,
+            query_tag STRING,
+            allowed_lateness_seconds INT,
+            ingested_watermark TIMESTAMP,
+            event_time_watermark TIMESTAMP,
+            delta_rows INT,
+            late_rows INT,
+            late_keys INT,
+            delay_p50_seconds FLOAT,
+            delay_p95_seconds FLOAT,
+            delay_max_seconds INT,
+            recorded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP()
+        )
+        """,
+    ]
+
+
+@dataclass
+class LatenessStats:
+    """The delta a consumer is about to process (rows past its ingested_at watermark), measured against its
+    event-time watermark. Delay is ingested_at - event time."""
+    consumer: str
+    ingested_watermark: Optional[datetime]
+    event_time_watermark: Optional[datetime]
+    lateness: timedelta
+    delta_rows: int = 0
+    late_rows: int = 0
+    late_keys: int = 0
+    max_event_time: Optional[datetime] = None
+    delay_p50_seconds: Optional[float] = None
+    delay_p95_seconds: Optional[float] = None
+    delay_max_seconds: Optional[int] = None
+
+    @property
+    def late_before(self) -> Optional[datetime]:
+        """Event times below this are late; None until the consumer has a watermark."""
+        if self.event_time_watermark is None:
+            return None
+        return self.event_time_watermark - self.lateness
+
+    def __str__(self) -> str:
+        delays = ""
+        if self.delay_max_seconds is not None:
+            delays = (
+                f"; delay p50 {self.delay_p50_seconds or 0:.0f}s, p95 {self.delay_p95_seconds or 0:.0f}s, "
+                f"max {self.delay_max_seconds}s"
+            )
+        return (
+            f"{self.late_rows:,}/{self.delta_rows:,} rows late by more than {self.lateness} "
+            f"({self.late_keys:,} keys), event-time watermark {self.event_time_watermark}{delays}"
+        )
+
+
+def build_lateness_sql(consumer: str, source: str, target: str, event_time: str, keys: Sequence[str],
+                       lateness: timedelta, default_watermark: str = "1970-01-01 00:00:00") -> str:
+    """One row: the target's ingested_at watermark, the consumer's event-time watermark and the lateness of the
+    source rows past the former, in the order stats_from_row() reads them."""
+    seconds = int(lateness.total_seconds())
+    late = f"s.{event_time} < DATEADD('second', -{seconds}, w.event_time_watermark)"
+    key_hash = ", ".join(f"s.{key}" for key in keys)
+    delay = f"DATEDIFF('second', s.{event_time}, s.ingested_at)"
+    return f"""
+        WITH w AS (
+            SELECT
+                (SELECT COALESCE(MAX(ingested_at), '{default_watermark}'::TIMESTAMP) FROM {target}) AS ingested_watermark,
+                (SELECT MAX(event_time_watermark) FROM {WATERMARKS_TABLE} WHERE consumer = {sql_string(consumer)}) AS event_time_watermark
+        )
+        SELECT
+            w.ingested_watermark,
+            w.event_time_watermark,
+            COUNT(s.ingested_at),
+            COUNT_IF({late}),
+            COUNT(DISTINCT IFF({late}, HASH({key_hash}), NULL)),
+            MAX(s.{event_time}),
+            APPROX_PERCENTILE({delay}, 0.5),
+            APPROX_PERCENTILE({delay}, 0.95),
+            MAX({delay})
+        FROM w
+        LEFT JOIN {source} AS s
+            ON s.ingested_at > w.ingested_watermark
+        GROUP BY w.ingested_watermark, w.event_time_watermark
+    """
+
+
+def stats_from_row(consumer: str, lateness: timedelta, row: Sequence) -> LatenessStats:
+    return LatenessStats(
+        consumer=consumer,
+        ingested_watermark=row[0],
+        event_time_watermark=row[1],
+        lateness=lateness,
+        delta_rows=int(row[2] or 0),
+        late_rows=int(row[3] or 0),
+        late_keys=int(row[4] or 0),
+        max_event_time=row[5],
+        delay_p50_seconds=None if row[6] is None else float(row[6]),
+        delay_p95_seconds=None if row[7] is None else float(row[7]),
+        delay_max_seconds=None if row[8] is None else int(row[8]),
+    )
+
+
+def build_watermark_merge_sql(stats: Sequence[LatenessStats]) -> str:
+    """Move each consumer's event-time watermark up to the latest event time in its delta; "" if none moved."""
+    rows = [
+        f"({sql_string(s.consumer)}, {sql_timestamp(s.max_event_time)})"
+        for s in stats if s.max_event_time is not None
+    ]
+    if not rows:
+        return ""
+    return f"""
+        MERGE INTO {WATERMARKS_TABLE} AS target
+        USING (
+            SELECT column1 AS consumer, column2 AS event_time_watermark
+            FROM VALUES {", ".join(rows)}
+        ) AS source
+        ON target.consumer = source.consumer
+        WHEN MATCHED AND (target.event_time_watermark IS NULL
+                          OR source.event_time_watermark > target.event_time_watermark) THEN
+            UPDATE SET event_time_watermark = source.event_time_watermark, updated_at = CURRENT_TIMESTAMP()
+        WHEN NOT MATCHED THEN
+            INSERT (consumer, event_time_watermark) VALUES (source.consumer, source.event_time_watermark)
+    """
+
+
+def build_stats_insert_sql(stats: Sequence[LatenessStats], query_tag: Optional[str] = None) -> str:
+    """Append one LATENESS_STATS row per consumer that had a delta; "" if none had."""
+    rows = [
+        "(" + ", ".join([
+            sql_string(s.consumer), sql_string(query_tag), str(int(s.lateness.total_seconds())),
+            sql_timestamp(s.ingested_watermark), sql_timestamp(s.event_time_watermark),
+            str(s.delta_rows), str(s.late_rows), str(s.late_keys),
+            "NULL" if s.delay_p50_seconds is None else repr(s.delay_p50_seconds),
+            "NULL" if s.delay_p95_seconds is None else repr(s.delay_p95_seconds),
+            "NULL" if s.delay_max_seconds is None else str(s.delay_max_seconds),
+        ]) + ")"
+        for s in stats if s.delta_rows
+    ]
+    if not rows:
+        return ""
+    return f"""
+        INSERT INTO {LATENESS_TABLE} (
+            consumer, query_tag, allowed_lateness_seconds, ingested_watermark, event_time_watermark,
+            delta_rows, late_rows, late_keys, delay_p50_seconds, delay_p95_seconds, delay_max_seconds
+        )
+        VALUES {", ".join(rows)}
+    """
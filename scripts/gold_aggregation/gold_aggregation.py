@@ -1,11 +1,24 @@
+from __future__ import annotations
 import os 
+import sys
 import argparse
 import logging
-from snowflake.snowpark import Session
-from snowflake.snowpark.functions import col, flatten, lower, max as sf_max ,when_matched, when_not_matched, call_table_function, lit, when, count , avg, datediff
-from snowflake.snowpark.table import  MergeResult 
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
 from dotenv import load_dotenv
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from pipeline_telemetry import RunTelemetry, note, note_query
+from warehouse_sizing import WarehouseController, estimate_delta
+import event_time
+import profiling
+from dimensions import event_type_codes
+
+if TYPE_CHECKING:
+    from snowflake.snowpark import Session
+
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
 
@@ -13,7 +26,6 @@ logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(me
 
 SILVER = "SILVER"
 GOLD = "GOLD"
-GOLD_STAGE = "GOLD_STAGING"
 
 SILVER_EVENTS = f"{SILVER}.EVENTS_CLEANED"
 SILVER_SESSIONS = f"{SILVER}.SESSION_EVENTS"
@@ -22,227 +34,326 @@ USER_METRICS_TABLE = f"{GOLD}.USER_METRICS"
 SESSION_METRICS_TABLE = f"{GOLD}.SESSION_METRICS"
 PRODUCT_METRICS_TABLE = f"{GOLD}.PRODUCT_METRICS"
 
-USER_STAGE = f"{GOLD_STAGE}.USER_METRICS_STAGE"
-SESSION_STAGE = f"{GOLD_STAGE}.SESSION_METRICS_STAGE"
-PRODUCT_STAGE = f"{GOLD_STAGE}.PRODUCT_METRICS_STAGE"
-
-
-def ensure_gold_tables(session: Session) -> None:
-    logging.info("Ensuring Gold layer tables exist...")
-    session.sql(f"""
-        CREATE TABLE IF NOT EXISTS {USER_METRICS_TABLE} (
-            user_id STRING,
-            total_events INT,
-            num_purchases INT,
-            num_clicks INT,
-            conversion_rate FLOAT,
-            ingested_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP()
+DEFAULT_WATERMARK = "1970-01-01 00:00:00"
+
+
+@dataclass(frozen=True)
+class Column:
+    name: str
+    sql_type: str
+    expr: str = ""
+    # How a measure's existing Gold value and a delta's aggregate (aliased existing and added) combine;
+    # "" adds them, which is right for counts
+    combine: str = ""
+
+
+@dataclass(frozen=True)
+class MetricSpec:
+    """Declares one Gold table: merge keys, carried dimensions, aggregate measures and derived ratios."""
+    table: str
+    source: str
+    keys: Tuple[Column, ...]
+    measures: Tuple[Column, ...]
+    dimensions: Tuple[Column, ...] = ()
+    derived: Tuple[Column, ...] = ()
+    # Event-time column of the source, used to select keys by time window (backfills) and to spot late rows
+    event_time: str = "timestamp"
+    # Gold rows carry no event time; the dashboard filters them by ingested_at day
+    cluster_by: str = "TO_DATE(ingested_at)"
+
+    @property
+    def group_columns(self) -> Tuple[Column, ...]:
+        return self.keys + self.dimensions
+
+    @property
+    def value_columns(self) -> Tuple[Column, ...]:
+        return self.dimensions + self.measures + self.derived
+
+
+USER_METRICS_SPEC = MetricSpec(
+    table=USER_METRICS_TABLE,
+    source=SILVER_EVENTS,
+    keys=(Column("user_key", "INT"),),
+    measures=(
+        Column("total_events", "INT", "COUNT(*)"),
+        Column("num_purchases", "INT", f"COUNT_IF(event_type_code = {event_type_codes(['purchase'])})"),
+        Column(
+            "num_clicks", "INT",
+            f"COUNT_IF(event_type_code IN ({event_type_codes(['view_product', 'add_to_cart', 'remove_from_cart'])}))"
+        ),
+    ),
+    derived=(
+        Column("conversion_rate", "FLOAT", "IFF(num_clicks = 0, 0, num_purchases / num_clicks)"),
+    ),
+)
+
+SESSION_METRICS_SPEC = MetricSpec(
+    table=SESSION_METRICS_TABLE,
+    source=SILVER_SESSIONS,
+    keys=(Column("session_id", "STRING"),),
+    dimensions=(Column("user_key", "INT"),),
+    event_time="event_timestamp",
+    measures=(
+        Column(
+            "session_duration_minutes", "FLOAT", "AVG(DATEDIFF('minute', start_time, end_time))",
+            "(existing.session_duration_minutes * existing.num_events + added.session_duration_minutes * added.num_events)"
+            " / (existing.num_events + added.num_events)"
+        ),
+        Column("num_events", "INT", "COUNT(*)"),
+    ),
+    derived=(
+        Column("is_bounce", "BOOLEAN", "num_events = 1"),
+    ),
+)
+
+PRODUCT_METRICS_SPEC = MetricSpec(
+    table=PRODUCT_METRICS_TABLE,
+    source=SILVER_EVENTS,
+    keys=(Column("product_key", "INT"),),
+    measures=(
+        Column("num_views", "INT", f"COUNT_IF(event_type_code = {event_type_codes(['view_product'])})"),
+        Column("num_add_to_cart", "INT", f"COUNT_IF(event_type_code = {event_type_codes(['add_to_cart'])})"),
+        Column("num_purchases", "INT", f"COUNT_IF(event_type_code = {event_type_codes(['purchase'])})"),
+    ),
+    derived=(
+        Column(
+            "click_to_purchase_rate", "FLOAT",
+            "IFF((num_views + num_add_to_cart) = 0, 0, num_purchases / (num_views + num_add_to_cart))"
+        ),
+    ),
+)
+
+# Order matters: specs are merged in this order inside a single transaction
+METRIC_SPECS: Dict[str, MetricSpec] = {
+    "users": USER_METRICS_SPEC,
+    "sessions": SESSION_METRICS_SPEC,
+    "products": PRODUCT_METRICS_SPEC,
+}
+
+
+def build_create_sql(spec: MetricSpec) -> str:
+    columns = [f"{c.name} {c.sql_type}" for c in spec.keys + spec.value_columns]
+    columns.append("ingested_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP()")
+    # When the row last changed; recomputes can rewrite a row without moving its ingested_at
+    columns.append("updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP()")
+    column_sql = ",\n            ".join(columns)
+    return f"""
+        CREATE TABLE IF NOT EXISTS {spec.table} (
+            {column_sql}
         )
-    """).collect()
-
-    session.sql(f"""
-        CREATE TABLE IF NOT EXISTS {SESSION_METRICS_TABLE} (
-            session_id STRING,
-            user_id STRING,
-            session_duration_minutes FLOAT,
-            num_events INT,
-            is_bounce BOOLEAN,
-            ingested_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP()
+        CLUSTER BY ({spec.cluster_by})
+    """
+
+
+def build_cluster_sql(spec: MetricSpec) -> str:
+    """Set the clustering key on tables created before it was declared."""
+    return f"ALTER TABLE {spec.table} CLUSTER BY ({spec.cluster_by})"
+
+
+def build_add_updated_at_sql(spec: MetricSpec) -> str:
+    """Add updated_at to tables created before it was declared."""
+    return f"ALTER TABLE {spec.table} ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP"
+
+
+def build_merge_sql(spec: MetricSpec, keys_query: str = "", late_before: Optional[datetime] = None,
+                    additive: bool = True) -> str:
+    """Generate a MERGE that folds the selected source rows into the Gold rows of the keys they touch.
+
+    Without keys_query the selected rows are the delta past the target watermark. Keys whose delta rows are all
+    on time (event time at or after late_before) get the delta's aggregate added to their existing row, each
+    measure through its `combine` expression, and their derived ratios recomputed from the sums. Keys with any
+    late row, and every key when additive is False, are recomputed from all of their source rows instead, so a
+    late row lands in the same value a full rebuild would give without re-reading the history of every key.
+    late_before None (no event-time watermark yet) counts no row as late. Additive merges need Silver rows to
+    be insert-only (see silver_is_insert_only): a rewritten row would be counted twice.
+
+    Every touched key takes the delta's latest ingested_at, which advances the watermark past it. With
+    keys_query (backfills), a query returning key columns whose placeholders the caller binds, those keys are
+    recomputed instead and the watermark never moves, so recomputes can run in any order (or concurrently) and the next incremental run
+    still picks up everything newer: a recomputed key's ingested_at becomes the latest ingested_at of its
+    source rows, capped at the watermark, and an existing row's ingested_at never goes back.
+
+    Every inserted or updated row gets updated_at = CURRENT_TIMESTAMP(), which is what the dashboard's
+    local cache refreshes on, so it also picks up recomputed rows whose ingested_at did not move.
+    """
+    group_cols = ", ".join(c.name for c in spec.group_columns)
+    key_cols = ", ".join(c.name for c in spec.keys)
+    measures = ",\n                    ".join(f"{c.expr} AS {c.name}" for c in spec.measures)
+    derived = "".join(f",\n                {c.expr} AS {c.name}" for c in spec.derived)
+    on_clause = " AND ".join(f"target.{c.name} = staging.{c.name}" for c in spec.keys)
+    target_watermark = f"SELECT COALESCE(MAX(ingested_at), '{DEFAULT_WATERMARK}'::TIMESTAMP) FROM {spec.table}"
+
+    updates = {c.name: f"staging.{c.name}" for c in spec.value_columns}
+    if keys_query:
+        delta_cte = ""
+        recompute_keys = keys_query
+        ingested_at = f"LEAST(MAX(ingested_at), ({target_watermark}))"
+        updates["ingested_at"] = "GREATEST(target.ingested_at, staging.ingested_at)"
+    else:
+        delta_cte = f"""
+            WITH delta AS (
+                SELECT * FROM {spec.source} WHERE ingested_at > ({target_watermark})
+            )"""
+        if not additive:
+            recompute_keys = f"SELECT {key_cols} FROM delta"
+        elif late_before is not None:
+            recompute_keys = f"SELECT {key_cols} FROM delta WHERE {spec.event_time} < {event_time.sql_timestamp(late_before)}"
+        else:
+            recompute_keys = ""
+        ingested_at = "(SELECT MAX(ingested_at) FROM delta)"
+        updates["ingested_at"] = "staging.ingested_at"
+    updates["updated_at"] = "CURRENT_TIMESTAMP()"
+    insert_cols = [c.name for c in spec.keys + spec.value_columns] + ["ingested_at"]
+    update_sql = ",\n                ".join(f"{name} = {expr}" for name, expr in updates.items())
+    insert_sql = ", ".join(insert_cols + ["updated_at"])
+    values_sql = ", ".join([f"staging.{name}" for name in insert_cols] + ["CURRENT_TIMESTAMP()"])
+
+    branches = []
+    if recompute_keys:
+        branches.append(f"""
+                SELECT
+                    {group_cols},
+                    {measures},
+                    {ingested_at} AS ingested_at
+                FROM {spec.source}
+                WHERE ({key_cols}) IN ({recompute_keys})
+                GROUP BY {group_cols}""")
+    if not keys_query and additive:
+        not_recomputed = ""
+        if recompute_keys:
+            match = " AND ".join(f"late.{c.name} = delta.{c.name}" for c in spec.keys)
+            not_recomputed = f"\n                    WHERE NOT EXISTS (SELECT 1 FROM ({recompute_keys}) AS late WHERE {match})"
+        new_key = " AND ".join(f"existing.{c.name} IS NULL" for c in spec.keys)
+        combined = ",\n                    ".join(
+            f"IFF({new_key}, added.{c.name}, {c.combine or f'existing.{c.name} + added.{c.name}'}) AS {c.name}"
+            for c in spec.measures
         )
-    """).collect()
-
-    session.sql(f"""
-        CREATE TABLE IF NOT EXISTS {PRODUCT_METRICS_TABLE} (
-            product_id STRING,
-            num_views INT,
-            num_add_to_cart INT,
-            num_purchases INT,
-            click_to_purchase_rate FLOAT,
-            ingested_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP()
-        )
-    """).collect()
-
-
-
-def get_last_ingested_at(session: Session, table_name: str, timestamp_col: str = "ingested_at"):
-    """Return latest ingested_at timestamp or default."""
-    try:
-        max_ts = session.table(table_name).select(sf_max(col(timestamp_col))).collect()[0][0]
-        if max_ts is None:
-            logging.info(f"No data in {table_name}, performing full load.")
-            return "1970-01-01 00:00:00"
-        logging.info(f"Last ingested record in {table_name}: {max_ts}")
-        return max_ts
-    except Exception as e:
-        logging.warning(f"Could not read {timestamp_col} from {table_name}: {e}")
-        return "1970-01-01 00:00:00"
-
-
-
-def compute_user_metrics(session: Session) -> None:
-    logging.info("Starting USER_METRICS incremental load...")
-    last_ingested_at = get_last_ingested_at(session, USER_METRICS_TABLE)
-    user_metric_df = session.table(SILVER_EVENTS).filter(col("ingested_at") > last_ingested_at)
-
-    if user_metric_df.count() == 0:
-        logging.info("No new user event data to process.")
-        return
-    
-    max_ingested_at = user_metric_df.select(sf_max(col("ingested_at"))).collect()[0][0]
-
-    user_metrics = (
-        user_metric_df.group_by("user_id")
-        .agg(
-            count("*").alias("total_events"),
-            count(when(col("event_type") == "purchase", True)).alias("num_purchases"),
-            count(when(col("event_type").isin("view_product", "add_to_cart", "remove_from_cart"), True)).alias("num_clicks")
-        )
-        .with_column(
-            "conversion_rate",
-            when(col("num_clicks") == 0, lit(0)).otherwise(col("num_purchases") / col("num_clicks"))
-        )
-        .with_column("ingested_at", lit(max_ingested_at))
+        carried = ", ".join(f"added.{c.name}" for c in spec.group_columns)
+        delta_measures = ",\n                        ".join(f"{c.expr} AS {c.name}" for c in spec.measures)
+        existing_on = " AND ".join(f"existing.{c.name} = added.{c.name}" for c in spec.keys)
+        branches.append(f"""
+                SELECT
+                    {carried},
+                    {combined},
+                    {ingested_at} AS ingested_at
+                FROM (
+                    SELECT
+                        {group_cols},
+                        {delta_measures}
+                    FROM delta{not_recomputed}
+                    GROUP BY {group_cols}
+                ) AS added
+                LEFT JOIN {spec.table} AS existing ON {existing_on}""")
+    union = "\n                UNION ALL".join(branches)
+
+    return f"""
+        MERGE INTO {spec.table} AS target
+        USING ({delta_cte}
+            SELECT *{derived}
+            FROM ({union}
+            )
+        ) AS staging
+        ON {on_clause}
+        WHEN MATCHED THEN
+            UPDATE SET
+                {update_sql}
+        WHEN NOT MATCHED THEN
+            INSERT ({insert_sql})
+            VALUES ({values_sql})
+    """
+
+
+def execute_script(session: Session, statements: List[str]) -> List[list]:
+    """Run several statements in one round trip and return the result rows of each."""
+    script = ";\n".join(statements)
+    results = []
+    with session.connection.cursor() as cur:
+        cur.execute(script, num_statements=len(statements))
+        while True:
+            note_query(cur.sfqid)
+            results.append(cur.fetchall())
+            if not cur.nextset():
+                break
+    return results
+
+
+def ensure_gold_tables(session: Session, specs: List[MetricSpec] = None) -> None:
+    logging.info("Ensuring Gold layer tables exist...")
+    specs = specs or list(METRIC_SPECS.values())
+    statements = (
+        [build_create_sql(spec) for spec in specs]
+        + [build_cluster_sql(spec) for spec in specs]
+        + [build_add_updated_at_sql(spec) for spec in specs]
     )
+    execute_script(session, statements + event_time.build_create_sql())
 
 
-    user_metrics.write.save_as_table(USER_STAGE, mode= "overwrite")
-
-    target = session.table(USER_METRICS_TABLE).alias("target")
-    staging = session.table(USER_STAGE).alias("staging")
-
-    merge_result: MergeResult = target.merge(
-        staging,
-        target["user_id"] == staging["user_id"],
-        [
-            when_matched().update({
-                "total_events": staging["total_events"],
-                "num_purchases": staging["num_purchases"],
-                "num_clicks": staging["num_clicks"],
-                "conversion_rate": staging["conversion_rate"],
-                "ingested_at": staging["ingested_at"]
-            }),
-            when_not_matched().insert({
-                "user_id": staging["user_id"],
-                "total_events": staging["total_events"],
-                "num_purchases": staging["num_purchases"],
-                "num_clicks": staging["num_clicks"],
-                "conversion_rate": staging["conversion_rate"],
-                "ingested_at": staging["ingested_at"]
-            })
-        ]
-    )
-    logging.info(f"User metrics merged: {merge_result.rows_inserted} inserted, {merge_result.rows_updated} updated")
-
+def measure_lateness(session: Session, specs: List[MetricSpec], lateness: timedelta) -> Dict[str, event_time.LatenessStats]:
+    """Lateness of every spec's pending delta against the spec's event-time watermark, in one round trip."""
+    statements = [
+        event_time.build_lateness_sql(
+            spec.table, spec.source, spec.table, spec.event_time, [c.name for c in spec.keys], lateness, DEFAULT_WATERMARK
+        )
+        for spec in specs
+    ]
+    results = execute_script(session, statements)
+    return {
+        spec.table: event_time.stats_from_row(spec.table, lateness, rows[0])
+        for spec, rows in zip(specs, results)
+    }
 
-def compute_session_metrics(session: Session) -> None:
-    logging.info("Starting SESSION_METRICS incremental load...")
-    last_ingested_at = get_last_ingested_at(session, SESSION_METRICS_TABLE)
-    session_metrics_df = session.table(SILVER_SESSIONS).filter(col("ingested_at") > last_ingested_at)
 
-    if session_metrics_df.count() == 0:
-        logging.info("No new session data to process.")
-        return
-    max_ingested_at = session_metrics_df.select(sf_max(col("ingested_at"))).collect()[0][0]
+def silver_is_insert_only() -> bool:
+    """Whether Silver rows are only ever inserted, which additive Gold merges rely on.
 
-    session_metrics = (
-        session_metrics_df.group_by("session_id", "user_id")
-        .agg(
-            count("*").alias("num_events"),
-            avg(datediff("minute", col("start_time"), col("end_time"))).alias("session_duration_minutes")
-        )
-        .with_column(
-            "is_bounce",
-            when(col("num_events") == 1, lit(True)).otherwise(lit(False))
-        )
-        .with_column(
-            "ingested_at",
-            lit(max_ingested_at)
-        )
-    )
+    bronze_to_silver drops keys its dedupe index has seen before the MERGE, so a redelivered event never
+    rewrites its row. With DEDUPE_INDEX=off it does, moving the row's ingested_at into the next Gold delta.
+    """
+    return os.getenv("DEDUPE_INDEX", "stage").lower() != "off"
 
-    session_metrics.write.save_as_table(SESSION_STAGE, mode="overwrite")
-
-    target = session.table(SESSION_METRICS_TABLE).alias("target")
-    staging = session.table(SESSION_STAGE).alias("staging")
-
-    merge_result: MergeResult = target.merge(
-        staging,
-        target["session_id"] == staging["session_id"],
-        [
-            when_matched().update({
-                "user_id": staging["user_id"],
-                "session_duration_minutes": staging["session_duration_minutes"],
-                "num_events": staging["num_events"],
-                "is_bounce": staging["is_bounce"],
-                "ingested_at": staging["ingested_at"]
-            }),
-            when_not_matched().insert({
-                "session_id": staging["session_id"],
-                "user_id": staging["user_id"],
-                "session_duration_minutes": staging["session_duration_minutes"],
-                "num_events": staging["num_events"],
-                "is_bounce": staging["is_bounce"],
-                "ingested_at": staging["ingested_at"]
-            })
-        ]
-    )
-    logging.info(f"Session metrics merged: {merge_result.rows_inserted} inserted, {merge_result.rows_updated} updated.")
 
-def compute_product_metrics(session: Session) -> None:
-    logging.info("Starting PRODUCT_METRICS incremental load...")
-    last_ingested_at = get_last_ingested_at(session, PRODUCT_METRICS_TABLE)
-    product_metrics_df = session.table(SILVER_EVENTS).filter(col("ingested_at") > last_ingested_at)
+def run_metric_specs(session: Session, specs: List[MetricSpec], lateness: Optional[timedelta] = None) -> None:
+    """Merge every spec's delta into Gold as one multi-statement transaction.
 
-    if product_metrics_df.count() == 0:
-        logging.info("No new product event data to process.")
+    The delta's lateness is measured first: keys it touches only with on-time rows are merged additively, and
+    keys with rows more than `lateness` behind the spec's event-time watermark are recomputed from their full
+    history (see build_merge_sql). The watermarks and lateness stats are written in the same transaction.
+    """
+    if not specs:
         return
-    
-    max_ingested_at = product_metrics_df.select(sf_max(col("ingested_at"))).collect()[0][0]
-
-    product_metrics = (
-        product_metrics_df.group_by("product_id")
-        .agg(
-            count(when(col("event_type") == "view_product", True)).alias("num_views"),
-            count(when(col("event_type") == "add_to_cart", True)).alias("num_add_to_cart"),
-            count(when(col("event_type") == "purchase", True)).alias("num_purchases")
-        )
-        .with_column(
-            "click_to_purchase_rate",
-            when((col("num_views") + col("num_add_to_cart")) == 0, lit(0))
-            .otherwise(col("num_purchases") / (col("num_views") + col("num_add_to_cart")))
-        )
-        .with_column("ingested_at", lit(max_ingested_at))
-    )
-    product_metrics.write.save_as_table(PRODUCT_STAGE, mode="overwrite")
-    target = session.table(PRODUCT_METRICS_TABLE).alias("target")
-    staging = session.table(PRODUCT_STAGE).alias("staging")
-
-    merge_result: MergeResult = target.merge(
-        staging,
-        target["product_id"] == staging["product_id"],
-        [
-            when_matched().update({
-                "num_views": staging["num_views"],
-                "num_add_to_cart": staging["num_add_to_cart"],
-                "num_purchases": staging["num_purchases"],
-                "click_to_purchase_rate": staging["click_to_purchase_rate"],
-                "ingested_at": staging["ingested_at"]
-            }),
-            when_not_matched().insert({
-                "product_id": staging["product_id"],
-                "num_views": staging["num_views"],
-                "num_add_to_cart": staging["num_add_to_cart"],
-                "num_purchases": staging["num_purchases"],
-                "click_to_purchase_rate": staging["click_to_purchase_rate"],
-                "ingested_at": staging["ingested_at"]
-            })
-        ]
-    )
-    logging.info(f"Product metrics merged: {merge_result.rows_inserted} inserted, {merge_result.rows_updated} updated.")
+    lateness = event_time.allowed_lateness() if lateness is None else lateness
+    stats = measure_lateness(session, specs, lateness)
+    for spec in specs:
+        logging.info(f"{spec.table} lateness: {stats[spec.table]}")
+    additive = silver_is_insert_only()
+    if not additive:
+        logging.info("DEDUPE_INDEX is off, so Silver rows can be rewritten: recomputing every touched key.")
+
+    statements = ["BEGIN"] + [
+        build_merge_sql(spec, late_before=stats[spec.table].late_before, additive=additive) for spec in specs
+    ]
+    bookkeeping = [
+        event_time.build_watermark_merge_sql(list(stats.values())),
+        event_time.build_stats_insert_sql(list(stats.values()), getattr(session, "query_tag", None)),
+    ]
+    statements += [sql for sql in bookkeeping if sql] + ["COMMIT"]
+
+    logging.info(f"Merging {', '.join(spec.table for spec in specs)} in a single transaction...")
+    try:
+        results = execute_script(session, statements)
+    except Exception as e:
+        logging.error(f"Gold merge transaction failed: {e}")
+        session.sql("ROLLBACK").collect()
+        raise
 
+    for spec, rows in zip(specs, results[1:]):
+        inserted, updated = rows[0][0], rows[0][1]
+        note(rows_inserted=inserted, rows_updated=updated)
+        logging.info(f"{spec.table} merged: {inserted} inserted, {updated} updated.")
 
 
-def main(step: str, env_path: str):
+
+def main(step: str, env_path: str, lateness_minutes: Optional[float] = None):
 
     # Check if file exists
     if not os.path.exists(env_path):
@@ -265,16 +376,21 @@ def main(step: str, env_path: str):
     if missing:
         raise ValueError(f"Missing enviroment variables: {','.join(missing)}")
 
+    from snowflake.snowpark import Session
     session = Session.builder.configs(connection_params).create()
-    ensure_gold_tables(session)
+    telemetry = RunTelemetry("gold_aggregation", session)
+    sizing = WarehouseController.from_env(session)
+    specs = [spec for name, spec in METRIC_SPECS.items() if step in ["all", name]]
+    lateness = event_time.allowed_lateness(lateness_minutes)
     try:
-        if step in ["all","users"]:
-            compute_user_metrics(session)
-        if step in ["all","sessions"]:
-            compute_session_metrics(session)    
-        if step in ["all","products"]:
-            compute_product_metrics(session)
+        with telemetry.step("ensure_tables"), profiling.step("ensure_gold_tables"):
+            ensure_gold_tables(session, specs)
+        with telemetry.step(f"merge_{step}"), sizing.sized(
+            "gold", lambda: sum(estimate_delta(session, spec.source, spec.table) for spec in specs)
+        ), profiling.step(f"run_metric_specs_{step}"):
+            run_metric_specs(session, specs, lateness)
     finally:
+        telemetry.flush()
         session.close()
         logging.info("Snowpark session closed.")
 
@@ -282,5 +398,11 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--step", choices=["all", "users", "sessions", "products"], default="all")
     parser.add_argument("--env", default=".env", help="Path to .env file")
+    parser.add_argument(
+        "--allowed-lateness-minutes", type=float, default=None,
+        help=f"Event-time lateness before a row is late and its key is recomputed from full history (default: ALLOWED_LATENESS_MINUTES or {event_time.DEFAULT_ALLOWED_LATENESS_MINUTES})"
+    )
+    profiling.add_profile_arguments(parser)
     args = parser.parse_args()
-    main(args.step, args.env)
\ No newline at end of file
+    profiling.configure(args.profile, "gold_aggregation", args.profile_dir)
+    main(args.step, args.env, args.allowed_lateness_minutes)
\ No newline at end of file
@@ -1,12 +1,19 @@
+from __future__ import annotations
 import os
 import logging
-import snowflake.connector
 from pathlib import Path
 from dotenv import load_dotenv
 import sys
+import argparse
+import profiling
+from typing import TYPE_CHECKING
+from pipeline_telemetry import RunTelemetry, note, note_query
+
+if TYPE_CHECKING:
+    import snowflake.connector
 
 # Default configuration values, can be overridden by .env or CLI arguments
-env_path = sys.argv[1] if len(sys.argv) > 1 else '.env'
+env_path = sys.argv[1] if len(sys.argv) > 1 and not sys.argv[1].startswith("-") else '.env'
 load_dotenv(env_path) #Load credentials found in .env file
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
@@ -19,6 +26,8 @@ JSON_PATH = BASE_DIR/ "data"/ "raw"/ "sessions.json"
 STAGE_NAME = os.getenv("SNOWFLAKE_STAGE","MY_STAGE")
 
 def connect_to_snowflake() -> snowflake.connector.SnowflakeConnection:
+    #The connector takes about a second to import, so --help and argument errors skip it
+    import snowflake.connector
     logging.info("Connecting to Snowflake....")
     conn = snowflake.connector.connect(
         user = os.getenv("SNOWFLAKE_USER"),
@@ -85,6 +94,8 @@ def load_csv_events(conn: snowflake.connector.SnowflakeConnection, csv_path: Pat
     with conn.cursor() as cur:
         #Moving file to stage
         cur.execute(f"PUT file://{csv_path} @{STAGE_NAME} OVERWRITE=TRUE")
+        note_query(cur.sfqid)
+        note(bytes_staged=sum(row[3] for row in cur.fetchall()))
 
         merge_sql=f"""
             MERGE INTO EVENTS AS target
@@ -103,6 +114,9 @@ def load_csv_events(conn: snowflake.connector.SnowflakeConnection, csv_path: Pat
         """
         #Merging data from stage to table
         cur.execute(merge_sql)
+        note_query(cur.sfqid)
+        inserted, updated = cur.fetchone()
+        note(rows_in=inserted + updated, rows_out=inserted + updated, rows_inserted=inserted, rows_updated=updated)
         #Remove file from stage to prevent unnecessary storage retention
         cur.execute(f"REMOVE @{STAGE_NAME}/{csv_path.name}")
     logging.info("CSV events merged successfully")
@@ -112,6 +126,8 @@ def load_json_sessions(conn: snowflake.connector.SnowflakeConnection, json_path:
     with conn.cursor() as cur:
         # Stage the file
         cur.execute(f"PUT file://{json_path} @{STAGE_NAME} OVERWRITE=TRUE")
+        note_query(cur.sfqid)
+        note(bytes_staged=sum(row[3] for row in cur.fetchall()))
 
         merge_sql = f"""
             MERGE INTO SESSIONS AS target
@@ -143,6 +159,9 @@ def load_json_sessions(conn: snowflake.connector.SnowflakeConnection, json_path:
                 source.device, source.location, source.events, CURRENT_TIMESTAMP());
         """
         cur.execute(merge_sql)
+        note_query(cur.sfqid)
+        inserted, updated = cur.fetchone()
+        note(rows_in=inserted + updated, rows_out=inserted + updated, rows_inserted=inserted, rows_updated=updated)
 
         # Clean up staged file
         cur.execute(f"REMOVE @{STAGE_NAME}/{json_path.name}")
@@ -150,16 +169,34 @@ def load_json_sessions(conn: snowflake.connector.SnowflakeConnection, json_path:
     logging.info("JSON sessions merged successfully")
 
 
-def main():
+def main(lake: Path = None):
     conn = connect_to_snowflake()
+    telemetry = RunTelemetry("ingestion", conn)
     try:
-        setup_schema(conn)
-        load_csv_events(conn, CSV_PATH)
-        load_json_sessions(conn, JSON_PATH)
+        with telemetry.step("setup_schema"), profiling.step("setup_schema"):
+            setup_schema(conn)
+        with telemetry.step("load_events"), profiling.step("load_csv_events"):
+            load_csv_events(conn, CSV_PATH)
+        with telemetry.step("load_sessions"), profiling.step("load_json_sessions"):
+            load_json_sessions(conn, JSON_PATH)
+        if lake is not None:
+            #Local Bronze copy; ingested_at is the local load time rather than the warehouse's
+            import pandas as pd
+            from local_lake import write_files
+            with profiling.step("write_lake"):
+                write_files([CSV_PATH], [JSON_PATH], "bronze", lake, pd.Timestamp.now())
     finally:
+        telemetry.flush()
         conn.close()
         logging.info("Snowflake connection closed")
 
 
 if __name__ == "__main__":
-    main()
+    #The .env path stays the first positional argument (read above, before anything else is configured)
+    parser = argparse.ArgumentParser(description="Stage and merge the raw events and sessions into Bronze.")
+    parser.add_argument("env", nargs="?", default=".env", help="Path to .env file")
+    parser.add_argument("--lake", type=Path, default=None, help="Also write the loaded files to this local Parquet lake's bronze layer")
+    profiling.add_profile_arguments(parser)
+    args = parser.parse_args()
+    profiling.configure(args.profile, "ingestion", args.profile_dir)
+    main(args.lake)
@@ -0,0 +1,238 @@
+'''In-memory pandas stand-in for the Snowflake Bronze/Silver/Gold tables, for running the pipeline offline.
+
+Mirrors the merge semantics of ingestion_to_snowflake.py, bronze_to_silver.py and gold_aggregation.py:
+Bronze upserts by natural key and stamps ingested_at, Silver replaces the dimension columns with the surrogate
+keys of dimensions.py, Silver and Gold only process rows newer than their own ingested_at watermark, and Gold
+recomputes every key the delta touches from all of its Silver rows.
+
+With a lake directory, every delta is also upserted into the date-partitioned Parquet lake (local_lake.py),
+and ingest_lake() replays a time range of the lake's raw layer instead of re-reading whole files.
+
+This is a smoke-test harness, not a model of the warehouse: it is a separate pandas implementation of those
+semantics and runs none of the Snowpark build_* code, so it says nothing about the speed or cost of the real
+stages. benchmark_pipeline.py runs it to check the stages still produce Gold, but does not gate on its timings.
+'''
+import json
+import logging
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import pandas as pd
+import dimensions
+
+EVENT_COLUMNS = ["event_id", "user_id", "event_type", "product_id", "timestamp"]
+SESSION_COLUMNS = ["session_id", "user_id", "start_time", "end_time", "device", "location", "events"]
+CLICK_EVENTS = ["view_product", "add_to_cart", "remove_from_cart"]
+CLICK_CODES = [dimensions.EVENT_TYPE_CODES[event_type] for event_type in CLICK_EVENTS]
+VIEW, ADD_TO_CART, PURCHASE = (dimensions.EVENT_TYPE_CODES[t] for t in ["view_product", "add_to_cart", "purchase"])
+
+
+def dimension_table(dim: dimensions.Dimension) -> str:
+    """Local table name of a dimension, e.g. dim_user for SILVER.DIM_USER."""
+    return dim.table.split(".")[1].lower()
+
+
+def upsert(target: pd.DataFrame, delta: pd.DataFrame, keys: List[str]) -> pd.DataFrame:
+    """MERGE equivalent: rows in delta replace rows in target with the same keys."""
+    if target.empty:
+        return delta.drop_duplicates(keys, keep="last").reset_index(drop=True)
+    merged = pd.concat([target, delta], ignore_index=True)
+    return merged.drop_duplicates(keys, keep="last").reset_index(drop=True)
+
+
+def delta_since(frame: pd.DataFrame, watermark: Optional[pd.Timestamp]) -> pd.DataFrame:
+    if frame.empty or watermark is None:
+        return frame
+    return frame[frame["ingested_at"] > watermark]
+
+
+def read_events_csv(path: Path) -> pd.DataFrame:
+    events = pd.read_csv(path, usecols=EVENT_COLUMNS)
+    events["timestamp"] = pd.to_datetime(events["timestamp"], format="ISO8601")
+    return events
+
+
+def read_sessions_json(path: Path) -> pd.DataFrame:
+    with open(path, encoding="utf-8") as f:
+        sessions = pd.DataFrame(json.load(f), columns=SESSION_COLUMNS)
+    sessions["start_time"] = pd.to_datetime(sessions["start_time"], format="ISO8601")
+    sessions["end_time"] = pd.to_datetime(sessions["end_time"], format="ISO8601")
+    return sessions
+
+
+def watermark(frame: pd.DataFrame) -> Optional[pd.Timestamp]:
+    return None if frame.empty else frame["ingested_at"].max()
+
+
+class LocalBackend:
+    """Same interface as micro_batch.SnowflakeBackend, backed by DataFrames held in memory."""
+
+    def __init__(self, lake: Optional[Path] = None):
+        self.lake = lake
+        self.tables: Dict[str, pd.DataFrame] = {
+            name: pd.DataFrame() for name in [
+                "bronze_events", "bronze_sessions", "silver_events", "silver_sessions",
+                "user_metrics", "session_metrics", "product_metrics",
+            ]
+        }
+        for dim in dimensions.DIMENSIONS.values():
+            name = dimension_table(dim)
+            self.tables[name] = pd.DataFrame({dim.key: pd.Series(dtype="int64"), dim.value: pd.Series(dtype=object)})
+            if dim.seed:
+                self._merge(name, pd.DataFrame({
+                    dim.key: range(1, len(dim.seed) + 1), dim.value: dim.seed, "ingested_at": pd.Timestamp.now(),
+                }), [dim.key], f"silver.{name}")
+
+    def _merge(self, name: str, delta: pd.DataFrame, keys: List[str], lake_table: str) -> None:
+        self.tables[name] = upsert(self.tables[name], delta, keys)
+        if self.lake is not None:
+            from local_lake import write_table
+            write_table(delta, lake_table, self.lake)
+
+    def ingest(self, csv_paths: List[Path], json_paths: List[Path]) -> None:
+        now = pd.Timestamp.now()
+        for path in csv_paths:
+            events = read_events_csv(path)
+            self._load_events(events.assign(ingested_at=now), path.name)
+        for path in json_paths:
+            sessions = read_sessions_json(path)
+            self._load_sessions(sessions.assign(ingested_at=now), path.name)
+
+    def ingest_lake(self, start=None, end=None, lake: Optional[Path] = None) -> None:
+        """Load the raw layer's rows with event time in [start, end) into Bronze (a replay of that range)."""
+        from local_lake import LAKE_DIR, read_table
+        lake = lake or self.lake or LAKE_DIR
+        now = pd.Timestamp.now()
+        events = read_table("raw.events", start, end, EVENT_COLUMNS, lake)
+        sessions = read_table("raw.sessions", start, end, SESSION_COLUMNS, lake)
+        if not events.empty:
+            self._load_events(events.assign(ingested_at=now), "lake raw.events")
+        if not sessions.empty:
+            self._load_sessions(sessions.assign(ingested_at=now), "lake raw.sessions")
+
+    def _load_events(self, events: pd.DataFrame, source: str) -> None:
+        self._merge("bronze_events", events, ["event_id"], "bronze.events")
+        logging.info(f"Local: loaded {len(events)} events from {source}")
+
+    def _load_sessions(self, sessions: pd.DataFrame, source: str) -> None:
+        self._merge("bronze_sessions", sessions, ["session_id"], "bronze.sessions")
+        logging.info(f"Local: loaded {len(sessions)} sessions from {source}")
+
+    def bronze_to_silver(self) -> None:
+        self._clean_events()
+        self._flatten_sessions()
+
+    def _encode(self, frame: pd.DataFrame) -> pd.DataFrame:
+        """dimensions.register() and encode(): new values get the next keys, then each column becomes its key."""
+        frame = frame.copy()
+        for dim in dimensions.DIMENSIONS.values():
+            if dim.value not in frame.columns:
+                continue
+            name = dimension_table(dim)
+            table = self.tables[name]
+            new = pd.Index(frame[dim.value].dropna().unique()).difference(table[dim.value])
+            if len(new):
+                next_key = int(table[dim.key].max()) + 1 if not table.empty else 1
+                self._merge(name, pd.DataFrame({
+                    dim.key: range(next_key, next_key + len(new)),
+                    dim.value: new.sort_values(),
+                    "ingested_at": pd.Timestamp.now(),
+                }), [dim.key], f"silver.{name}")
+                table = self.tables[name]
+            keys = pd.Series(table[dim.key].to_numpy(), index=table[dim.value].to_numpy())
+            frame[dim.key] = frame.pop(dim.value).map(keys).astype("Int64")
+        return frame
+
+    def _clean_events(self) -> None:
+        events = delta_since(self.tables["bronze_events"], watermark(self.tables["silver_events"]))
+        if events.empty:
+            return
+        events = (
+            events.assign(event_type=events["event_type"].str.lower())
+            .dropna(subset=["event_id", "user_id", "event_type", "timestamp"])
+            .drop_duplicates(["event_id"])
+        )
+        events = self._encode(events)
+        self._merge("silver_events", events, ["event_id"], "silver.events")
+        logging.info(f"Local: {len(events)} events merged into Silver")
+
+    def _flatten_sessions(self) -> None:
+        sessions = delta_since(self.tables["bronze_sessions"], watermark(self.tables["silver_sessions"]))
+        if sessions.empty:
+            return
+        flat = sessions.explode("events").dropna(subset=["events"])
+        if flat.empty:
+            return
+        flat = pd.DataFrame({
+            "session_id": flat["session_id"],
+            "user_id": flat["user_id"],
+            "start_time": flat["start_time"],
+            "end_time": flat["end_time"],
+            "event_type": flat["events"].map(lambda e: e.get("type")).str.lower(),
+            "product_id": flat["events"].map(lambda e: e.get("product_id")),
+            "browser": flat["device"].map(lambda d: d.get("browser")),
+            "operating_system": flat["device"].map(lambda d: d.get("os")),
+            "country": flat["location"].map(lambda l: l.get("country")),
+            "city": flat["location"].map(lambda l: l.get("city")),
+            "event_timestamp": pd.to_datetime(flat["events"].map(lambda e: e.get("timestamp")), format="ISO8601"),
+            "ingested_at": flat["ingested_at"],
+        }).drop_duplicates(["session_id", "event_type", "event_timestamp"])
+        flat = self._encode(flat)
+        self._merge("silver_sessions", flat, ["session_id", "event_type_code", "event_timestamp"], "silver.sessions")
+        logging.info(f"Local: {len(flat)} session events merged into Silver")
+
+    def _touched(self, source: str, target: str, key: str) -> Tuple[pd.DataFrame, Optional[pd.Timestamp]]:
+        """All source rows of the keys in the delta past the target's watermark, and the delta's latest ingested_at."""
+        table = self.tables[source]
+        delta = delta_since(table, watermark(self.tables[target]))
+        if delta.empty:
+            return delta, None
+        return table[table[key].isin(delta[key])], delta["ingested_at"].max()
+
+    def silver_to_gold(self) -> None:
+        events, latest = self._touched("silver_events", "user_metrics", "user_key")
+        if not events.empty:
+            users = events.assign(
+                is_purchase=events["event_type_code"] == PURCHASE,
+                is_click=events["event_type_code"].isin(CLICK_CODES),
+            ).groupby("user_key", as_index=False).agg(
+                total_events=("event_id", "size"),
+                num_purchases=("is_purchase", "sum"),
+                num_clicks=("is_click", "sum"),
+            )
+            users["conversion_rate"] = (users["num_purchases"] / users["num_clicks"]).where(users["num_clicks"] > 0, 0.0)
+            users["ingested_at"] = latest
+            users["updated_at"] = pd.Timestamp.now()
+            self._merge("user_metrics", users, ["user_key"], "gold.user_metrics")
+
+        events, latest = self._touched("silver_events", "product_metrics", "product_key")
+        if not events.empty:
+            products = events.assign(
+                is_view=events["event_type_code"] == VIEW,
+                is_add=events["event_type_code"] == ADD_TO_CART,
+                is_purchase=events["event_type_code"] == PURCHASE,
+            ).groupby("product_key", as_index=False).agg(
+                num_views=("is_view", "sum"),
+                num_add_to_cart=("is_add", "sum"),
+                num_purchases=("is_purchase", "sum"),
+            )
+            clicks = products["num_views"] + products["num_add_to_cart"]
+            products["click_to_purchase_rate"] = (products["num_purchases"] / clicks).where(clicks > 0, 0.0)
+            products["ingested_at"] = latest
+            products["updated_at"] = pd.Timestamp.now()
+            self._merge("product_metrics", products, ["product_key"], "gold.product_metrics")
+
+        sessions, latest = self._touched("silver_sessions", "session_metrics", "session_id")
+        if not sessions.empty:
+            # DATEDIFF('minute', ...) counts minute boundaries crossed
+            minutes = (sessions["end_time"].dt.floor("min") - sessions["start_time"].dt.floor("min")).dt.total_seconds() / 60
+            metrics = sessions.assign(duration=minutes).groupby(["session_id", "user_key"], as_index=False).agg(
+                session_duration_minutes=("duration", "mean"),
+                num_events=("session_id", "size"),
+            )
+            metrics["is_bounce"] = metrics["num_events"] == 1
+            metrics["ingested_at"] = latest
+            metrics["updated_at"] = pd.Timestamp.now()
+            self._merge("session_metrics", metrics, ["session_id"], "gold.session_metrics")
+
+    def close(self) -> None:
+        pass
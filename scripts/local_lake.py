@@ -0,0 +1,240 @@
+'''Date-partitioned local Parquet lake for the raw, Bronze, Silver and Gold tables.
+
+Layout: <root>/<layer>/<table>/date=YYYY-MM-DD/part-0.parquet, one file per day of the table's partition
+column, sorted by that column and written in fixed-size row groups with min/max statistics. Writes upsert by
+the table's key: only key columns are read to find replaced rows, and only partitions that gain or lose rows
+are rewritten. read_table() skips whole partitions outside the
+time range, then row groups whose min/max statistics fall outside it, and reads only the requested columns.
+
+Gold rows have no event time, so Gold is partitioned by the date of its ingested_at (the date the dashboard
+filters on). A key that moves to another day is removed from its old partition on the next write.
+'''
+import os
+import logging
+import argparse
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+LAKE_DIR = Path(os.getenv("LOCAL_LAKE_DIR", Path(__file__).resolve().parent.parent / "data" / "lake"))
+ROW_GROUP_ROWS = int(os.getenv("LOCAL_LAKE_ROW_GROUP_ROWS", "65536"))
+PARTITION_PREFIX = "date="
+PART_FILE = "part-0.parquet"
+
+
+@dataclass(frozen=True)
+class LakeTable:
+    layer: str
+    name: str
+    date_column: str
+    keys: Tuple[str, ...]
+
+
+TABLES: Dict[str, LakeTable] = {
+    f"{spec.layer}.{spec.name}": spec for spec in [
+        LakeTable("raw", "events", "timestamp", ("event_id",)),
+        LakeTable("raw", "sessions", "start_time", ("session_id",)),
+        LakeTable("bronze", "events", "timestamp", ("event_id",)),
+        LakeTable("bronze", "sessions", "start_time", ("session_id",)),
+        LakeTable("silver", "events", "timestamp", ("event_id",)),
+        LakeTable("silver", "sessions", "event_timestamp", ("session_id", "event_type_code", "event_timestamp")),
+        LakeTable("gold", "user_metrics", "ingested_at", ("user_key",)),
+        LakeTable("gold", "session_metrics", "ingested_at", ("session_id",)),
+        LakeTable("gold", "product_metrics", "ingested_at", ("product_key",)),
+    ]
+}
+#Dimension tables of dimensions.py, partitioned by the day their entries were added
+TABLES.update({
+    f"silver.{name}": LakeTable("silver", name, "ingested_at", (key,)) for name, key in [
+        ("dim_user", "user_key"), ("dim_product", "product_key"), ("dim_event_type", "event_type_code"),
+        ("dim_browser", "browser_code"), ("dim_operating_system", "operating_system_code"), ("dim_city", "city_code"),
+    ]
+})
+
+
+@dataclass
+class ScanStats:
+    partitions_total: int = 0
+    partitions_read: int = 0
+    # Row groups are only counted inside the partitions that survive date pruning
+    row_groups_total: int = 0
+    row_groups_read: int = 0
+    rows_read: int = 0
+    columns: List[str] = field(default_factory=list)
+
+    def __str__(self) -> str:
+        return (
+            f"{self.partitions_read}/{self.partitions_total} partitions, "
+            f"{self.row_groups_read}/{self.row_groups_total} row groups, {self.rows_read:,} rows"
+        )
+
+
+def table_dir(table: str, root: Path = LAKE_DIR) -> Path:
+    spec = TABLES[table]
+    return Path(root) / spec.layer / spec.name
+
+
+def partition_date(path: Path) -> date:
+    return date.fromisoformat(path.name[len(PARTITION_PREFIX):])
+
+
+def list_partitions(table: str, root: Path = LAKE_DIR) -> List[Path]:
+    base = table_dir(table, root)
+    if not base.exists():
+        return []
+    return sorted(path for path in base.iterdir() if path.name.startswith(PARTITION_PREFIX) and (path / PART_FILE).exists())
+
+
+def _write_partition(path: Path, frame: pd.DataFrame, date_column: str) -> None:
+    path.mkdir(parents=True, exist_ok=True)
+    frame = frame.sort_values(date_column, kind="stable")
+    tmp_path = path / f"{PART_FILE}.tmp"
+    pq.write_table(
+        pa.Table.from_pandas(frame, preserve_index=False), tmp_path,
+        row_group_size=ROW_GROUP_ROWS, write_statistics=True,
+    )
+    os.replace(tmp_path, path / PART_FILE)
+
+
+def write_table(frame: pd.DataFrame, table: str, root: Path = LAKE_DIR) -> int:
+    """Upsert frame into the table by key; returns the number of partitions rewritten."""
+    spec = TABLES[table]
+    if frame.empty:
+        return 0
+    keys = list(spec.keys)
+    frame = frame.drop_duplicates(keys, keep="last")
+    days = pd.to_datetime(frame[spec.date_column]).dt.date
+    incoming = {day: rows for day, rows in frame.groupby(days, sort=True)}
+    delta_keys = pd.MultiIndex.from_frame(frame[keys])
+
+    rewritten = 0
+    base = table_dir(table, root)
+    for path in list_partitions(table, root):
+        day = partition_date(path)
+        # Only the key columns are read to find rows this write replaces
+        existing_keys = pq.read_table(path / PART_FILE, columns=keys).to_pandas()
+        stale = pd.MultiIndex.from_frame(existing_keys).isin(delta_keys)
+        if day not in incoming and not stale.any():
+            continue
+        existing = pq.read_table(path / PART_FILE).to_pandas()
+        kept = existing[~stale]
+        new_rows = incoming.pop(day, None)
+        merged = pd.concat([kept, new_rows], ignore_index=True) if new_rows is not None else kept
+        if merged.empty:
+            (path / PART_FILE).unlink()
+            path.rmdir()
+        else:
+            _write_partition(path, merged, spec.date_column)
+        rewritten += 1
+    for day, rows in incoming.items():
+        _write_partition(base / f"{PARTITION_PREFIX}{day.isoformat()}", rows, spec.date_column)
+        rewritten += 1
+    logging.info(f"Lake: {len(frame)} rows upserted into {table} ({rewritten} partitions written)")
+    return rewritten
+
+
+def write_files(csv_paths: List[Path], json_paths: List[Path], layer: str, root: Path = LAKE_DIR,
+                ingested_at: Optional[pd.Timestamp] = None) -> None:
+    """Land simulator CSV event files and JSON session files in the raw or bronze layer."""
+    from local_backend import read_events_csv, read_sessions_json
+    for path in csv_paths:
+        events = read_events_csv(path)
+        if ingested_at is not None:
+            events["ingested_at"] = ingested_at
+        write_table(events, f"{layer}.events", root)
+    for path in json_paths:
+        sessions = read_sessions_json(path)
+        if ingested_at is not None:
+            sessions["ingested_at"] = ingested_at
+        write_table(sessions, f"{layer}.sessions", root)
+
+
+def _row_group_overlaps(metadata: pq.FileMetaData, index: int, column_index: int,
+                        low: Optional[pd.Timestamp], high: Optional[pd.Timestamp]) -> bool:
+    stats = metadata.row_group(index).column(column_index).statistics
+    if stats is None or not stats.has_min_max:
+        return True
+    if low is not None and pd.Timestamp(stats.max) < low:
+        return False
+    if high is not None and pd.Timestamp(stats.min) >= high:
+        return False
+    return True
+
+
+def scan_table(table: str, start: Optional[datetime] = None, end: Optional[datetime] = None,
+               columns: Optional[List[str]] = None, root: Path = LAKE_DIR) -> Tuple[pd.DataFrame, ScanStats]:
+    """Rows whose partition column is in [start, end) (None = unbounded), with what the scan had to read."""
+    spec = TABLES[table]
+    low = pd.Timestamp(start) if start is not None else None
+    high = pd.Timestamp(end) if end is not None else None
+    partitions = list_partitions(table, root)
+    stats = ScanStats(partitions_total=len(partitions))
+    frames = []
+    for path in partitions:
+        day = pd.Timestamp(partition_date(path))
+        if (low is not None and day + pd.Timedelta(days=1) <= low) or (high is not None and day >= high):
+            continue
+        parquet = pq.ParquetFile(path / PART_FILE)
+        metadata = parquet.metadata
+        stats.row_groups_total += metadata.num_row_groups
+        read_columns = columns
+        if columns is not None and spec.date_column not in columns:
+            read_columns = [*columns, spec.date_column]
+        stats.columns = list(read_columns or parquet.schema_arrow.names)
+        column_index = parquet.schema_arrow.get_field_index(spec.date_column)
+        row_groups = [
+            index for index in range(metadata.num_row_groups)
+            if _row_group_overlaps(metadata, index, column_index, low, high)
+        ]
+        if not row_groups:
+            continue
+        stats.partitions_read += 1
+        stats.row_groups_read += len(row_groups)
+        frame = parquet.read_row_groups(row_groups, columns=read_columns).to_pandas()
+        stats.rows_read += len(frame)
+        # Boundary partitions and row groups can still hold rows outside the range
+        values = pd.to_datetime(frame[spec.date_column])
+        mask = pd.Series(True, index=frame.index)
+        if low is not None:
+            mask &= values >= low
+        if high is not None:
+            mask &= values < high
+        frames.append(frame[mask])
+
+    if not frames:
+        result = pd.DataFrame(columns=columns or [])
+    else:
+        result = pd.concat(frames, ignore_index=True)
+        if columns is not None:
+            result = result[columns]
+    logging.info(f"Lake: scanned {table} ({stats})")
+    return result, stats
+
+
+def read_table(table: str, start: Optional[datetime] = None, end: Optional[datetime] = None,
+               columns: Optional[List[str]] = None, root: Path = LAKE_DIR) -> pd.DataFrame:
+    return scan_table(table, start, end, columns, root)[0]
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    parser = argparse.ArgumentParser(description="Read a date range from the local Parquet lake and report what was pruned.")
+    parser.add_argument("table", choices=list(TABLES), help="<layer>.<table>, e.g. silver.events")
+    parser.add_argument("--start", type=datetime.fromisoformat, default=None, help="Range start (inclusive), e.g. 2024-01-01")
+    parser.add_argument("--end", type=datetime.fromisoformat, default=None, help="Range end (exclusive), e.g. 2024-01-02T06:00")
+    parser.add_argument("--columns", default=None, help="Comma-separated columns to read")
+    parser.add_argument("--lake", type=Path, default=LAKE_DIR, help="Lake root directory")
+    args = parser.parse_args()
+
+    columns = args.columns.split(",") if args.columns else None
+    frame, stats = scan_table(args.table, args.start, args.end, columns, args.lake)
+    print(frame.head(20).to_string(index=False))
+    print(f"{len(frame):,} rows matched; read {stats}")
+
+
+if __name__ == "__main__":
+    main()
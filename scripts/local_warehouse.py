@@ -0,0 +1,136 @@
+'''DuckDB stand-in for Snowflake that runs the SQL the Gold stage generates, unchanged, on local tables.
+
+gold_aggregation.py builds its MERGEs, lateness queries and watermark bookkeeping as SQL text and sends them
+through session.sql(...).collect() or as one multi-statement script on session.connection.cursor().
+LocalWarehouse offers those two entry points over a DuckDB connection, so ensure_gold_tables() and
+run_metric_specs() run as they do in production. On the way in, it rewrites the few spellings DuckDB lacks:
+
+- CURRENT_TIMESTAMP() becomes CURRENT_TIMESTAMP, and CLUSTER BY clauses are dropped (ALTER ... CLUSTER BY is a no-op).
+- FROM VALUES (...) becomes FROM (VALUES ...) AS v(column1, ...), the column names Snowflake gives it.
+- IFF, DATEADD and APPROX_PERCENTILE are macros over CASE, intervals and approx_quantile.
+- A MERGE returns (rows inserted, rows updated) like Snowflake's, counted from RETURNING merge_action.
+
+Snowpark DataFrame code (bronze_to_silver.py) does not go through SQL text, so it cannot run here. Neither do the
+connector's PUT and stage reads in ingestion_to_snowflake.py.
+'''
+import re
+import threading
+from typing import Any, List, Optional, Sequence
+
+SCHEMAS = ["BRONZE", "SILVER", "GOLD", "GOLD_STAGING"]
+MACROS = [
+    "CREATE MACRO iff(condition, a, b) AS CASE WHEN condition THEN a ELSE b END",
+    "CREATE MACRO approx_percentile(x, q) AS approx_quantile(x, q)",
+    """CREATE MACRO dateadd(part, n, ts) AS CASE lower(part)
+        WHEN 'second' THEN ts + to_seconds(n) WHEN 'minute' THEN ts + to_minutes(n)
+        WHEN 'hour' THEN ts + to_hours(n) ELSE ts + to_days(n) END""",
+]
+_VALUES = re.compile(r"FROM VALUES\s+((?:\([^()]*\)\s*,?\s*)+)")
+_CLUSTER_BY = re.compile(r"CLUSTER BY \([^()]*(?:\([^()]*\)[^()]*)*\)")
+
+
+def _values(match: "re.Match") -> str:
+    rows = match.group(1).rstrip().rstrip(",")
+    first = rows[1:rows.index(")")]
+    # Commas outside quoted strings separate the columns of a row
+    width = len(re.sub(r"'(?:[^']|'')*'", "''", first).split(","))
+    names = ", ".join(f"column{i}" for i in range(1, width + 1))
+    return f"FROM (VALUES {rows}) AS v({names}) "
+
+
+def translate(sql: str) -> Optional[str]:
+    """The statement in DuckDB's dialect; None for statements that have no DuckDB counterpart."""
+    stripped = sql.strip()
+    if re.match(r"ALTER TABLE \S+ CLUSTER BY", stripped):
+        return None
+    sql = sql.replace("CURRENT_TIMESTAMP()", "CURRENT_TIMESTAMP")
+    sql = _CLUSTER_BY.sub("", sql)
+    sql = _VALUES.sub(_values, sql)
+    if stripped.startswith("MERGE"):
+        sql = sql.rstrip() + "\nRETURNING merge_action"
+    return sql
+
+
+#A Snowpark session can be shared between threads (backfill.py does), a DuckDB connection cannot
+_LOCK = threading.Lock()
+
+
+def _execute(con: Any, sql: str, params: Optional[Sequence] = None) -> List[tuple]:
+    translated = translate(sql)
+    if translated is None:
+        return []
+    with _LOCK:
+        result = con.execute(translated, list(params) if params else None)
+        if result.description is None:
+            return []
+        rows = result.fetchall()
+    if sql.strip().startswith("MERGE"):
+        actions = [row[0] for row in rows]
+        return [(actions.count("INSERT"), actions.count("UPDATE"))]
+    return rows
+
+
+class _Result:
+    def __init__(self, con: Any, sql: str, params: Optional[Sequence]):
+        self.con, self.query, self.params = con, sql, params
+
+    def collect(self) -> List[tuple]:
+        return _execute(self.con, self.query, self.params)
+
+
+class _Cursor:
+    """Runs a ";\\n"-joined script one statement at a time, each result set reachable through nextset()."""
+
+    sfqid = None
+
+    def __init__(self, con: Any):
+        self.con = con
+        self._results: List[List[tuple]] = []
+
+    def execute(self, script: str, num_statements: int = 1) -> None:
+        statements = script.split(";\n")
+        if len(statements) != num_statements:
+            raise ValueError(f"Expected {num_statements} statements, got {len(statements)}")
+        self._results = [_execute(self.con, statement) for statement in statements]
+
+    def fetchall(self) -> List[tuple]:
+        return self._results[0]
+
+    def nextset(self) -> bool:
+        self._results.pop(0)
+        return bool(self._results)
+
+    def __enter__(self) -> "_Cursor":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._results = []
+
+
+class _Connection:
+    def __init__(self, con: Any):
+        self.con = con
+
+    def cursor(self) -> _Cursor:
+        return _Cursor(self.con)
+
+
+class LocalWarehouse:
+    """The parts of a Snowpark session the Gold stage uses, over an in-memory (or file) DuckDB database."""
+
+    query_tag = None
+
+    def __init__(self, database: str = ":memory:"):
+        import duckdb
+        self.con = duckdb.connect(database)
+        for schema in SCHEMAS:
+            self.con.execute(f"CREATE SCHEMA IF NOT EXISTS {schema}")
+        for macro in MACROS:
+            self.con.execute(macro)
+        self.connection = _Connection(self.con)
+
+    def sql(self, query: str, params: Optional[Sequence] = None) -> _Result:
+        return _Result(self.con, query, params)
+
+    def close(self) -> None:
+        self.con.close()
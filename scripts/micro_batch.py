@@ -0,0 +1,249 @@
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import List, Optional
+from dotenv import load_dotenv
+import profiling
+
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+
+#Folder Stucture
+SCRIPTS_DIR = Path(__file__).resolve().parent
+BASE_DIR = SCRIPTS_DIR.parent
+INBOX_DIR = BASE_DIR/ "data"/ "raw"/ "incoming"
+PROCESSED_DIR = BASE_DIR/ "data"/ "raw"/ "processed"
+
+# Files younger than this may still be being written
+SETTLE_SECONDS = 1.0
+
+
+class SnowflakeBackend:
+    """Runs the existing ingestion, Bronze->Silver and Gold code over one long-lived Snowpark session."""
+
+    def __init__(self, env_path: str):
+        # Check if file exists
+        if not os.path.exists(env_path):
+            raise FileNotFoundError(f".env file not found at path: {env_path}")
+        load_dotenv(dotenv_path=env_path) #Load credentials found in .env file
+
+        #Connection credentials
+        connection_params={
+            "account": os.getenv("SNOWFLAKE_ACCOUNT"),
+            "user": os.getenv("SNOWFLAKE_USER"),
+            "password": os.getenv("SNOWFLAKE_PASSWORD"),
+            "warehouse": os.getenv("SNOWFLAKE_WAREHOUSE"),
+            "database": os.getenv("SNOWFLAKE_DATABASE"),
+            "schema": os.getenv("SNOWFLAKE_SCHEMA"),
+            "role": os.getenv("SNOWFLAKE_ROLE"),
+        }
+        # Check that all required environment variables are set
+        missing = [k for k,v in connection_params.items() if not v]
+        if missing:
+            raise ValueError(f"Missing enviroment variables: {','.join(missing)}")
+
+        # Imported here so the local backend runs without Snowpark installed
+        from snowflake.snowpark import Session
+        for stage_dir in ["bronze_to_silver", "gold_aggregation"]:
+            sys.path.insert(0, str(SCRIPTS_DIR / stage_dir))
+        import ingestion_to_snowflake
+        import bronze_to_silver
+        import gold_aggregation
+        self.ingestion = ingestion_to_snowflake
+        self.silver = bronze_to_silver
+        self.gold = gold_aggregation
+
+        self.session = Session.builder.configs(connection_params).create()
+        self.ingestion.setup_schema(self.session.connection)
+        self.silver.ensure_tables(self.session)
+        self.gold.ensure_gold_tables(self.session)
+        # Kept in memory across cycles and saved once at close
+        self.dedupe = self.silver.dedupe_indexes(self.session, autosave=False)
+
+    def ingest(self, csv_paths: List[Path], json_paths: List[Path]) -> None:
+        for path in csv_paths:
+            self.ingestion.load_csv_events(self.session.connection, path)
+        for path in json_paths:
+            self.ingestion.load_json_sessions(self.session.connection, path)
+
+    def bronze_to_silver(self) -> None:
+        self.silver.register_dimensions(self.session)
+        self.silver.clean_events(self.session, self.dedupe["events"])
+        self.silver.flatten_session(self.session, self.dedupe["sessions"])
+
+    def silver_to_gold(self) -> None:
+        self.gold.run_metric_specs(self.session, list(self.gold.METRIC_SPECS.values()))
+
+    def close(self) -> None:
+        for index in self.dedupe.values():
+            index.save()
+        self.session.close()
+        logging.info("Snowpark session closed.")
+
+
+@dataclass
+class CycleReport:
+    cycle: int
+    started_at: float
+    files: int = 0
+    bytes: int = 0
+    backlog: int = 0
+    ingest_seconds: float = 0.0
+    silver_seconds: float = 0.0
+    gold_seconds: float = 0.0
+    latency_seconds: float = 0.0
+    # Seconds from the oldest file in the batch landing in the inbox to its rows being in Gold
+    freshness_lag_seconds: Optional[float] = None
+    next_interval_seconds: float = 0.0
+    error: Optional[str] = None
+
+
+class MicroBatchDriver:
+    """Polls an inbox and pushes new files through ingestion -> Silver -> Gold every interval.
+
+    The interval adapts to the backlog: it drops to min_interval while files are still waiting
+    after a batch, returns to the base interval once caught up, and doubles (up to max_interval)
+    while the inbox stays empty or a cycle fails, so an idle pipeline does not keep the warehouse busy.
+    """
+
+    def __init__(self, backend, inbox: Path = INBOX_DIR, processed_dir: Path = PROCESSED_DIR,
+                 interval: float = 60, min_interval: float = 5, max_interval: float = 600,
+                 max_files: int = 20, metrics_path: Optional[Path] = None):
+        self.backend = backend
+        self.inbox = Path(inbox)
+        self.processed_dir = Path(processed_dir)
+        self.base_interval = interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.max_files = max_files
+        self.metrics_path = Path(metrics_path) if metrics_path else None
+        self.interval = interval
+        self.cycle = 0
+
+    def pending_files(self) -> List[Path]:
+        if not self.inbox.exists():
+            return []
+        settled = time.time() - SETTLE_SECONDS
+        files = [
+            path for path in self.inbox.iterdir()
+            if path.suffix in (".csv", ".json") and path.stat().st_mtime <= settled
+        ]
+        return sorted(files, key=lambda path: path.stat().st_mtime)
+
+    def run_cycle(self) -> CycleReport:
+        self.cycle += 1
+        report = CycleReport(cycle=self.cycle, started_at=time.time())
+        pending = self.pending_files()
+        batch = pending[:self.max_files]
+        report.backlog = len(pending) - len(batch)
+        if not batch:
+            return report
+
+        report.files = len(batch)
+        report.bytes = sum(path.stat().st_size for path in batch)
+        oldest_arrival = min(path.stat().st_mtime for path in batch)
+        started = time.perf_counter()
+        try:
+            with profiling.step(f"cycle_{self.cycle:05d}_ingest"):
+                self.backend.ingest(
+                    [path for path in batch if path.suffix == ".csv"],
+                    [path for path in batch if path.suffix == ".json"],
+                )
+            report.ingest_seconds = time.perf_counter() - started
+            with profiling.step(f"cycle_{self.cycle:05d}_bronze_to_silver"):
+                self.backend.bronze_to_silver()
+            report.silver_seconds = time.perf_counter() - started - report.ingest_seconds
+            with profiling.step(f"cycle_{self.cycle:05d}_silver_to_gold"):
+                self.backend.silver_to_gold()
+            report.gold_seconds = time.perf_counter() - started - report.ingest_seconds - report.silver_seconds
+        except Exception as e:
+            # Files stay in the inbox; every step is an idempotent merge, so the next cycle retries them
+            logging.error(f"Micro-batch cycle {self.cycle} failed: {e}")
+            report.error = str(e)
+        else:
+            self.processed_dir.mkdir(parents=True, exist_ok=True)
+            for path in batch:
+                shutil.move(str(path), self.processed_dir / path.name)
+            report.freshness_lag_seconds = time.time() - oldest_arrival
+        report.latency_seconds = time.perf_counter() - started
+        return report
+
+    def next_interval(self, report: CycleReport) -> float:
+        if report.error or not report.files:
+            return min(max(self.interval, self.min_interval) * 2, self.max_interval)
+        if report.backlog:
+            return self.min_interval
+        return self.base_interval
+
+    def _emit(self, report: CycleReport) -> None:
+        if report.files:
+            logging.info(
+                f"Cycle {report.cycle}: {report.files} files ({report.bytes / 1024:.1f} KiB) in "
+                f"{report.latency_seconds:.2f}s (ingest {report.ingest_seconds:.2f}s, "
+                f"silver {report.silver_seconds:.2f}s, gold {report.gold_seconds:.2f}s); "
+                f"freshness lag {report.freshness_lag_seconds or 0:.1f}s, backlog {report.backlog}, "
+                f"next run in {report.next_interval_seconds:.1f}s"
+            )
+        else:
+            logging.info(f"Cycle {report.cycle}: inbox empty, next run in {report.next_interval_seconds:.1f}s")
+        if self.metrics_path:
+            self.metrics_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.metrics_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(asdict(report)) + "\n")
+
+    def run(self, max_cycles: int = 0) -> None:
+        """Run until interrupted, or for max_cycles cycles when it is positive."""
+        try:
+            while True:
+                report = self.run_cycle()
+                self.interval = self.next_interval(report)
+                report.next_interval_seconds = self.interval
+                self._emit(report)
+                if max_cycles and self.cycle >= max_cycles:
+                    break
+                # The interval is measured start to start
+                time.sleep(max(0.0, self.interval - (time.time() - report.started_at)))
+        except KeyboardInterrupt:
+            logging.info("Micro-batch driver interrupted.")
+        finally:
+            self.backend.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Continuously load new files from the inbox through Bronze, Silver and Gold.")
+    parser.add_argument("--backend", choices=["snowflake", "local"], default="snowflake")
+    parser.add_argument("--env", default=".env", help="Path to .env file")
+    parser.add_argument("--inbox", type=Path, default=INBOX_DIR, help="Folder polled for new CSV/JSON files")
+    parser.add_argument("--processed", type=Path, default=PROCESSED_DIR, help="Folder files are moved to once in Gold")
+    parser.add_argument("--interval", type=float, default=60, help="Base seconds between cycles")
+    parser.add_argument("--min-interval", type=float, default=5, help="Seconds between cycles while a backlog remains")
+    parser.add_argument("--max-interval", type=float, default=600, help="Upper bound for the idle/failure backoff")
+    parser.add_argument("--max-files", type=int, default=20, help="Files loaded per cycle")
+    parser.add_argument("--max-cycles", type=int, default=0, help="Stop after this many cycles (0 = run forever)")
+    parser.add_argument("--metrics", type=Path, default=None, help="Append one JSON line per cycle to this file")
+    parser.add_argument("--lake", type=Path, default=None, help="Local backend: mirror every layer into this Parquet lake")
+    profiling.add_profile_arguments(parser)
+    args = parser.parse_args()
+    profiling.configure(args.profile, "micro_batch", args.profile_dir)
+
+    if args.backend == "local":
+        from local_backend import LocalBackend
+        backend = LocalBackend(args.lake)
+    else:
+        backend = SnowflakeBackend(args.env)
+
+    driver = MicroBatchDriver(
+        backend, args.inbox, args.processed, args.interval, args.min_interval,
+        args.max_interval, args.max_files, args.metrics
+    )
+    driver.run(args.max_cycles)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+'''One-off migration of Silver, Gold and anomaly tables created before the surrogate keys (see dimensions.py).
+
+The stages create their tables with CREATE TABLE IF NOT EXISTS, so a table created before the keys keeps its
+string columns (user_id, product_id, event_type, browser, operating_system, city) and the keyed MERGEs fail on
+it. For every such table this renames it to <table>_LEGACY, lets the stage create the keyed table, registers the
+legacy values with dimensions.register() and copies the rows across through dimensions.encode(). Rows keep their
+ingested_at and updated_at, so Gold needs no rebuild, every watermark stays where it was and the dashboard's date
+filters see the same rows. The legacy table is dropped once the copy has the same row count. The Silver dedupe
+indexes are rebuilt last, since the session keys now hold event_type_code instead of event_type.
+
+Run it once with the pipeline paused: register() has a single writer (see dimensions.py). A run that fails part
+way can be rerun; a table whose _LEGACY copy is still there is emptied and copied again.
+'''
+from __future__ import annotations
+import os
+import sys
+import logging
+import argparse
+from pathlib import Path
+from typing import TYPE_CHECKING, List, Set
+from dotenv import load_dotenv
+
+SCRIPTS_DIR = Path(__file__).resolve().parent
+for stage_dir in ["bronze_to_silver", "gold_aggregation", "anomaly_detection"]:
+    sys.path.insert(0, str(SCRIPTS_DIR / stage_dir))
+
+import bronze_to_silver as silver
+import gold_aggregation as gold
+import anomaly_detection as anomalies
+import dimensions
+
+if TYPE_CHECKING:
+    from snowflake.snowpark import Session
+
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+
+LEGACY_SUFFIX = "_LEGACY"
+# The string columns the keys replaced
+LEGACY_COLUMNS = {dim.value.upper() for dim in dimensions.DIMENSIONS.values()}
+TABLES: List[str] = (
+    [silver.EVENTS_SILVER_TABLE, silver.SESSIONS_SILVER_TABLE]
+    + [spec.table for spec in gold.METRIC_SPECS.values()]
+    + [anomalies.ANOMALIES_TABLE, anomalies.USER_SCORES_TABLE]
+)
+
+
+def table_columns(session: Session, table: str) -> Set[str]:
+    """The table's column names, upper case; empty if it does not exist."""
+    schema, name = table.split(".")
+    rows = session.sql(
+        "SELECT column_name FROM information_schema.columns WHERE table_schema = ? AND table_name = ?",
+        params=[schema.upper(), name.upper()],
+    ).collect()
+    return {row[0].upper() for row in rows}
+
+
+def ensure_keyed_tables(session: Session) -> None:
+    silver.ensure_tables(session)
+    gold.ensure_gold_tables(session)
+    anomalies.ensure_anomaly_tables(session)
+
+
+def set_aside_legacy_tables(session: Session, dry_run: bool = False) -> List[str]:
+    """Rename every table that still has string columns to <table>_LEGACY; returns all tables with a legacy copy,
+    including ones an earlier, failed run set aside."""
+    pending = []
+    for table in TABLES:
+        legacy = table + LEGACY_SUFFIX
+        if table_columns(session, legacy):
+            logging.info(f"{legacy} is left from an earlier run; copying it again.")
+            pending.append(table)
+            continue
+        string_columns = table_columns(session, table) & LEGACY_COLUMNS
+        if not string_columns:
+            continue
+        logging.info(f"{table} still has {', '.join(sorted(string_columns))}.")
+        if not dry_run:
+            session.sql(f"ALTER TABLE {table} RENAME TO {legacy}").collect()
+        pending.append(table)
+    return pending
+
+
+def copy_encoded(session: Session, table: str) -> int:
+    """Copy <table>_LEGACY into the keyed table through register()/encode() and drop it; returns the row count."""
+    legacy = session.table(table + LEGACY_SUFFIX)
+    for dim_table, added in dimensions.register(session, legacy).items():
+        if added:
+            logging.info(f"{dim_table}: {added} values from {table + LEGACY_SUFFIX} registered.")
+    encoded = dimensions.encode(session, legacy)
+    target_columns = session.table(table).columns
+    columns = [c for c in target_columns if c in set(encoded.columns)]
+    missing = sorted(set(target_columns) - set(columns))
+    if missing:
+        logging.info(f"{table}: {', '.join(missing)} not in the legacy table; they get their defaults.")
+
+    session.sql(f"TRUNCATE TABLE IF EXISTS {table}").collect()
+    encoded.select(columns).write.save_as_table(table, mode="append", column_order="name")
+    expected, copied = legacy.count(), session.table(table).count()
+    if copied != expected:
+        raise RuntimeError(f"{table} has {copied} rows after the copy, {table + LEGACY_SUFFIX} has {expected}; keeping it")
+    session.sql(f"DROP TABLE {table + LEGACY_SUFFIX}").collect()
+    return copied
+
+
+def migrate(session: Session, dry_run: bool = False) -> List[str]:
+    """Migrate every table that still has string columns; returns the tables migrated (or to migrate, with dry_run)."""
+    dimensions.ensure_dimension_tables(session)
+    pending = set_aside_legacy_tables(session, dry_run)
+    if not pending:
+        logging.info("Every Silver, Gold and anomaly table already has the keyed columns.")
+        return pending
+    if dry_run:
+        logging.info(f"Would migrate {', '.join(pending)}.")
+        return pending
+
+    ensure_keyed_tables(session)
+    for table in pending:
+        rows = copy_encoded(session, table)
+        logging.info(f"{table}: {rows} rows copied with their keys.")
+
+    # The indexes hashed the old session keys; rebuild them from the keyed tables
+    for index in silver.dedupe_indexes(session).values():
+        if index.enabled:
+            index.bloom = index.rebuild()
+            index.save()
+    return pending
+
+
+def main(env_path: str, dry_run: bool):
+
+    # Check if file exists
+    if not os.path.exists(env_path):
+        raise FileNotFoundError(f".env file not found at path: {env_path}")
+    load_dotenv(dotenv_path=env_path) #Load credentials found in .env file
+
+    #Connection credentials
+    connection_params={
+        "account": os.getenv("SNOWFLAKE_ACCOUNT"),
+        "user": os.getenv("SNOWFLAKE_USER"),
+        "password": os.getenv("SNOWFLAKE_PASSWORD"),
+        "warehouse": os.getenv("SNOWFLAKE_WAREHOUSE"),
+        "database": os.getenv("SNOWFLAKE_DATABASE"),
+        "schema": os.getenv("SNOWFLAKE_SCHEMA"),
+        "role": os.getenv("SNOWFLAKE_ROLE"),
+    }
+    # Check that all required environment variables are set
+    missing = [k for k,v in connection_params.items() if not v]
+    if missing:
+        raise ValueError(f"Missing enviroment variables: {','.join(missing)}")
+
+    from snowflake.snowpark import Session
+    session = Session.builder.configs(connection_params).create()
+    try:
+        migrate(session, dry_run)
+    finally:
+        session.close()
+        logging.info("Snowpark session closed.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move Silver, Gold and anomaly tables with string columns to surrogate keys")
+    parser.add_argument("--env", default=".env", help="Path to .env file")
+    parser.add_argument("--dry-run", action="store_true", help="Only list the tables that would be migrated")
+    args = parser.parse_args()
+    main(args.env, args.dry_run)
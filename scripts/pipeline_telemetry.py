@@ -0,0 +1,256 @@
+'''Per-step run telemetry for the pipeline stages: timings, row counts, staged bytes and warehouse query ids.
+
+Each stage opens a RunTelemetry on its Snowpark session or connector connection and wraps its work in
+`with telemetry.step(name):`. Every step gets its own query tag, so warehouse time and credits can be
+attributed from QUERY_HISTORY, and the code inside a step reports counts with note() / note_query().
+When a step ends, the pruning statistics of its table scans (micro-partitions scanned vs total) are read with
+GET_QUERY_OPERATOR_STATS, so a filter that stops pruning shows up as a jump in partitions_scanned.
+Records are written to PIPELINE_RUNS (default) and/or a JSONL file when the run finishes.
+'''
+import os
+import json
+import time
+import uuid
+import logging
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass, asdict, field
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Iterator, List, Optional
+
+PIPELINE_NAME = "product_analytics_pipeline"
+RUNS_TABLE = "GOLD_STAGING.PIPELINE_RUNS"
+DEFAULT_JSONL_PATH = Path(__file__).resolve().parent.parent / "data" / "telemetry" / "pipeline_runs.jsonl"
+
+COUNTERS = ["rows_in", "rows_out", "rows_inserted", "rows_updated", "bytes_staged"]
+
+
+@dataclass
+class StepRecord:
+    run_id: str
+    stage: str
+    step: str
+    query_tag: str
+    started_at: str
+    ended_at: Optional[str] = None
+    duration_seconds: Optional[float] = None
+    status: str = "running"
+    # None means the step did not report that counter
+    rows_in: Optional[int] = None
+    rows_out: Optional[int] = None
+    rows_inserted: Optional[int] = None
+    rows_updated: Optional[int] = None
+    bytes_staged: Optional[int] = None
+    query_ids: List[str] = field(default_factory=list)
+    error: Optional[str] = None
+    # Micro-partitions read by the step's table scans, in total and per table
+    partitions_scanned: Optional[int] = None
+    partitions_total: Optional[int] = None
+    table_scans: List[dict] = field(default_factory=list)
+
+
+_local = threading.local()
+
+
+def note(**counters: int) -> None:
+    """Add to the counters of the step running on this thread; a no-op outside a step."""
+    rec = getattr(_local, "current", None)
+    if rec is None:
+        return
+    for name, value in counters.items():
+        if name not in COUNTERS:
+            raise ValueError(f"Unknown telemetry counter: {name}")
+        if value is not None:
+            setattr(rec, name, (getattr(rec, name) or 0) + int(value))
+
+
+def note_query(query_id: Optional[str]) -> None:
+    """Record a query id for statements that bypass Snowpark (connector cursors, multi-statement scripts)."""
+    rec = getattr(_local, "current", None)
+    if rec is not None and query_id and query_id not in rec.query_ids:
+        rec.query_ids.append(query_id)
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def build_scan_stats_sql(query_ids: List[str]) -> str:
+    """Partitions scanned/total per table over the TableScan operators of the given queries."""
+    scans = "\n            UNION ALL\n            ".join(
+        f"SELECT operator_attributes:table_name::STRING AS table_name, "
+        f"operator_statistics:pruning:partitions_scanned::INT AS scanned, "
+        f"operator_statistics:pruning:partitions_total::INT AS total "
+        f"FROM TABLE(GET_QUERY_OPERATOR_STATS('{query_id}')) WHERE operator_type = 'TableScan'"
+        for query_id in query_ids
+    )
+    return f"""
+        SELECT table_name, SUM(scanned), SUM(total), COUNT(*)
+        FROM (
+            {scans}
+        )
+        GROUP BY table_name
+        ORDER BY SUM(scanned) DESC
+    """
+
+
+class RunTelemetry:
+    """Collects StepRecords for one run of one stage and writes them out in flush()."""
+
+    def __init__(self, stage: str, target: Any):
+        self.stage = stage
+        self.run_id = uuid.uuid4().hex
+        self.records: List[StepRecord] = []
+        # A Snowpark Session exposes query_history(); anything else is treated as a connector connection
+        self.session = target if hasattr(target, "query_history") else None
+        self.connection = target.connection if self.session is not None else target
+        self.scan_stats = os.getenv("PIPELINE_SCAN_STATS", "1") == "1"
+
+    def query_tag(self, step: str) -> str:
+        return json.dumps({"pipeline": PIPELINE_NAME, "stage": self.stage, "step": step, "run_id": self.run_id})
+
+    def _set_query_tag(self, tag: str) -> None:
+        if self.session is not None:
+            self.session.query_tag = tag
+        else:
+            with self.connection.cursor() as cur:
+                cur.execute("ALTER SESSION SET QUERY_TAG = %s", (tag,))
+
+    @contextmanager
+    def step(self, name: str) -> Iterator[StepRecord]:
+        rec = StepRecord(self.run_id, self.stage, name, self.query_tag(name), started_at=_now())
+        self._set_query_tag(rec.query_tag)
+        history = self.session.query_history() if self.session is not None else None
+        _local.current = rec
+        started = time.perf_counter()
+        try:
+            yield rec
+            rec.status = "success"
+        except Exception as e:
+            rec.status = "failed"
+            rec.error = str(e)
+            raise
+        finally:
+            _local.current = None
+            rec.duration_seconds = round(time.perf_counter() - started, 3)
+            rec.ended_at = _now()
+            if history is not None:
+                history.__exit__(None, None, None)
+                for query in history.queries:
+                    if query.query_id not in rec.query_ids:
+                        rec.query_ids.append(query.query_id)
+            if self.scan_stats and rec.query_ids:
+                self._collect_scans(rec)
+            self.records.append(rec)
+            counts = ", ".join(f"{name}={getattr(rec, name)}" for name in COUNTERS if getattr(rec, name) is not None)
+            scans = ""
+            if rec.table_scans:
+                scans = f"; scanned {rec.partitions_scanned}/{rec.partitions_total} partitions (" + ", ".join(
+                    f"{scan['table']} {scan['partitions_scanned']}/{scan['partitions_total']}" for scan in rec.table_scans
+                ) + ")"
+            logging.info(
+                f"[telemetry] {self.stage}.{name} {rec.status} in {rec.duration_seconds:.2f}s"
+                f"{'; ' + counts if counts else ''}; {len(rec.query_ids)} queries{scans}"
+            )
+
+    def _scan_rows(self, query_ids: List[str]) -> list:
+        with self.connection.cursor() as cur:
+            cur.execute(build_scan_stats_sql(query_ids))
+            return cur.fetchall()
+
+    def _collect_scans(self, rec: StepRecord) -> None:
+        """Fill in the step's partition pruning figures; never fails the step."""
+        try:
+            rows = self._scan_rows(rec.query_ids)
+        except Exception:
+            # Some statements (SHOW, DDL, failed queries) have no operator stats; drop them one by one
+            rows = []
+            for query_id in rec.query_ids:
+                try:
+                    rows.extend(self._scan_rows([query_id]))
+                except Exception:
+                    continue
+        scans: dict = {}
+        for table, scanned, total, count in rows:
+            if table is None:
+                continue
+            scan = scans.setdefault(table, {"table": table, "partitions_scanned": 0, "partitions_total": 0, "scans": 0})
+            scan["partitions_scanned"] += int(scanned or 0)
+            scan["partitions_total"] += int(total or 0)
+            scan["scans"] += int(count or 0)
+        if not scans:
+            return
+        rec.table_scans = sorted(scans.values(), key=lambda scan: scan["partitions_scanned"], reverse=True)
+        rec.partitions_scanned = sum(scan["partitions_scanned"] for scan in rec.table_scans)
+        rec.partitions_total = sum(scan["partitions_total"] for scan in rec.table_scans)
+
+    def flush(self) -> None:
+        """Write this run's records to the configured sink (PIPELINE_TELEMETRY_SINK = table|jsonl|both|none)."""
+        if not self.records:
+            return
+        sink = os.getenv("PIPELINE_TELEMETRY_SINK", "table").lower()
+        if sink in ("table", "both"):
+            try:
+                self._write_table()
+            except Exception as e:
+                # Telemetry must never fail the pipeline; keep the records locally instead
+                logging.warning(f"Could not write telemetry to {RUNS_TABLE} ({e}); falling back to JSONL.")
+                sink = "jsonl"
+        if sink in ("jsonl", "both"):
+            self._write_jsonl(Path(os.getenv("PIPELINE_TELEMETRY_PATH", DEFAULT_JSONL_PATH)))
+        self.records = []
+
+    def _write_table(self) -> None:
+        columns = [
+            "run_id", "stage", "step", "status", "started_at", "ended_at", "duration_seconds",
+            *COUNTERS, "query_tag", "error", "partitions_scanned", "partitions_total",
+        ]
+        row_sql = "SELECT " + ", ".join(["%s"] * len(columns)) + ", PARSE_JSON(%s)::ARRAY, PARSE_JSON(%s)::ARRAY"
+        params = []
+        for rec in self.records:
+            values = asdict(rec)
+            params.extend(values[name] for name in columns)
+            params.append(json.dumps(rec.query_ids))
+            params.append(json.dumps(rec.table_scans))
+        with self.connection.cursor() as cur:
+            cur.execute(f"""
+                CREATE TABLE IF NOT EXISTS {RUNS_TABLE} (
+                    run_id STRING,
+                    stage STRING,
+                    step STRING,
+                    status STRING,
+                    started_at TIMESTAMP_TZ,
+                    ended_at TIMESTAMP_TZ,
+                    duration_seconds FLOAT,
+                    rows_in INT,
+                    rows_out INT,
+                    rows_inserted INT,
+                    rows_updated INT,
+                    bytes_staged INT,
+                    query_tag STRING,
+                    error STRING,
+                    query_ids ARRAY,
+                    recorded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP(),
+                    partitions_scanned INT,
+                    partitions_total INT,
+                    table_scans ARRAY
+                )
+            """)
+            cur.execute(f"""
+                ALTER TABLE {RUNS_TABLE} ADD COLUMN IF NOT EXISTS
+                    partitions_scanned INT, partitions_total INT, table_scans ARRAY
+            """)
+            cur.execute(
+                f"INSERT INTO {RUNS_TABLE} ({', '.join(columns)}, query_ids, table_scans) "
+                + " UNION ALL ".join([row_sql] * len(self.records)),
+                params,
+            )
+        logging.info(f"Wrote {len(self.records)} telemetry records to {RUNS_TABLE}")
+
+    def _write_jsonl(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "a", encoding="utf-8") as f:
+            for rec in self.records:
+                f.write(json.dumps(asdict(rec)) + "\n")
+        logging.info(f"Wrote {len(self.records)} telemetry records to {path}")
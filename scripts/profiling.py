@@ -0,0 +1,161 @@
+'''Opt-in CPU and memory profiling around named pipeline steps (`--profile cpu|mem` on every entry point).
+
+Entry points call add_profile_arguments(parser) and configure(...) once; code wraps its steps in
+`with profiling.step("clean_events"):`. Without --profile, step() hands back a shared no-op context, so
+the hooks cost one global lookup per step.
+
+Reports per step, written to <profile-dir>/<stage>_<timestamp>/:
+  cpu: <step>.pstats and <step>.cpu.txt (cProfile of the calling thread, top functions by cumulative time) and
+       <step>.cpu.folded (sampled stacks of all threads, for flamegraph.pl / speedscope)
+  mem: <step>.mem.txt (top-N allocation sites and peak) and <step>.mem.folded (bytes by allocation stack)
+'''
+import os
+import sys
+import time
+import logging
+import argparse
+import threading
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from typing import Iterator, Optional
+
+PROFILE_DIR = Path(os.getenv("PIPELINE_PROFILE_DIR", Path(__file__).resolve().parent.parent / "logs" / "profiles"))
+TOP_N = 30
+SAMPLE_INTERVAL = 0.005
+TRACEMALLOC_FRAMES = 25
+
+_NO_PROFILE = nullcontext()
+_active: Optional["Profiler"] = None
+
+
+def _frame_label(code) -> str:
+    return f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    """Samples every thread's Python stack on a background thread and counts identical stacks.
+
+    Stacks are rooted at the thread name, so work fanned out to a thread pool shows up next to the main thread.
+    """
+
+    def __init__(self, interval: float = SAMPLE_INTERVAL):
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiling-sampler", daemon=True)
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame.f_code))
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                self.stacks[tuple(reversed(stack))] += 1
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def write_folded(self, path: Path) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{';'.join(stack)} {count}\n")
+
+
+class Profiler:
+    def __init__(self, mode: str, output_dir: Path, top_n: int = TOP_N):
+        self.mode = mode
+        self.output_dir = Path(output_dir)
+        self.top_n = top_n
+
+    @contextmanager
+    def step(self, name: str) -> Iterator[None]:
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        started = time.perf_counter()
+        profile = self._cpu if self.mode == "cpu" else self._mem
+        with profile(name):
+            yield
+        logging.info(f"[profile] {name}: {self.mode} report written to {self.output_dir} ({time.perf_counter() - started:.2f}s)")
+
+    @contextmanager
+    def _cpu(self, name: str) -> Iterator[None]:
+        import pstats
+        import cProfile
+        profiler = cProfile.Profile()
+        sampler = StackSampler()
+        sampler.start()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            sampler.stop()
+            profiler.dump_stats(self.output_dir / f"{name}.pstats")
+            sampler.write_folded(self.output_dir / f"{name}.cpu.folded")
+            with open(self.output_dir / f"{name}.cpu.txt", "w", encoding="utf-8") as f:
+                pstats.Stats(profiler, stream=f).sort_stats("cumulative").print_stats(self.top_n)
+
+    @contextmanager
+    def _mem(self, name: str) -> Iterator[None]:
+        already_tracing = tracemalloc.is_tracing()
+        if not already_tracing:
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+        tracemalloc.reset_peak()
+        before = tracemalloc.take_snapshot()
+        try:
+            yield
+        finally:
+            after = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            if not already_tracing:
+                tracemalloc.stop()
+            self._write_mem_report(name, before, after, current, peak)
+
+    def _write_mem_report(self, name: str, before, after, current: int, peak: int) -> None:
+        filters = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)]
+        before, after = before.filter_traces(filters), after.filter_traces(filters)
+        with open(self.output_dir / f"{name}.mem.txt", "w", encoding="utf-8") as f:
+            f.write(f"Step {name}: peak traced {peak / 2**20:.1f} MiB, retained at end {current / 2**20:.1f} MiB\n\n")
+            f.write(f"Top {self.top_n} allocation sites still held at the end of the step (growth vs start):\n")
+            for stat in after.compare_to(before, "lineno")[:self.top_n]:
+                f.write(f"  {stat}\n")
+            f.write(f"\nTop {self.top_n} allocation sites overall at the end of the step:\n")
+            for stat in after.statistics("lineno")[:self.top_n]:
+                f.write(f"  {stat}\n")
+        with open(self.output_dir / f"{name}.mem.folded", "w", encoding="utf-8") as f:
+            for stat in after.statistics("traceback"):
+                frames = ";".join(f"{Path(frame.filename).name}:{frame.lineno}" for frame in reversed(stat.traceback))
+                f.write(f"{frames} {stat.size}\n")
+
+
+def add_profile_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--profile", choices=["cpu", "mem"], default=None, help="Profile each named step")
+    parser.add_argument("--profile-dir", type=Path, default=PROFILE_DIR, help="Where profile reports are written")
+
+
+def configure(mode: Optional[str], stage: str, profile_dir: Path = PROFILE_DIR) -> None:
+    """Turn profiling on for this process; a None mode leaves every step() a no-op."""
+    global _active
+    if mode is None:
+        _active = None
+        return
+    _active = Profiler(mode, Path(profile_dir) / f"{stage}_{time.strftime('%Y%m%d_%H%M%S')}")
+    logging.info(f"Profiling ({mode}) enabled; reports go to {_active.output_dir}")
+
+
+def step(name: str):
+    """Context manager profiling `name` when profiling is configured, otherwise a shared no-op."""
+    if _active is None:
+        return _NO_PROFILE
+    return _active.step(name)
@@ -6,6 +6,7 @@ import argparse
 from datetime import datetime, timedelta
 from pathlib import Path
 from typing import List, Dict, Any
+import profiling
 
 #Default Configs
 DEFAULT_NUM_USERS = 10
@@ -107,16 +108,26 @@ def main() -> None:
     parser.add_argument("--seed", type=int, default=None, help="Random seed for reproducibility")
     parser.add_argument("--csv", type=Path, default=CSV_PATH, help="Output path for CSV events")
     parser.add_argument("--json", type=Path, default=JSON_PATH, help="Output path for JSON sessions")
+    parser.add_argument("--lake", type=Path, default=None, help="Also write the data to this local Parquet lake's raw layer, e.g. data/lake")
+    profiling.add_profile_arguments(parser)
 
     args = parser.parse_args()
+    profiling.configure(args.profile, "simulate_events", args.profile_dir)
 
     if args.seed is not None:
         random.seed(args.seed)
         logging.info(f"Using random seed: {args.seed}")
 
     logging.info("Starting synthetic data generation...")
-    generate_csv_events(args.users, args.events, args.csv)
-    generate_json_sessions(args.users, args.sessions, args.json)
+    with profiling.step("generate_csv_events"):
+        generate_csv_events(args.users, args.events, args.csv)
+    with profiling.step("generate_json_sessions"):
+        generate_json_sessions(args.users, args.sessions, args.json)
+    if args.lake is not None:
+        #Imported here so plain CSV/JSON generation does not need pandas
+        from local_lake import write_files
+        with profiling.step("write_lake"):
+            write_files([args.csv], [args.json], "raw", args.lake)
     logging.info("Done generating synthetic data.")
 
 
@@ -0,0 +1,50 @@
+'''MERGE sources for the incremental Silver steps, chosen by delta size.
+
+Writing every delta to a permanent SILVER_STAGING table with mode="overwrite" rewrites the whole table each run
+and keeps every old version in Time Travel and Fail-safe. staged() picks the cheapest source for the delta:
+
+- inline (up to STAGING_INLINE_MAX_ROWS rows): the MERGE reads the delta's own query, so nothing is written.
+- temporary (default above that) or transient (STAGING_TABLE_TYPE=transient): the delta is written once to a
+  session-scoped temporary table, or a transient one that has no Fail-safe and can be inspected after the run.
+
+The table is dropped when the block exits, whether the MERGE succeeded or not; a temporary table would also go
+with the session if the process dies before that.
+'''
+import os
+import logging
+from contextlib import contextmanager
+from typing import Any, Iterator
+
+DEFAULT_INLINE_MAX_ROWS = 50_000
+TABLE_TYPES = ("temporary", "transient")
+
+
+def choose_strategy(rows: int) -> str:
+    """"inline" for small deltas, else the configured staging table type."""
+    if rows <= int(os.getenv("STAGING_INLINE_MAX_ROWS", DEFAULT_INLINE_MAX_ROWS)):
+        return "inline"
+    table_type = os.getenv("STAGING_TABLE_TYPE", "temporary").lower()
+    if table_type not in TABLE_TYPES:
+        raise ValueError(f"STAGING_TABLE_TYPE must be one of {', '.join(TABLE_TYPES)}, got {table_type}")
+    return table_type
+
+
+@contextmanager
+def staged(session: Any, delta: Any, table: str, rows: int) -> Iterator[Any]:
+    """Yield a DataFrame to MERGE from: delta itself, or table holding a copy of it, dropped on exit."""
+    strategy = choose_strategy(rows)
+    if strategy == "inline":
+        logging.info(f"Merging {rows:,} rows straight from the delta query (no staging table).")
+        yield delta
+        return
+
+    logging.info(f"Writing {rows:,} rows to {strategy} staging table {table}...")
+    try:
+        delta.write.save_as_table(table, mode="overwrite", table_type=strategy)
+        yield session.table(table)
+    finally:
+        try:
+            session.sql(f"DROP TABLE IF EXISTS {table}").collect()
+        except Exception as e:
+            # A temporary table still goes away with the session
+            logging.warning(f"Could not drop staging table {table}: {e}")
@@ -0,0 +1,8 @@
+import sys
+from pathlib import Path
+
+#The stages import the shared modules from scripts/ directly, the way their Dockerfiles lay them out
+SCRIPTS_DIR = Path(__file__).resolve().parent.parent
+for path in [SCRIPTS_DIR, SCRIPTS_DIR / "bronze_to_silver", SCRIPTS_DIR / "gold_aggregation", SCRIPTS_DIR / "anomaly_detection"]:
+    if str(path) not in sys.path:
+        sys.path.insert(0, str(path))
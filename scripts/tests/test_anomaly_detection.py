@@ -0,0 +1,90 @@
+from types import SimpleNamespace
+import pandas as pd
+import anomaly_detection
+from anomaly_detection import EwmaDetector, PRODUCT_STATE_FILE
+from state_store import StateStore
+
+T0 = pd.Timestamp("2025-01-01 00:00:00")
+
+
+def hourly_counts(hours, count, product_key=1, start=T0):
+    return pd.DataFrame({
+        "PRODUCT_KEY": product_key, "EVENT_TYPE_CODE": 1,
+        "BUCKET_START": pd.date_range(start, periods=hours, freq="h"), "NUM_EVENTS": count,
+    })
+
+
+def test_buckets_without_events_are_scored_up_to_until():
+    detector = EwmaDetector()
+    assert detector.update_many(hourly_counts(24, 100)).empty
+    # The product stops selling: the next fetch has no rows at all
+    until = T0 + pd.Timedelta(hours=26)
+    anomalies = detector.update_many(hourly_counts(0, 100), until)
+    assert anomalies["BUCKET_START"].iloc[0] == T0 + pd.Timedelta(hours=24)
+    assert set(anomalies["DIRECTION"]) == {"drop"} and set(anomalies["OBSERVED"]) == {0}
+    assert detector.last_bucket == until
+    assert detector.update_many(hourly_counts(0, 100), until).empty
+
+
+def test_nothing_is_scored_before_there_is_a_baseline():
+    detector = EwmaDetector()
+    assert detector.update_many(hourly_counts(0, 100), T0).empty
+    assert detector.last_bucket is None
+
+
+class FakeColumn:
+    def __eq__(self, other):
+        return self
+
+    def __and__(self, other):
+        return self
+
+
+class FakeSession:
+    """Answers the cutoff and bucket-count queries and records the staged anomalies."""
+
+    def __init__(self, cutoff, counts):
+        self.cutoff, self.counts = cutoff, counts
+        self.staged = []
+        self.params = None
+
+    def sql(self, query, params=None):
+        if params is not None:
+            self.params = params
+        return SimpleNamespace(
+            collect=lambda: [(self.cutoff,)],
+            to_pandas=lambda: self.counts.copy(),
+        )
+
+    def write_pandas(self, frame, table, **kwargs):
+        assert kwargs["use_logical_type"]
+        self.staged.append(frame.copy())
+
+    def table(self, name):
+        return FakeTable(self)
+
+
+class FakeTable:
+    def __init__(self, session):
+        self.session = session
+
+    def __getitem__(self, name):
+        return FakeColumn()
+
+    def merge(self, source, condition, clauses):
+        return SimpleNamespace(rows_inserted=len(self.session.staged[-1]), rows_updated=0)
+
+
+def test_a_run_without_new_events_flags_the_drop(tmp_path):
+    store = StateStore(None, "local", directory=tmp_path)
+    session = FakeSession(T0 + pd.Timedelta(hours=23), hourly_counts(24, 100))
+    anomaly_detection.detect_product_anomalies(session, store, alpha=0.1, threshold=5.0)
+    assert not session.staged
+
+    # Two hours later nothing new has arrived
+    session.cutoff, session.counts = T0 + pd.Timedelta(hours=25), hourly_counts(0, 100)
+    anomaly_detection.detect_product_anomalies(session, store, alpha=0.1, threshold=5.0)
+    assert session.staged[-1]["DIRECTION"].tolist() == ["drop", "drop"]
+    assert session.params == [str(T0 + pd.Timedelta(hours=25)), str(T0 + pd.Timedelta(hours=23))]
+    saved = EwmaDetector.from_bytes((tmp_path / PRODUCT_STATE_FILE).read_bytes())
+    assert saved.last_bucket == T0 + pd.Timedelta(hours=25)
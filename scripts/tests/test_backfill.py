@@ -0,0 +1,74 @@
+from datetime import timedelta
+import pytest
+import backfill
+import gold_aggregation as gold
+from test_gold_merge import T0, gold_rows, load, merge, warehouse  # noqa: F401
+
+pytest.importorskip("duckdb")
+
+DAY = timedelta(days=1)
+
+
+@pytest.fixture
+def silver(warehouse):
+    """Two incremental batches over four days; users 1 and 2 are active on several of them."""
+    load(warehouse, [("e1", 1, 1, 10), ("e2", 1, 2, 10), ("e3", 2, 1, 11), ("e4", 3, 3, 12)],
+         T0 + timedelta(hours=1), [T0, T0 + DAY, T0 + DAY, T0 + 2 * DAY])
+    merge(warehouse)
+    # The second batch brings users 1 and 2 back on later days and adds user 4
+    load(warehouse, [("e5", 1, 3, 11), ("e6", 2, 2, 12), ("e7", 4, 1, 10)],
+         T0 + timedelta(hours=2), [T0 + 2 * DAY, T0 + 3 * DAY, T0 + 3 * DAY])
+    merge(warehouse)
+    backfill.ensure_state_table(warehouse)
+    return warehouse
+
+
+def sequential(warehouse):
+    return {name: gold_rows(warehouse, name) for name in gold.METRIC_SPECS}
+
+
+def clear_gold(warehouse):
+    for spec in gold.METRIC_SPECS.values():
+        warehouse.sql(f"DELETE FROM {spec.table}").collect()
+
+
+@pytest.mark.parametrize("reverse, max_workers", [(False, 1), (True, 1), (False, 4)])
+def test_a_backfill_matches_the_sequential_run(silver, reverse, max_workers):
+    expected = sequential(silver)
+    clear_gold(silver)
+    windows = backfill.split_windows(T0, T0 + 4 * DAY, DAY)
+    if reverse:
+        windows.reverse()
+    failures = backfill.run_phase(silver, backfill.GOLD_STEPS, windows, set(), max_workers,
+                                  dict.fromkeys(backfill.GOLD_STEPS, T0))
+    assert failures == 0
+    for name, rows in sequential(silver).items():
+        assert rows.equals(expected[name]), name
+
+
+def test_each_key_is_recomputed_by_one_window(silver):
+    clear_gold(silver)
+    windows = backfill.split_windows(T0, T0 + 4 * DAY, DAY)
+    backfill.run_phase(silver, backfill.GOLD_STEPS, windows, set(), 1, dict.fromkeys(backfill.GOLD_STEPS, T0))
+    recomputed = dict(silver.con.execute(
+        f"SELECT step, SUM(rows_inserted + rows_updated) FROM {backfill.STATE_TABLE} GROUP BY step"
+    ).fetchall())
+    assert recomputed == {"gold_users": 4, "gold_sessions": 4, "gold_products": 3}
+    # User 1 is active on days 0, 1 and 2 and belongs to day 0 only
+    users = silver.con.execute(
+        f"SELECT rows_inserted + rows_updated FROM {backfill.STATE_TABLE} WHERE step = 'gold_users' ORDER BY window_start"
+    ).fetchall()
+    assert [n for (n,) in users] == [1, 1, 1, 1]
+
+
+def test_keys_first_seen_before_the_range_belong_to_their_first_window_in_it(silver):
+    expected = sequential(silver)
+    clear_gold(silver)
+    # User 1's day 0 event is outside the range; it is recomputed once, from all of its rows, by day 1
+    backfill.run_phase(silver, backfill.GOLD_STEPS, backfill.split_windows(T0 + DAY, T0 + 4 * DAY, DAY), set(), 1,
+                       dict.fromkeys(backfill.GOLD_STEPS, T0 + DAY))
+    users = silver.con.execute(
+        f"SELECT rows_inserted + rows_updated FROM {backfill.STATE_TABLE} WHERE step = 'gold_users' ORDER BY window_start"
+    ).fetchall()
+    assert [n for (n,) in users] == [2, 1, 1]
+    assert sequential(silver)["users"].equals(expected["users"])
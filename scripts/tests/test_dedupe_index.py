@@ -0,0 +1,186 @@
+from io import BytesIO
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import pytest
+import bronze_to_silver as silver
+from dedupe_index import DedupeIndex, ScalableBloomFilter, key_hashes
+
+TABLE = "SILVER.EVENTS_CLEANED"
+
+
+class FakeFrame:
+    """The Snowpark DataFrame calls DedupeIndex makes, over a pandas frame (column names case-insensitive)."""
+
+    def __init__(self, frame):
+        self.frame = frame.rename(columns=str.lower)
+
+    def select(self, columns):
+        return FakeFrame(self.frame[[c.lower() for c in columns]])
+
+    def to_pandas_batches(self):
+        # Two batches, like a delta streamed from the warehouse
+        middle = len(self.frame) // 2
+        yield from (self.frame.iloc[:middle], self.frame.iloc[middle:])
+
+    def join(self, other, keys, how):
+        keys = [k.lower() for k in keys]
+        matched = self.frame[keys].apply(tuple, axis=1).isin(set(other.frame[keys].apply(tuple, axis=1)))
+        return FakeFrame(self.frame[matched if how == "leftsemi" else ~matched])
+
+    def cache_result(self):
+        return self
+
+    def count(self):
+        return len(self.frame)
+
+
+class FakeFiles:
+    def __init__(self):
+        self.blobs = {}
+
+    def put_stream(self, stream, location, **kwargs):
+        self.blobs[location] = stream.read()
+
+    def get_stream(self, location):
+        return BytesIO(self.blobs[location])
+
+
+class FakeSession:
+    def __init__(self, keys):
+        self.tables = {TABLE: FakeFrame(pd.DataFrame({"event_id": keys}))}
+        self.file = FakeFiles()
+        self.uploaded = []
+        self.statements = []
+
+    def table(self, name):
+        return self.tables[name]
+
+    def write_pandas(self, frame, table, schema, **kwargs):
+        assert kwargs["table_type"] == "temporary"
+        self.uploaded.append(frame.copy())
+        self.tables[f"{schema}.{table}"] = FakeFrame(frame)
+
+    def sql(self, query):
+        self.statements.append(query)
+        return self
+
+    def collect(self):
+        query = self.statements[-1]
+        if query.startswith("LIST"):
+            location = query.split()[1]
+            return [(location,)] if location in self.file.blobs else []
+        return []
+
+
+def hashes(keys):
+    return key_hashes(pd.DataFrame({"event_id": keys}))
+
+
+def test_no_false_negatives_as_the_filter_grows():
+    bloom = ScalableBloomFilter(capacity=1_000, error_rate=0.01)
+    added = []
+    for batch in range(12):
+        keys = np.arange(batch * 1_000, (batch + 1) * 1_000, dtype=np.int64)
+        # A key the filter already (falsely) claims is not added again, and still tests positive
+        bloom.add(*hashes(keys))
+        added.append(keys)
+        seen = np.concatenate(added)
+        assert bloom.contains(*hashes(seen)).all()
+    assert len(bloom.slices) > 1 and 11_900 < bloom.count <= 12_000
+    # The compound false-positive rate stays under error_rate however many slices there are
+    unseen = np.arange(1_000_000, 1_050_000, dtype=np.int64)
+    assert bloom.contains(*hashes(unseen)).mean() < 0.01
+
+
+def test_flagged_keys_are_confirmed_against_silver(tmp_path):
+    session = FakeSession([1, 2, 3])
+    index = DedupeIndex(session, "events_cleaned", ["event_id"], TABLE, store="local", directory=tmp_path)
+    bloom = index.load()
+    # 99 is not in Silver but the filter claims it: a false positive
+    bloom.add(*hashes([99]))
+
+    remaining, dropped = index.drop_seen(FakeFrame(pd.DataFrame({"event_id": [2, 99, 100, 3]})))
+    assert dropped == 2
+    assert sorted(remaining.frame["event_id"]) == [99, 100]
+    # Only the flagged keys went to the warehouse, and the candidate table was dropped afterwards
+    assert sorted(session.uploaded[0]["EVENT_ID"]) == [2, 3, 99]
+    assert any(s.startswith("DROP TABLE IF EXISTS SILVER_STAGING.DEDUPE_CANDIDATES") for s in session.statements)
+
+
+def test_unseen_keys_skip_the_warehouse(tmp_path):
+    session = FakeSession([1, 2, 3])
+    index = DedupeIndex(session, "events_cleaned", ["event_id"], TABLE, store="local", directory=tmp_path,
+                        error_rate=1e-6)
+    delta = FakeFrame(pd.DataFrame({"event_id": [10, 11]}))
+    remaining, dropped = index.drop_seen(delta)
+    assert remaining is delta and dropped == 0
+    assert not session.uploaded
+
+
+def test_an_index_over_the_memory_cap_falls_back_to_an_anti_join(tmp_path):
+    session = FakeSession(list(range(5_000)))
+    index = DedupeIndex(session, "events_cleaned", ["event_id"], TABLE, store="local", directory=tmp_path,
+                        capacity=100, max_bytes=1_024)
+    remaining, dropped = index.drop_seen(FakeFrame(pd.DataFrame({"event_id": [4_999, 5_000]})))
+    assert index.fallback and index.bloom is None
+    assert dropped == 1 and remaining.frame["event_id"].tolist() == [5_000]
+    assert not session.uploaded
+    index.commit()
+    assert not (tmp_path / "events_cleaned.npz").exists()
+
+
+@pytest.mark.parametrize("store", ["stage", "local"])
+def test_committed_keys_survive_a_save_and_load(tmp_path, store):
+    session = FakeSession([1, 2])
+    index = DedupeIndex(session, "events_cleaned", ["event_id"], TABLE, store=store, directory=tmp_path)
+    index.drop_seen(FakeFrame(pd.DataFrame({"event_id": [3, 4]})))
+    index.commit()
+
+    # A later run, after Silver was cleared: the keys must come from the saved index, not a rebuild
+    session.tables[TABLE] = FakeFrame(pd.DataFrame({"event_id": pd.Series([], dtype="int64")}))
+    reloaded = DedupeIndex(session, "events_cleaned", ["event_id"], TABLE, store=store, directory=tmp_path)
+    assert reloaded.load().count == 4
+    assert reloaded.bloom.contains(*hashes([1, 2, 3, 4])).all()
+
+
+class WatermarkSession:
+    """Silver's MAX(ingested_at) and the INGESTED_WATERMARKS table, for get_delta_watermark()."""
+
+    def __init__(self, silver_max):
+        self.silver_max = silver_max
+        self.recorded = {}
+
+    def table(self, name):
+        return Result([(self.silver_max,)])
+
+    def sql(self, query, params=None):
+        if query.strip().startswith("MERGE"):
+            table, latest = params
+            self.recorded[table] = max(self.recorded.get(table, latest), latest)
+            return Result([])
+        return Result([(None if params[0] not in self.recorded else datetime.fromisoformat(self.recorded[params[0]]),)])
+
+
+class Result:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def select(self, *columns):
+        return self
+
+    def collect(self):
+        return self.rows
+
+
+def test_a_fully_dropped_delta_moves_the_silver_watermark():
+    session = WatermarkSession(datetime(2025, 1, 1, 10))
+    assert silver.get_delta_watermark(session, silver.EVENTS_SILVER_TABLE) == datetime(2025, 1, 1, 10)
+    # Every row of the Bronze delta ingested up to 11:00 was a duplicate, so nothing reached Silver
+    silver.advance_watermark(session, silver.EVENTS_SILVER_TABLE, Result([(datetime(2025, 1, 1, 11),)]))
+    assert silver.get_delta_watermark(session, silver.EVENTS_SILVER_TABLE) == datetime(2025, 1, 1, 11)
+    # Backfills still replay up to Silver's own rows
+    assert silver.get_last_ingested_at(session, silver.EVENTS_SILVER_TABLE) == datetime(2025, 1, 1, 10)
+    # Once newer rows land in Silver, its own maximum leads again
+    session.silver_max = datetime(2025, 1, 1, 12)
+    assert silver.get_delta_watermark(session, silver.EVENTS_SILVER_TABLE) == datetime(2025, 1, 1, 12)
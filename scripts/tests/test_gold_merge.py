@@ -0,0 +1,136 @@
+from datetime import datetime, timedelta
+import pandas as pd
+import pytest
+import event_time
+import gold_aggregation as gold
+from local_warehouse import LocalWarehouse
+
+pytest.importorskip("duckdb")
+
+T0 = datetime(2024, 1, 1)
+MEASURES = {
+    "users": ["total_events", "num_purchases", "num_clicks", "conversion_rate"],
+    "sessions": ["user_key", "session_duration_minutes", "num_events", "is_bounce"],
+    "products": ["num_views", "num_add_to_cart", "num_purchases", "click_to_purchase_rate"],
+}
+
+
+@pytest.fixture
+def warehouse():
+    warehouse = LocalWarehouse()
+    warehouse.con.execute("""
+        CREATE TABLE SILVER.EVENTS_CLEANED (
+            event_id VARCHAR, user_key INT, event_type_code SMALLINT, product_key INT,
+            timestamp TIMESTAMP, ingested_at TIMESTAMP
+        )
+    """)
+    warehouse.con.execute("""
+        CREATE TABLE SILVER.SESSION_EVENTS (
+            session_id VARCHAR, user_key INT, start_time TIMESTAMP, end_time TIMESTAMP, event_type_code SMALLINT,
+            event_timestamp TIMESTAMP, ingested_at TIMESTAMP
+        )
+    """)
+    gold.ensure_gold_tables(warehouse)
+    yield warehouse
+    warehouse.close()
+
+
+def load(warehouse, batch, ingested_at, event_times):
+    """Append Silver rows for (event id, user, event type, product) and one session row per user."""
+    events = pd.DataFrame(batch, columns=["event_id", "user_key", "event_type_code", "product_key"])
+    events["timestamp"] = event_times
+    events["ingested_at"] = ingested_at
+    warehouse.con.register("events", events)
+    warehouse.con.execute("INSERT INTO SILVER.EVENTS_CLEANED SELECT * FROM events")
+    sessions = pd.DataFrame({
+        "session_id": "s" + events["user_key"].astype(str),
+        "user_key": events["user_key"],
+        "start_time": T0,
+        "end_time": T0 + timedelta(minutes=1) + pd.to_timedelta(events["user_key"], unit="m"),
+        "event_type_code": events["event_type_code"],
+        "event_timestamp": events["timestamp"],
+        "ingested_at": ingested_at,
+    })
+    warehouse.con.register("sessions", sessions)
+    warehouse.con.execute("INSERT INTO SILVER.SESSION_EVENTS SELECT * FROM sessions")
+
+
+def gold_rows(warehouse, name):
+    spec = gold.METRIC_SPECS[name]
+    key = spec.keys[0].name
+    return warehouse.con.execute(f"SELECT {key}, {', '.join(MEASURES[name])} FROM {spec.table} ORDER BY {key}").df()
+
+
+def rebuild(warehouse, name):
+    """What a full rebuild of the Gold table from all of Silver gives."""
+    spec = gold.METRIC_SPECS[name]
+    warehouse.sql(f"DELETE FROM {spec.table}").collect()
+    warehouse.sql(gold.build_merge_sql(spec, additive=False)).collect()
+    return gold_rows(warehouse, name)
+
+
+def merge(warehouse, late_before=None):
+    for spec in gold.METRIC_SPECS.values():
+        warehouse.sql(gold.build_merge_sql(spec, late_before=late_before)).collect()
+
+
+def assert_matches_rebuild(warehouse):
+    for name in gold.METRIC_SPECS:
+        merged = gold_rows(warehouse, name)
+        expected = rebuild(warehouse, name)
+        pd.testing.assert_frame_equal(merged, expected, check_dtype=False)
+
+
+def test_on_time_deltas_are_added_to_existing_rows(warehouse):
+    load(warehouse, [("e1", 1, 1, 10), ("e2", 1, 2, 10), ("e3", 2, 1, 20)], T0 + timedelta(hours=1), T0)
+    merge(warehouse)
+    load(warehouse, [("e4", 1, 4, 10), ("e5", 3, 2, 20)], T0 + timedelta(hours=2), T0 + timedelta(hours=1))
+    merge(warehouse, late_before=T0)
+    users = gold_rows(warehouse, "users").set_index("user_key")
+    assert users.loc[1, "total_events"] == 3
+    assert users.loc[3, "total_events"] == 1
+    assert_matches_rebuild(warehouse)
+
+
+def test_late_keys_are_recomputed_from_full_history(warehouse):
+    load(warehouse, [("e1", 1, 1, 10), ("e2", 2, 2, 20)], T0 + timedelta(hours=1), T0 + timedelta(hours=5))
+    merge(warehouse)
+    # User 1 gets a row from long before the watermark, user 2 an on-time one
+    load(warehouse, [("e3", 1, 4, 10), ("e4", 2, 1, 20)], T0 + timedelta(hours=6), [T0, T0 + timedelta(hours=5)])
+    merge(warehouse, late_before=T0 + timedelta(hours=4))
+    assert_matches_rebuild(warehouse)
+
+
+def test_without_late_rows_no_history_is_read():
+    sql = gold.build_merge_sql(gold.USER_METRICS_SPEC)
+    assert "WHERE (user_key) IN" not in sql
+    assert "LEFT JOIN GOLD.USER_METRICS AS existing" in sql
+    recompute = gold.build_merge_sql(gold.USER_METRICS_SPEC, additive=False)
+    assert "WHERE (user_key) IN (SELECT user_key FROM delta)" in recompute
+    assert "existing" not in recompute
+
+
+def test_rerunning_without_new_rows_changes_nothing(warehouse):
+    load(warehouse, [("e1", 1, 1, 10), ("e2", 2, 4, 10)], T0 + timedelta(hours=1), T0)
+    merge(warehouse)
+    before = {name: gold_rows(warehouse, name) for name in gold.METRIC_SPECS}
+    merge(warehouse, late_before=T0)
+    for name, frame in before.items():
+        pd.testing.assert_frame_equal(gold_rows(warehouse, name), frame)
+
+
+def test_run_metric_specs_routes_late_keys_and_moves_the_watermarks(warehouse):
+    specs = list(gold.METRIC_SPECS.values())
+    load(warehouse, [("e1", 1, 1, 10), ("e2", 2, 4, 20)], T0 + timedelta(hours=1), T0 + timedelta(hours=5))
+    gold.run_metric_specs(warehouse, specs, timedelta(minutes=30))
+    load(warehouse, [("e3", 1, 4, 10), ("e4", 3, 1, 20)], T0 + timedelta(hours=6), [T0, T0 + timedelta(hours=6)])
+    gold.run_metric_specs(warehouse, specs, timedelta(minutes=30))
+    assert_matches_rebuild(warehouse)
+
+    watermarks = dict(warehouse.sql(f"SELECT consumer, event_time_watermark FROM {event_time.WATERMARKS_TABLE}").collect())
+    assert watermarks[gold.USER_METRICS_TABLE] == T0 + timedelta(hours=6)
+    stats = warehouse.sql(
+        f"SELECT delta_rows, late_rows, late_keys FROM {event_time.LATENESS_TABLE} "
+        f"WHERE consumer = '{gold.USER_METRICS_TABLE}' ORDER BY ingested_watermark"
+    ).collect()
+    assert stats == [(2, 0, 0), (2, 1, 1)]
@@ -0,0 +1,201 @@
+import os
+import json
+import time
+from pathlib import Path
+import pandas as pd
+import pytest
+import micro_batch
+from micro_batch import MicroBatchDriver
+from local_backend import LocalBackend
+from dedupe_index import DedupeIndex, key_hashes
+
+
+def write_batch(inbox: Path, name: str, events, age: float) -> None:
+    """One events CSV and one sessions JSON, all of user_1's events in a single session, landed age seconds ago."""
+    inbox.mkdir(parents=True, exist_ok=True)
+    rows = pd.DataFrame(events, columns=["event_id", "event_type", "product_id", "timestamp"]).assign(user_id="user_1")
+    rows[["event_id", "user_id", "event_type", "product_id", "timestamp"]].to_csv(inbox / f"{name}.csv", index=False)
+    session = {
+        "session_id": f"s_{name}", "user_id": "user_1",
+        "start_time": rows["timestamp"].min(), "end_time": rows["timestamp"].max(),
+        "device": {"browser": "Chrome", "os": "Linux"}, "location": {"country": "US", "city": "Austin"},
+        "events": [
+            {"type": e["event_type"], "product_id": e["product_id"], "timestamp": e["timestamp"]}
+            for e in rows.to_dict("records")
+        ],
+    }
+    (inbox / f"{name}.json").write_text(json.dumps([session]))
+    landed = time.time() - age
+    for suffix in (".csv", ".json"):
+        os.utime(inbox / f"{name}{suffix}", (landed, landed))
+
+
+@pytest.fixture
+def driver(tmp_path):
+    return MicroBatchDriver(
+        LocalBackend(), tmp_path / "incoming", tmp_path / "processed", interval=10, min_interval=1, max_interval=40,
+        max_files=2, metrics_path=tmp_path / "metrics.jsonl",
+    )
+
+
+def user_metrics(driver):
+    return driver.backend.tables["user_metrics"].set_index("user_key").iloc[0]
+
+
+def test_cycles_load_gold_and_adapt_the_interval(driver):
+    write_batch(driver.inbox, "a", [
+        ("e1", "view_product", "PROD_001", "2025-01-01T10:00:00"),
+        ("e2", "purchase", "PROD_001", "2025-01-01T10:05:00"),
+    ], age=30)
+    write_batch(driver.inbox, "b", [
+        ("e3", "add_to_cart", "PROD_002", "2025-01-01T11:00:00"),
+        # Redelivered: replaces the row of the first batch rather than counting twice
+        ("e2", "purchase", "PROD_001", "2025-01-01T10:05:00"),
+    ], age=20)
+
+    first = driver.run_cycle()
+    assert (first.cycle, first.files, first.backlog, first.error) == (1, 2, 2, None)
+    assert first.bytes > 0 and first.freshness_lag_seconds >= 30
+    assert driver.next_interval(first) == 1
+    assert sorted(path.name for path in driver.processed_dir.iterdir()) == ["a.csv", "a.json"]
+    assert user_metrics(driver)[["total_events", "num_purchases"]].tolist() == [2, 1]
+    silver_watermark = driver.backend.tables["silver_events"]["ingested_at"].max()
+
+    second = driver.run_cycle()
+    assert (second.files, second.backlog) == (2, 0)
+    assert driver.next_interval(second) == 10
+    assert driver.backend.tables["silver_events"]["ingested_at"].max() > silver_watermark
+    assert user_metrics(driver)[["total_events", "num_purchases", "num_clicks"]].tolist() == [3, 1, 2]
+    assert driver.backend.tables["session_metrics"]["session_id"].tolist() == ["s_a", "s_b"]
+
+    idle = driver.run_cycle()
+    assert (idle.files, idle.latency_seconds, idle.freshness_lag_seconds) == (0, 0.0, None)
+    # An empty inbox doubles the interval, up to max_interval
+    driver.interval = 10
+    assert driver.next_interval(idle) == 20
+    driver.interval = 40
+    assert driver.next_interval(idle) == 40
+
+
+def test_gold_watermark_follows_silver(driver):
+    write_batch(driver.inbox, "a", [("e1", "view_product", "PROD_001", "2025-01-01T10:00:00")], age=30)
+    driver.run_cycle()
+    write_batch(driver.inbox, "b", [("e2", "view_product", "PROD_002", "2025-01-01T10:30:00")], age=5)
+    driver.run_cycle()
+    tables = driver.backend.tables
+    latest = tables["silver_events"]["ingested_at"].max()
+    for gold in ["user_metrics", "product_metrics"]:
+        assert tables[gold]["ingested_at"].max() == latest
+    # Only the product the second batch touched moved past the first batch's watermark
+    products = tables["product_metrics"].set_index("product_key")["ingested_at"]
+    assert (products == latest).sum() == 1
+
+
+def test_failed_cycle_leaves_files_and_backs_off(driver, monkeypatch):
+    write_batch(driver.inbox, "a", [("e1", "view_product", "PROD_001", "2025-01-01T10:00:00")], age=30)
+
+    def fail():
+        raise RuntimeError("warehouse suspended")
+    monkeypatch.setattr(driver.backend, "silver_to_gold", fail)
+    report = driver.run_cycle()
+    assert report.error == "warehouse suspended" and report.freshness_lag_seconds is None
+    assert driver.next_interval(report) == 20
+    assert sorted(path.name for path in driver.inbox.iterdir()) == ["a.csv", "a.json"]
+
+    monkeypatch.undo()
+    assert driver.run_cycle().error is None
+    assert not list(driver.inbox.iterdir())
+    assert user_metrics(driver)["total_events"] == 1
+
+
+def test_run_emits_one_report_per_cycle(driver):
+    write_batch(driver.inbox, "a", [("e1", "view_product", "PROD_001", "2025-01-01T10:00:00")], age=30)
+    driver.base_interval = driver.interval = driver.min_interval = 0
+    driver.run(max_cycles=2)
+    reports = [json.loads(line) for line in driver.metrics_path.read_text().splitlines()]
+    assert [(r["cycle"], r["files"]) for r in reports] == [(1, 2), (2, 0)]
+    assert reports[0]["next_interval_seconds"] == 0 and reports[0]["gold_seconds"] > 0
+
+
+class FakeSession:
+    def __init__(self):
+        self.connection = object()
+        self.closed = False
+
+    def table(self, name):
+        raise RuntimeError(f"{name} does not exist")
+
+    def close(self):
+        self.closed = True
+
+
+class FakeBuilder:
+    def configs(self, params):
+        return self
+
+    def create(self):
+        return FakeSession()
+
+
+class FakeDelta:
+    """The two calls drop_seen() makes on a Snowpark DataFrame of new keys."""
+
+    def __init__(self, frame):
+        self.frame = frame
+
+    def select(self, columns):
+        return FakeDelta(self.frame[columns])
+
+    def to_pandas_batches(self):
+        yield self.frame
+
+
+def test_snowflake_backend_keeps_the_dedupe_index_across_cycles(tmp_path, monkeypatch):
+    from snowflake.snowpark import Session
+    import ingestion_to_snowflake
+    import bronze_to_silver
+    import gold_aggregation
+
+    env = tmp_path / ".env"
+    env.write_text("")
+    for name in ["ACCOUNT", "USER", "PASSWORD", "WAREHOUSE", "DATABASE", "SCHEMA", "ROLE"]:
+        monkeypatch.setenv(f"SNOWFLAKE_{name}", "x")
+    monkeypatch.setenv("DEDUPE_INDEX", "local")
+    monkeypatch.setenv("DEDUPE_INDEX_DIR", str(tmp_path / "dedupe"))
+    monkeypatch.setattr(Session, "builder", FakeBuilder())
+    for module, name in [
+        (ingestion_to_snowflake, "setup_schema"), (ingestion_to_snowflake, "load_csv_events"),
+        (ingestion_to_snowflake, "load_json_sessions"), (bronze_to_silver, "ensure_tables"),
+        (bronze_to_silver, "register_dimensions"), (gold_aggregation, "ensure_gold_tables"),
+        (gold_aggregation, "run_metric_specs"),
+    ]:
+        monkeypatch.setattr(module, name, lambda *args, **kwargs: None)
+
+    batches = [pd.DataFrame({"event_id": ["e1", "e2"]}), pd.DataFrame({"event_id": ["e3"]})]
+    seen_by_cycle = []
+
+    def clean_events(session, dedupe):
+        seen_by_cycle.append(dedupe)
+        delta, dropped = dedupe.drop_seen(FakeDelta(batches[len(seen_by_cycle) - 1]))
+        assert dropped == 0
+        dedupe.commit()
+    monkeypatch.setattr(bronze_to_silver, "clean_events", clean_events)
+    monkeypatch.setattr(bronze_to_silver, "flatten_session", lambda session, dedupe: None)
+
+    backend = micro_batch.SnowflakeBackend(str(env))
+    index_path = tmp_path / "dedupe" / "events_cleaned.npz"
+    for _ in batches:
+        backend.bronze_to_silver()
+        backend.silver_to_gold()
+        # Indexed in memory; nothing is written between cycles
+        assert not index_path.exists()
+    assert seen_by_cycle[0] is seen_by_cycle[1]
+    index = seen_by_cycle[0]
+    assert index.bloom.count == 3
+    assert index.bloom.contains(*key_hashes(batches[0])).all()
+
+    backend.close()
+    assert backend.session.closed
+    saved = DedupeIndex(None, "events_cleaned", ["event_id"], bronze_to_silver.EVENTS_SILVER_TABLE,
+                        store="local", directory=tmp_path / "dedupe")
+    assert saved.load().count == 3
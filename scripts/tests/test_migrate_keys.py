@@ -0,0 +1,53 @@
+import migrate_keys
+
+
+class FakeSession:
+    """Answers information_schema.columns from a {table: columns} map and records every other statement."""
+
+    def __init__(self, tables):
+        self.tables = {name.upper(): set(columns) for name, columns in tables.items()}
+        self.statements = []
+        self.params = None
+
+    def sql(self, query, params=None):
+        self.statements.append(query)
+        self.params = params
+        return self
+
+    def collect(self):
+        query = self.statements[-1]
+        if "information_schema.columns" in query:
+            name = ".".join(self.params)
+            return [(column,) for column in self.tables.get(name, ())]
+        if query.startswith("ALTER TABLE"):
+            _, _, old, _, _, new = query.split()
+            self.tables[new.upper()] = self.tables.pop(old.upper())
+        return []
+
+
+def test_only_tables_with_string_columns_are_set_aside():
+    session = FakeSession({
+        "SILVER.EVENTS_CLEANED": {"EVENT_ID", "USER_ID", "EVENT_TYPE", "PRODUCT_ID", "TIMESTAMP", "INGESTED_AT"},
+        "GOLD.USER_METRICS": {"USER_KEY", "TOTAL_EVENTS", "INGESTED_AT"},
+        "GOLD.ANOMALIES": {"PRODUCT_ID", "EVENT_TYPE", "BUCKET_START"},
+    })
+    pending = migrate_keys.set_aside_legacy_tables(session)
+    assert pending == ["SILVER.EVENTS_CLEANED", "GOLD.ANOMALIES"]
+    assert "SILVER.EVENTS_CLEANED_LEGACY" in session.tables and "SILVER.EVENTS_CLEANED" not in session.tables
+    assert "GOLD.USER_METRICS" in session.tables
+
+
+def test_dry_run_renames_nothing():
+    session = FakeSession({"GOLD.USER_ANOMALY_SCORES": {"USER_ID", "BOT_SCORE"}})
+    assert migrate_keys.set_aside_legacy_tables(session, dry_run=True) == ["GOLD.USER_ANOMALY_SCORES"]
+    assert not [s for s in session.statements if s.startswith("ALTER TABLE")]
+
+
+def test_a_failed_run_is_picked_up_from_its_legacy_copy():
+    # The keyed table was created and partly filled before the last run failed
+    session = FakeSession({
+        "SILVER.SESSION_EVENTS_LEGACY": {"SESSION_ID", "USER_ID", "EVENT_TYPE"},
+        "SILVER.SESSION_EVENTS": {"SESSION_ID", "USER_KEY", "EVENT_TYPE_CODE"},
+    })
+    assert migrate_keys.set_aside_legacy_tables(session) == ["SILVER.SESSION_EVENTS"]
+    assert not [s for s in session.statements if s.startswith("ALTER TABLE")]
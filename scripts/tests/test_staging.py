@@ -0,0 +1,86 @@
+import pytest
+from staging import DEFAULT_INLINE_MAX_ROWS, choose_strategy, staged
+
+TABLE = "SILVER_STAGING.EVENTS_STAGE"
+
+
+class FakeSession:
+    """Records the tables written and the statements run; every sql() call fails once failing_sql is set."""
+
+    def __init__(self, failing_sql=False):
+        self.written = []
+        self.statements = []
+        self.failing_sql = failing_sql
+        self.write = self
+
+    def save_as_table(self, table, mode, table_type):
+        self.written.append((table, mode, table_type))
+
+    def table(self, name):
+        return ("table", name)
+
+    def sql(self, query):
+        self.statements.append(query)
+        if self.failing_sql:
+            raise RuntimeError("session expired")
+        return self
+
+    def collect(self):
+        return []
+
+
+@pytest.fixture(autouse=True)
+def staging_env(monkeypatch):
+    monkeypatch.delenv("STAGING_INLINE_MAX_ROWS", raising=False)
+    monkeypatch.delenv("STAGING_TABLE_TYPE", raising=False)
+
+
+def test_small_deltas_merge_inline_and_large_ones_are_staged(monkeypatch):
+    assert choose_strategy(0) == "inline"
+    assert choose_strategy(DEFAULT_INLINE_MAX_ROWS) == "inline"
+    assert choose_strategy(DEFAULT_INLINE_MAX_ROWS + 1) == "temporary"
+    monkeypatch.setenv("STAGING_INLINE_MAX_ROWS", "10")
+    monkeypatch.setenv("STAGING_TABLE_TYPE", "Transient")
+    assert choose_strategy(10) == "inline"
+    assert choose_strategy(11) == "transient"
+
+
+def test_an_unknown_table_type_is_rejected(monkeypatch):
+    monkeypatch.setenv("STAGING_TABLE_TYPE", "permanent")
+    assert choose_strategy(1) == "inline"
+    with pytest.raises(ValueError, match="STAGING_TABLE_TYPE"):
+        choose_strategy(DEFAULT_INLINE_MAX_ROWS + 1)
+
+
+def test_inline_yields_the_delta_and_writes_nothing():
+    session = FakeSession()
+    with staged(session, session, TABLE, 10) as source:
+        assert source is session
+    assert not session.written and not session.statements
+
+
+@pytest.mark.parametrize("table_type", ["temporary", "transient"])
+def test_the_staging_table_is_dropped_on_exit(monkeypatch, table_type):
+    monkeypatch.setenv("STAGING_TABLE_TYPE", table_type)
+    session = FakeSession()
+    with staged(session, session, TABLE, DEFAULT_INLINE_MAX_ROWS + 1) as source:
+        assert source == ("table", TABLE)
+        assert not session.statements
+    assert session.written == [(TABLE, "overwrite", table_type)]
+    assert session.statements == [f"DROP TABLE IF EXISTS {TABLE}"]
+
+
+def test_the_staging_table_is_dropped_when_the_merge_fails():
+    session = FakeSession()
+    with pytest.raises(RuntimeError, match="merge failed"):
+        with staged(session, session, TABLE, DEFAULT_INLINE_MAX_ROWS + 1):
+            raise RuntimeError("merge failed")
+    assert session.statements == [f"DROP TABLE IF EXISTS {TABLE}"]
+
+
+def test_a_failed_drop_does_not_hide_the_merge_result():
+    session = FakeSession(failing_sql=True)
+    with staged(session, session, TABLE, DEFAULT_INLINE_MAX_ROWS + 1) as source:
+        merged = source
+    assert merged == ("table", TABLE)
+    assert session.statements == [f"DROP TABLE IF EXISTS {TABLE}"]
@@ -0,0 +1,81 @@
+import pytest
+from warehouse_sizing import SizingPolicy, WarehouseController
+
+
+class FakeSession:
+    """Answers SHOW WAREHOUSES with one size and records every USE WAREHOUSE."""
+
+    def __init__(self, size: str):
+        self.size = size
+        self.used = []
+        self.statements = []
+
+    def sql(self, query):
+        self.statements.append(query)
+        return self
+
+    def collect(self):
+        return [{"size": self.size}]
+
+    def use_warehouse(self, name):
+        self.used.append(name)
+
+
+def run_step(controller, rows):
+    with controller.sized("events", lambda: rows) as size:
+        during = list(controller.session.used)
+    return size, during
+
+
+@pytest.mark.parametrize("rows, expected", [
+    (0, "XSMALL"), (20_000_000, "XSMALL"), (20_000_001, "SMALL"), (80_000_001, "MEDIUM"), (10 ** 12, "MEDIUM"),
+])
+def test_policy_doubles_per_tier_up_to_the_cap(rows, expected):
+    assert SizingPolicy(max_size="MEDIUM").choose("events", rows) == expected
+
+
+def test_small_delta_keeps_the_base_warehouse():
+    session = FakeSession("Medium")
+    controller = WarehouseController(session, "BASE_WH", SizingPolicy(max_size="XLARGE"), {"LARGE": "WH_L"})
+    assert run_step(controller, 1_000) == ("MEDIUM", [])
+    assert session.used == []
+    assert not any("ALTER" in statement.upper() for statement in session.statements)
+
+
+def test_switches_to_smallest_listed_warehouse_big_enough_and_back():
+    session = FakeSession("XSMALL")
+    controller = WarehouseController(
+        session, "BASE_WH", SizingPolicy(max_size="XLARGE"), {"SMALL": "WH_S", "LARGE": "WH_L", "XLARGE": "WH_XL"},
+    )
+    assert run_step(controller, 100_000_000) == ("LARGE", ["WH_L"])
+    assert session.used == ["WH_L", "BASE_WH"]
+
+
+def test_falls_back_to_largest_listed_warehouse_above_base():
+    session = FakeSession("XSMALL")
+    controller = WarehouseController(session, "BASE_WH", SizingPolicy(max_size="XLARGE"), {"SMALL": "WH_S"})
+    assert run_step(controller, 500_000_000) == ("SMALL", ["WH_S"])
+
+
+def test_never_moves_below_the_base_size():
+    session = FakeSession("MEDIUM")
+    controller = WarehouseController(session, "BASE_WH", SizingPolicy(max_size="LARGE"), {"SMALL": "WH_S"})
+    assert run_step(controller, 500_000_000) == ("MEDIUM", [])
+    assert session.used == []
+
+
+def test_switches_back_when_the_step_fails():
+    session = FakeSession("XSMALL")
+    controller = WarehouseController(session, "BASE_WH", SizingPolicy(max_size="LARGE"), {"LARGE": "WH_L"})
+    with pytest.raises(RuntimeError):
+        with controller.sized("events", lambda: 500_000_000):
+            raise RuntimeError("merge failed")
+    assert session.used == ["WH_L", "BASE_WH"]
+
+
+def test_disabled_skips_the_estimate():
+    def estimate():
+        raise AssertionError("estimate ran")
+    controller = WarehouseController(FakeSession("XSMALL"), "BASE_WH", enabled=False)
+    with controller.sized("events", estimate) as size:
+        assert size == ""
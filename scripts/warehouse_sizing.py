@@ -0,0 +1,139 @@
+'''Backlog-aware warehouse sizing: run a heavy step on a bigger, pre-sized warehouse.
+
+Steps of the DAG run in parallel on the same warehouse, so resizing it for one step would change (and, when the
+step shrinks it back, undo) the size the others run on. The controller therefore never ALTERs a warehouse: it only
+switches its own session with USE WAREHOUSE to one of the warehouses listed in WAREHOUSE_BY_SIZE, which every
+step can share without affecting the others.
+
+The policy only maps (step, delta rows) to a size and the controller only needs `session.sql(...).collect()`
+and `session.use_warehouse(...)`, so both can be exercised against a fake session.
+'''
+import os
+import logging
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+WAREHOUSE_SIZES = ["XSMALL", "SMALL", "MEDIUM", "LARGE", "XLARGE", "XXLARGE", "XXXLARGE"]
+
+# Delta rows an XSMALL handles comfortably in one step; every size up doubles it.
+# Sessions are flattened into ~4 event rows each, so their budget is smaller.
+DEFAULT_ROWS_PER_XSMALL: Dict[str, int] = {
+    "events": 20_000_000,
+    "sessions": 4_000_000,
+    "gold": 40_000_000,
+}
+DEFAULT_WATERMARK = "1970-01-01 00:00:00"
+
+
+def normalize_size(size: str) -> str:
+    """'X-Small' / 'XSMALL' / '2X-Large' -> the WAREHOUSE_SIZES spelling."""
+    size = size.upper().replace("-", "").replace("_", "")
+    return {"2XLARGE": "XXLARGE", "3XLARGE": "XXXLARGE"}.get(size, size)
+
+
+@dataclass(frozen=True)
+class SizingPolicy:
+    rows_per_xsmall: Dict[str, int] = field(default_factory=lambda: dict(DEFAULT_ROWS_PER_XSMALL))
+    max_size: str = "MEDIUM"
+
+    def choose(self, step: str, delta_rows: int) -> str:
+        """Smallest size whose doubled-per-tier budget covers delta_rows, capped at max_size."""
+        budget = self.rows_per_xsmall.get(step, min(self.rows_per_xsmall.values()))
+        tier, max_tier = 0, WAREHOUSE_SIZES.index(normalize_size(self.max_size))
+        while tier < max_tier and delta_rows > budget * 2 ** tier:
+            tier += 1
+        return WAREHOUSE_SIZES[tier]
+
+
+def estimate_delta(session: Any, source: str, target: str) -> int:
+    """Rows in source newer than target's ingested_at watermark (the work the next incremental run will do)."""
+    try:
+        return session.sql(f"""
+            SELECT COUNT(*) FROM {source}
+            WHERE ingested_at > (
+                SELECT COALESCE(MAX(ingested_at), '{DEFAULT_WATERMARK}'::TIMESTAMP) FROM {target}
+            )
+        """).collect()[0][0]
+    except Exception as e:
+        logging.warning(f"Could not estimate delta of {source} against {target}: {e}")
+        return 0
+
+
+class WarehouseController:
+    """Switches the session to a bigger warehouse around a step, never below the size of its own.
+
+    `warehouses` (size -> warehouse name) lists the pre-sized warehouses; the session moves to the smallest
+    one that is at least the chosen size, or the largest one if none is. When nothing listed is bigger than the
+    session's own warehouse, the step stays on it.
+    """
+
+    def __init__(self, session: Any, warehouse: str, policy: SizingPolicy = SizingPolicy(),
+                 warehouses: Optional[Dict[str, str]] = None, enabled: bool = True):
+        self.session = session
+        self.warehouse = warehouse
+        self.policy = policy
+        self.warehouses = {normalize_size(size): name for size, name in (warehouses or {}).items()}
+        self.enabled = enabled
+        self._base_size: Optional[str] = None
+
+    @classmethod
+    def from_env(cls, session: Any) -> "WarehouseController":
+        """WAREHOUSE_AUTOSIZE=1 enables it; WAREHOUSE_MAX_SIZE caps it; WAREHOUSE_BY_SIZE="LARGE=BIG_WH,..." switches."""
+        warehouses = dict(
+            item.split("=", 1) for item in os.getenv("WAREHOUSE_BY_SIZE", "").split(",") if "=" in item
+        )
+        return cls(
+            session,
+            os.getenv("SNOWFLAKE_WAREHOUSE", ""),
+            SizingPolicy(max_size=os.getenv("WAREHOUSE_MAX_SIZE", "MEDIUM")),
+            warehouses,
+            enabled=os.getenv("WAREHOUSE_AUTOSIZE", "0") == "1",
+        )
+
+    def base_size(self) -> str:
+        if self._base_size is None:
+            rows = self.session.sql(f"SHOW WAREHOUSES LIKE '{self.warehouse}'").collect()
+            self._base_size = normalize_size(rows[0]["size"]) if rows else WAREHOUSE_SIZES[0]
+        return self._base_size
+
+    def _switch_target(self, size: str, base: str) -> Optional[Tuple[str, str]]:
+        """(size, name) of the smallest listed warehouse of at least `size`, else of the largest listed one that is
+        still bigger than `base`; None when every listed warehouse is at most `base`."""
+        bigger = [s for s in self.warehouses if WAREHOUSE_SIZES.index(s) > WAREHOUSE_SIZES.index(base)]
+        if not bigger:
+            return None
+        enough = [s for s in bigger if WAREHOUSE_SIZES.index(s) >= WAREHOUSE_SIZES.index(size)]
+        chosen = min(enough, key=WAREHOUSE_SIZES.index) if enough else max(bigger, key=WAREHOUSE_SIZES.index)
+        return chosen, self.warehouses[chosen]
+
+    @contextmanager
+    def sized(self, step: str, estimate: Callable[[], int]) -> Iterator[str]:
+        """Run the block on a warehouse sized for estimate() and yield the size it actually runs on ("" when
+        disabled); the estimate only runs when sizing is enabled."""
+        if not self.enabled:
+            yield ""
+            return
+        delta_rows = estimate()
+        size, base = self.policy.choose(step, delta_rows), self.base_size()
+        if WAREHOUSE_SIZES.index(size) <= WAREHOUSE_SIZES.index(base):
+            logging.info(f"Sizing: {step} delta {delta_rows:,} rows fits {base}; keeping {self.warehouse}.")
+            yield base
+            return
+
+        target = self._switch_target(size, base)
+        if target is None:
+            logging.warning(
+                f"Sizing: {step} delta {delta_rows:,} rows wants {size}, but WAREHOUSE_BY_SIZE lists nothing bigger "
+                f"than {base}; keeping {self.warehouse}."
+            )
+            yield base
+            return
+
+        used, switch_to = target
+        logging.info(f"Sizing: {step} delta {delta_rows:,} rows wants {size}; switching to {switch_to} ({used}).")
+        self.session.use_warehouse(switch_to)
+        try:
+            yield used
+        finally:
+            self.session.use_warehouse(self.warehouse)
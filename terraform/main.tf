@@ -38,3 +38,12 @@ resource "snowflake_warehouse" "analytics_wh" {
   initially_suspended = true
   comment         = "Warehouse for product analytics"
 }
+
+resource "snowflake_warehouse" "analytics_wh_medium" {
+  name            = "ANALYTICS_WH_M"
+  warehouse_size  = "MEDIUM"
+  auto_suspend    = 60
+  auto_resume     = true
+  initially_suspended = true
+  comment         = "Pre-sized warehouse that heavy pipeline steps switch to (WAREHOUSE_BY_SIZE)"
+}